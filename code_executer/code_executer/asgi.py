@@ -17,9 +17,11 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'code_executer.settings')
 django.setup()
 
 from editor.routing import websocket_urlpatterns
+from editor.background import LifespanApp
 
 application = ProtocolTypeRouter({
     "http": get_asgi_application(),
+    "lifespan": LifespanApp(),
     "websocket": AuthMiddlewareStack(
         URLRouter(
             websocket_urlpatterns
@@ -3,9 +3,11 @@ from channels.routing import ProtocolTypeRouter, URLRouter
 from channels.security.websocket import AllowedHostsOriginValidator
 from django.core.asgi import get_asgi_application
 from editor.routing import websocket_urlpatterns
+from editor.background import LifespanApp
 
 application = ProtocolTypeRouter({
     'http': get_asgi_application(),
+    'lifespan': LifespanApp(),
     'websocket': AllowedHostsOriginValidator(
         AuthMiddlewareStack(
             URLRouter(
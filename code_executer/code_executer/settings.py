@@ -79,6 +79,10 @@ TEMPLATES = [
     },
 ]
 
+# For large rooms, 'editor.layers.NodeFanoutChannelLayer' with
+# "CONFIG": {"url": "redis://127.0.0.1:6379/0"} publishes each group_send once
+# through Redis pub/sub and fans it out in memory on every node
+# (compare with `manage.py bench_channel_layer`).
 CHANNEL_LAYERS = {
     "default": {
         "BACKEND": "channels_redis.core.RedisChannelLayer",
@@ -128,6 +132,18 @@ DATABASES = {
     }
 }
 
+# Production SQLite profile, applied to every new connection by
+# editor.sqlite.apply_sqlite_pragmas. WAL lets readers run alongside the
+# single writer; NORMAL sync is durable in WAL mode short of power loss.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,  # ms to wait for a lock before "database is locked"
+    'mmap_size': 268435456,  # 256 MB
+    'cache_size': -20000,  # 20 MB
+    'temp_store': 'MEMORY',
+}
+
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
 LOGIN_URL = 'login'
@@ -152,6 +168,109 @@ CODE_EXECUTION_TIMEOUT = 30  # seconds
 MAX_MEMORY_LIMIT = '100m'
 DOCKER_ENABLED = True
 
+# Compression for FileEntry.content and CodeSession.code_content:
+# 'auto' (zstd if the zstandard package is installed, else zlib), 'zstd',
+# 'zlib' or 'none'. Values shorter than the minimum are stored as-is.
+TEXT_COMPRESSION = 'auto'
+TEXT_COMPRESSION_LEVEL = 6
+TEXT_COMPRESSION_MIN_SIZE = 128  # bytes
+
+# Threads for WebSocket consumer database work (1 on SQLite without the write
+# queue below); 0 uses the shared channels.db.database_sync_to_async thread
+CONSUMER_DB_WORKERS = 8
+
+# Serialize WebSocket-layer ORM writes through one writer thread that
+# commits whatever has queued up (at most DB_WRITE_BATCH_SIZE writes) in a
+# single transaction. Needed on SQLite; optional on a server database.
+DB_WRITE_QUEUE_ENABLED = True
+DB_WRITE_BATCH_SIZE = 64
+
+# Background maintenance tasks, run from the ASGI lifespan. With several
+# worker processes, disable this and run `manage.py run_background_tasks` once.
+BACKGROUND_TASKS_ENABLED = True
+
+# Code history retention
+CODE_HISTORY_COMPACTION_INTERVAL = 60 * 60  # seconds, 0 disables the periodic job
+CODE_HISTORY_DELETE_BATCH_SIZE = 1000
+CODE_HISTORY_DELETE_PAUSE = 0.05  # seconds between delete batches
+
+# Presence: the in-memory store only sees its own process. With several
+# workers use 'editor.services.presence.RedisPresenceStore' and
+# PRESENCE_OPTIONS = {'url': 'redis://127.0.0.1:6379/0'}.
+PRESENCE_BACKEND = 'editor.services.presence.MemoryPresenceStore'
+PRESENCE_OPTIONS = {}
+PRESENCE_TTL = 300  # seconds without a heartbeat before a user drops out
+PRESENCE_IDLE_AFTER = 120  # seconds without messages before a user is idle
+
+# Room-affinity sharding: each room's ops run on one owner worker, which keeps
+# its symbol index and diagnostics. The local backend owns every room in this
+# process. With several workers use 'editor.services.sharding.RedisRoomOwnership'
+# and ROOM_SHARDING_OPTIONS = {'url': 'redis://127.0.0.1:6379/0'}.
+ROOM_SHARDING_BACKEND = 'editor.services.sharding.LocalRoomOwnership'
+ROOM_SHARDING_OPTIONS = {}
+ROOM_SHARDING_LEASE = 15  # seconds an owner's lease and heartbeat last without renewal
+ROOM_SHARDING_REPLICAS = 64  # points per worker on the hash ring
+ROOM_SHARDING_WORKER_ID = None  # defaults to "<hostname>:<pid>"
+
+# Rooms whose symbol index, search index and diagnostics graph are kept in
+# memory per process; the least recently used room's are dropped and rebuilt
+# from the database on their next use
+ROOM_INDEX_MAX_ROOMS = 200
+
+# Room file search (editor.services.search_index)
+SEARCH_MAX_PATTERN_LENGTH = 256  # characters in a regex query
+SEARCH_MAX_LINE_LENGTH = 4000  # characters of each line a regex is matched against
+SEARCH_TIME_BUDGET = 0.5  # seconds of matching before a page ends early with a cursor
+
+# Multiplexed editor connections (subprotocol editor.mux.v1, editor.consumers.multiplex)
+MUX_STREAM_WINDOW = 256  # frames either side may send on a stream before credit comes back
+MUX_STREAM_BUFFER = 1024  # server frames held for a stream out of credit before it is closed
+
+# Editor socket admission control (editor.services.admission). New connections
+# are closed with 1013 and "retry-after=<seconds>" while this process is overloaded.
+WS_ADMISSION_LAG_INTERVAL = 0.1  # seconds between event loop lag samples
+WS_ADMISSION_MAX_LOOP_LAG = 0.5  # seconds
+WS_ADMISSION_MAX_QUEUE_DEPTH = 10000  # messages waiting in the channel layer for local consumers
+WS_ADMISSION_RETRY_AFTER = 5  # seconds
+ROOM_MAX_EDITORS = 50  # users editing one room at once, 0 for no cap (close code 4009)
+
+# Per-connection token buckets: message type -> (messages per second, burst);
+# '*' applies to every message. Refused messages get a "rate_limited" reply.
+WS_RATE_LIMITS = {
+    '*': (50, 100),
+    'code_update': (20, 40),
+    'file_update': (10, 30),
+    'chat_message': (2, 5),
+}
+WS_RATE_LIMIT_CLOSE_AFTER = 200  # consecutive refused messages before closing with 4029
+
+# Edit latency tracing (editor.services.tracing): span samples kept per room
+# for the percentiles shown in the admin and on /metrics
+TRACE_SAMPLES_PER_ROOM = 500
+TRACE_MAX_ROOMS = 1000
+PING_MAX_RTT = 60  # seconds; larger client RTT reports are ignored
+
+# Read-only spectators of public rooms (ws/spectate/<room_id>/)
+SPECTATOR_FRAME_INTERVAL = 0.25  # seconds between delta frames sent to a room's spectators
+SPECTATOR_SNAPSHOT_INTERVAL = 5  # minimum seconds between snapshots one spectator may request
+SPECTATOR_CHAT_HISTORY = 50  # chat messages kept in the spectator snapshot
+
+# Stale data sweeper
+SWEEPER_INTERVAL = 5 * 60  # seconds, 0 disables the periodic job
+SWEEPER_BATCH_SIZE = 500  # primary-key range per DELETE or UPDATE
+SWEEPER_TIME_BUDGET = 2.0  # seconds of work per cycle
+SWEEPER_SESSION_STALE_AFTER = 30 * 60  # seconds without activity before a session is marked inactive
+SWEEPER_ROOM_IDLE_AFTER = 30 * 24 * 60 * 60  # seconds idle for rooms with no files or code history
+SWEEPER_BLOB_GRACE = 60 * 60  # seconds before an unreferenced blob may be collected
+
+# UserSession.last_activity writes are batched and flushed at this interval
+ACTIVITY_FLUSH_INTERVAL = 5  # seconds
+
+# /metrics serves this process's metrics in the Prometheus text format; scrape
+# every worker. Requests need "Authorization: Bearer <METRICS_TOKEN>", or a
+# staff session when no token is set.
+METRICS_TOKEN = None
+
 # WebRTC settings
 TURN_SERVER = {
     'urls': 'turn:your-turn-server.com',
@@ -216,6 +335,15 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 if not os.path.exists(MEDIA_ROOT):
     os.makedirs(MEDIA_ROOT)
 
+# On-disk project directories, one per room (editor.filemanager)
+PROJECT_FILES_ROOT = os.path.join(MEDIA_ROOT, 'projects')
+PROJECT_FILE_MMAP_THRESHOLD = 1024 * 1024  # files at least this large are read through mmap
+FILE_DOWNLOAD_CHUNK_SIZE = 64 * 1024  # bytes per chunk of /api/files/download/
+
+# Room zip import limits (editor.services.archive); guard against zip bombs
+ROOM_IMPORT_MAX_FILES = 2000
+ROOM_IMPORT_MAX_BYTES = 50 * 1024 * 1024  # total uncompressed size
+
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
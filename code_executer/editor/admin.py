@@ -1,13 +1,27 @@
 from django.contrib import admin
+from django.utils.html import format_html, format_html_join
 from .models import CodeRoom, CodeSession, UserSession
+from .services.tracing import QUANTILES, get_room_latency
 # DebugSession, CodeReview, ReviewComment, Plugin, UserPlugin, RTCSession
 
 @admin.register(CodeRoom)
 class CodeRoomAdmin(admin.ModelAdmin):
-    list_display = ('room_id', 'created_by', 'created_at', 'last_active')
-    list_filter = ('created_at', 'last_active')
+    list_display = ('room_id', 'created_by', 'created_at', 'last_active', 'allow_spectators')
+    list_filter = ('allow_spectators', 'created_at', 'last_active')
     search_fields = ('room_id', 'created_by__username')
-    readonly_fields = ('created_at',)
+    readonly_fields = ('created_at', 'edit_latency')
+
+    @admin.display(description='Edit latency (ms, this process)')
+    def edit_latency(self, obj):
+        percentiles = get_room_latency().percentiles(obj.room_id)
+        if not percentiles:
+            return 'No traced edits or pings yet'
+        header = format_html_join('', '<th>p{}</th>', ((int(quantile * 100),) for quantile in QUANTILES))
+        rows = format_html_join('', '<tr><td>{}</td>{}</tr>', (
+            (span, format_html_join('', '<td>{}</td>', ((f'{values[q] * 1000:.1f}',) for q in QUANTILES)))
+            for span, values in percentiles.items()
+        ))
+        return format_html('<table><tr><th>span</th>{}</tr>{}</table>', header, rows)
 
 @admin.register(CodeSession)
 class CodeSessionAdmin(admin.ModelAdmin):
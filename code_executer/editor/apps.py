@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class EditorConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'editor'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+
+        from .sqlite import apply_sqlite_pragmas
+
+        connection_created.connect(apply_sqlite_pragmas, dispatch_uid='editor.apply_sqlite_pragmas')
@@ -0,0 +1,94 @@
+import asyncio
+import logging
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class PeriodicTask:
+    """A synchronous maintenance job run every ``interval`` seconds."""
+
+    def __init__(self, name, interval, func):
+        self.name = name
+        self.interval = interval
+        self.func = func
+
+    def call(self):
+        """Runs the job with fresh database connections, as Channels does for consumers."""
+        close_old_connections()
+        try:
+            return self.func()
+        finally:
+            close_old_connections()
+
+    async def run_once(self):
+        """Runs the job once in a worker thread, logging any failure."""
+        try:
+            # Not thread-sensitive: a long job (compaction sleeps between
+            # batches) would otherwise hold the one sync thread that every
+            # consumer's database call waits on.
+            return await sync_to_async(self.call, thread_sensitive=False)()
+        except Exception as e:
+            logger.error(f"Background task {self.name} failed: {str(e)}", exc_info=True)
+
+    async def run_forever(self):
+        """Runs the job after every interval until cancelled."""
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.run_once()
+
+
+def get_periodic_tasks():
+    """Returns the maintenance jobs enabled in settings."""
+    from .services.history import compact_history
+    from .services.sweeper import sweep
+
+    tasks = []
+    if settings.SWEEPER_INTERVAL:
+        tasks.append(PeriodicTask('sweep_stale_data', settings.SWEEPER_INTERVAL, sweep))
+    if settings.CODE_HISTORY_COMPACTION_INTERVAL:
+        tasks.append(PeriodicTask(
+            'compact_code_history',
+            settings.CODE_HISTORY_COMPACTION_INTERVAL,
+            compact_history
+        ))
+    return tasks
+
+
+async def run_periodic_tasks(tasks=None):
+    """Runs every periodic task concurrently until cancelled."""
+    tasks = get_periodic_tasks() if tasks is None else tasks
+    if tasks:
+        await asyncio.gather(*(task.run_forever() for task in tasks))
+
+
+class LifespanApp:
+    """ASGI lifespan handler that runs the periodic tasks alongside the server.
+
+    Servers that do not send lifespan events (such as Daphne) should run
+    ``manage.py run_background_tasks`` as a separate process instead.
+    """
+
+    async def __call__(self, scope, receive, send):
+        runner = None
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                if settings.BACKGROUND_TASKS_ENABLED:
+                    runner = asyncio.ensure_future(run_periodic_tasks())
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if runner is not None:
+                    runner.cancel()
+                    try:
+                        await runner
+                    except asyncio.CancelledError:
+                        pass
+                # Hand this worker's rooms to the others before exiting
+                from .services.sharding import shutdown_room_router
+                await shutdown_room_router()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
@@ -1,4 +1,5 @@
 from .editor_consumer import EditorConsumer
+from .spectator_consumer import SpectatorConsumer
 # from .debug_consumer import DebugConsumer
 
-__all__ = ['EditorConsumer']
\ No newline at end of file
+__all__ = ['EditorConsumer', 'SpectatorConsumer']
\ No newline at end of file
@@ -1,14 +1,54 @@
 import json
+import time
+import asyncio
+import functools
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from asgiref.sync import sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
-from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.contrib.auth.models import User
 from django.utils import timezone
 from django.core.exceptions import ObjectDoesNotExist
-from editor.models import CodeRoom, UserSession, CodeSession, ChatMessage, FileEntry
+from editor.models import CodeRoom, CodeSession, ChatMessage, FileEntry
+from editor.services.symbol_index import get_symbol_index
+from editor.services.search_index import get_search_index
+from editor.services.diagnostics import get_room_diagnostics
+from editor.services.code_executer import PyLanguageServer
+from editor.services.symbol_index import detect_language
+from editor.services.presence import get_presence_store
+from editor.services.activity import get_activity_writer
+from editor.services.db_executor import db_sync_to_async, db_write_to_async
+from editor.services.sharding import get_room_router
+from editor.services.admission import (
+    CLOSE_RATE_LIMITED, CLOSE_ROOM_FULL, CLOSE_TRY_AGAIN_LATER, ConnectionRateLimiter, check_admission
+)
+from editor.services.tracing import get_room_latency, stamp_trace
+from editor.services.metrics import ACTIVE_SOCKETS, GROUP_SEND_SECONDS, WS_RECEIVE_SECONDS
+from editor.consumers.multiplex import SUBPROTOCOL, Multiplexer
 
 logger = logging.getLogger(__name__)
 
+# Messages run by the worker that owns the room (see editor.services.sharding)
+ROOM_OPS = {
+    "code_update", "chat_message", "file_update",
+    "goto_definition", "workspace_symbols", "request_diagnostics",
+}
+# Message types timed under their own label; anything else is "unknown"
+MESSAGE_TYPES = ROOM_OPS | {"request_latest", "ping"}
+# Edits that may carry a client trace (see editor.services.tracing)
+TRACED_TYPES = {"code_update", "file_update"}
+
+# Reparses run off the event loop on one thread, so they apply in write order
+index_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="index-update")
+
 class EditorConsumer(AsyncWebsocketConsumer):
+    # Set when the client speaks the multiplexed protocol (editor.consumers.multiplex)
+    mux = None
+    # Set in connect(); forwarded ops run without one
+    rate_limiter = None
+
     async def connect(self):
         """Handles WebSocket connection."""
         try:
@@ -26,12 +66,32 @@ class EditorConsumer(AsyncWebsocketConsumer):
                 await self.close(code=4003)
                 return
 
+            retry_after = check_admission(self.channel_layer)
+            if retry_after is not None:
+                await self.accept()
+                await self.close(code=CLOSE_TRY_AGAIN_LATER, reason=f"retry-after={retry_after}")
+                return
+
+            if await self.room_is_full():
+                logger.warning(f"Room {self.room_id} is full, refusing {self.user.username}")
+                await self.accept()
+                await self.close(code=CLOSE_ROOM_FULL, reason="room full")
+                return
+
+            self.rate_limiter = ConnectionRateLimiter()
+            ACTIVE_SOCKETS.inc(self.room_id)
             await self.channel_layer.group_add(self.room_group_name, self.channel_name)
-            await self.accept()
-            await self.add_user_to_session()
+            if SUBPROTOCOL in self.scope.get("subprotocols", []):
+                # Multiplexed: state is sent as the client opens each stream
+                self.mux = Multiplexer(self.send_frame, self.open_stream)
+                await self.accept(SUBPROTOCOL)
+                await self.join_presence()
+            else:
+                await self.accept()
+                await self.join_presence()
 
-            # Send initial state including chat history
-            await self.send_initial_state()
+                # Send initial state including chat history
+                await self.send_initial_state()
 
             logger.info(f"User {self.user.username} joined room {self.room_id}")
 
@@ -43,18 +103,11 @@ class EditorConsumer(AsyncWebsocketConsumer):
         """Handles incoming WebSocket messages (code & chat)."""
         try:
             data = json.loads(text_data)
-            message_type = data.get("type")
-
-            if message_type == "request_latest":
-                await self.send_room_state()
-            elif message_type == "code_update":
-                await self.handle_code_update(data)
-            elif message_type == "chat_message":
-                await self.handle_chat_message(data)
-            elif message_type == "file_update":
-                await self.handle_file_update(data)
+            await self.mark_active()
+            if self.mux is not None:
+                await self.mux.receive(data, self.route_message)
             else:
-                logger.warning(f"Unknown WebSocket message type: {message_type}")
+                await self.route_message(data)
 
         except json.JSONDecodeError:
             logger.error("Invalid JSON received in WebSocket.")
@@ -63,6 +116,173 @@ class EditorConsumer(AsyncWebsocketConsumer):
             logger.error(f"Error processing message: {str(e)}")
             await self.send_error(f"Error processing message: {str(e)}")
 
+    async def route_message(self, data):
+        """Runs a room op here, or forwards it to the worker that owns the room."""
+        started = time.perf_counter()
+        try:
+            if self.rate_limiter is not None:
+                bucket = self.rate_limiter.allow(data.get("type"))
+                if bucket is not None:
+                    await self.refuse_message(data.get("type"), bucket)
+                    return
+            if data.get("type") in TRACED_TYPES:
+                stamp_trace(data)
+
+            if data.get("type") not in ROOM_OPS:
+                await self.handle_message(data)
+                return
+
+            router = await get_room_router(self.channel_layer, EditorConsumer.run_forwarded)
+            address = await router.route(self.room_id)
+            if address is None:
+                await router.run(self.room_id, lambda: self.handle_message(data))
+                return
+            await router.forward(address, {
+                "room_id": self.room_id,
+                "room_pk": self.room_pk,
+                "user_id": self.user.id,
+                "username": self.user.username,
+                "reply_channel": self.channel_name,
+                "data": data
+            })
+        finally:
+            message_type = data.get("type")
+            WS_RECEIVE_SECONDS.observe(
+                time.perf_counter() - started, message_type if message_type in MESSAGE_TYPES else "unknown"
+            )
+
+    async def group_send(self, event):
+        """Sends an event to the room group, timing the channel layer."""
+        started = time.perf_counter()
+        try:
+            await self.channel_layer.group_send(self.room_group_name, event)
+        finally:
+            GROUP_SEND_SECONDS.observe(time.perf_counter() - started, event["type"])
+
+    async def group_send_traced(self, event, trace, started):
+        """Sends an edit to the room group, timing its persist and group_send spans when traced."""
+        if trace is None:
+            await self.group_send(event)
+            return
+        trace["spans"]["persist"] = time.time() - started
+        trace["group_sent"] = time.time()
+        event["trace"] = trace
+        await self.group_send(event)
+        latency = get_room_latency()
+        latency.record(self.room_id, "persist", trace["spans"]["persist"])
+        latency.record(self.room_id, "group_send", time.time() - trace["group_sent"])
+
+    async def send_traced(self, message, trace):
+        """Sends a broadcast edit to the client with the server spans of its trace, in ms."""
+        if trace is None:
+            await self.send(text_data=json.dumps(message))
+            return
+        # Server spans so far, for the client to attribute its own latency
+        delivered = time.time()
+        spans = dict(trace["spans"], fanout=delivered - trace["group_sent"], server=delivered - trace["received"])
+        message["trace"] = {
+            "id": trace["id"],
+            "sent": trace["sent"],
+            "spans": {span: round(seconds * 1000, 3) for span, seconds in spans.items()}
+        }
+        await self.send(text_data=json.dumps(message))
+        latency = get_room_latency()
+        latency.record(self.room_id, "fanout", spans["fanout"])
+        latency.record(self.room_id, "send", time.time() - delivered)
+        latency.record(self.room_id, "server", time.time() - trace["received"])
+
+    async def refuse_message(self, message_type, bucket):
+        """Tells the client a message was dropped by its rate limit, closing on a sustained flood."""
+        if self.rate_limiter.dropped > settings.WS_RATE_LIMIT_CLOSE_AFTER:
+            logger.warning(f"Closing flooding connection of {self.user.username} in room {self.room_id}")
+            await self.close(code=CLOSE_RATE_LIMITED)
+            return
+        retry_after = bucket.retry_after()
+        if self.rate_limiter.should_notify(message_type, retry_after):
+            await self.send(text_data=json.dumps({
+                "type": "rate_limited",
+                "message_type": message_type,
+                "retry_after": round(retry_after, 3)
+            }))
+
+    async def handle_message(self, data):
+        """Dispatches a client message to its handler."""
+        message_type = data.get("type")
+        if message_type == "request_latest":
+            await self.send_room_state()
+        elif message_type == "code_update":
+            await self.handle_code_update(data)
+        elif message_type == "chat_message":
+            await self.handle_chat_message(data)
+        elif message_type == "file_update":
+            await self.handle_file_update(data)
+        elif message_type == "goto_definition":
+            await self.handle_goto_definition(data)
+        elif message_type == "workspace_symbols":
+            await self.handle_workspace_symbols(data)
+        elif message_type == "request_diagnostics":
+            await self.handle_request_diagnostics()
+        elif message_type == "ping":
+            await self.handle_ping(data)
+        else:
+            logger.warning(f"Unknown WebSocket message type: {message_type}")
+
+    @classmethod
+    async def run_forwarded(cls, message):
+        """Runs an op forwarded by another worker, replying to the sender's connection."""
+        consumer = cls()
+        consumer.channel_layer = get_channel_layer()
+        consumer.channel_name = message["reply_channel"]
+        consumer.room_id = message["room_id"]
+        consumer.room_group_name = f"editor_{consumer.room_id}"
+        consumer.room_pk = message["room_pk"]
+        consumer.user = User(id=message["user_id"], username=message["username"])
+
+        async def reply(event):
+            await consumer.channel_layer.send(consumer.channel_name, {
+                "type": "forwarded_reply",
+                "text": event["text"]
+            })
+        consumer.base_send = reply
+
+        try:
+            await consumer.handle_message(message["data"])
+        except Exception as e:
+            logger.error(f"Error processing forwarded message: {str(e)}")
+            await consumer.send_error(f"Error processing message: {str(e)}")
+
+    async def send(self, text_data=None, bytes_data=None, close=False):
+        """Sends to the client, on the stream the message belongs to when multiplexed."""
+        if self.mux is None or text_data is None:
+            await super().send(text_data=text_data, bytes_data=bytes_data, close=close)
+            return
+        await self.mux.send(text_data)
+        if close:
+            await self.close()
+
+    async def send_frame(self, text):
+        """Writes a multiplexer frame to the socket."""
+        await super().send(text_data=text)
+
+    async def open_stream(self, stream):
+        """Sends a newly opened stream the state it starts from."""
+        if stream.kind == "editor":
+            await self.send_initial_state()
+        elif stream.kind == "chat":
+            await self.send(text_data=json.dumps({
+                "type": "chat_history",
+                "messages": await self.get_chat_history()
+            }))
+        elif stream.kind == "presence":
+            await self.send(text_data=json.dumps({
+                "type": "presence_state",
+                "members": await self.presence("members", self.room_id)
+            }))
+
+    async def forwarded_reply(self, event):
+        """Relays the owner worker's reply to a forwarded op."""
+        await self.send(text_data=event["text"])
+
     async def handle_chat_message(self, data):
         """Handles chat messages and broadcasts them."""
         try:
@@ -74,8 +294,7 @@ class EditorConsumer(AsyncWebsocketConsumer):
             await self.save_chat_message(message)
 
             # Broadcast to all users in the room
-            await self.channel_layer.group_send(
-                self.room_group_name,
+            await self.group_send(
                 {
                     "type": "broadcast_chat",
                     "message": message,
@@ -99,9 +318,11 @@ class EditorConsumer(AsyncWebsocketConsumer):
     async def disconnect(self, close_code):
         """Handles WebSocket disconnection."""
         try:
+            if self.rate_limiter is not None:
+                ACTIVE_SOCKETS.dec(self.room_id)
             if hasattr(self, 'room_group_name'):
                 await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
-                await self.remove_user_from_session()
+                await self.leave_presence()
                 logger.info(f"User {self.user.username} left room {self.room_id}")
         except Exception as e:
             logger.error(f"Disconnect error: {str(e)}")
@@ -111,33 +332,46 @@ class EditorConsumer(AsyncWebsocketConsumer):
         try:
             code = data.get("code", "")
             language = data.get("language", "python")
+            trace = data.get("trace")
+            started = time.time()
 
             # Save the latest code state
             await self.save_code_session(code, language)
 
             # Broadcast update to all users
-            await self.channel_layer.group_send(
-                self.room_group_name,
-                {
-                    "type": "broadcast_code",
-                    "code": code,
-                    "language": language,
-                    "user": self.user.username,
-                    "timestamp": timezone.now().isoformat()
-                }
-            )
+            await self.group_send_traced({
+                "type": "broadcast_code",
+                "code": code,
+                "language": language,
+                "user": self.user.username,
+                "timestamp": timezone.now().isoformat()
+            }, trace, started)
         except Exception as e:
             logger.error(f"Code update error: {str(e)}")
             await self.send_error("Failed to update code")
 
     async def broadcast_code(self, event):
         """Broadcasts updated code to all connected users."""
-        await self.send(text_data=json.dumps({
+        await self.send_traced({
             "type": "code_update",
             "code": event["code"],
             "language": event["language"],
             "user": event["user"],
             "timestamp": event["timestamp"]
+        }, event.get("trace"))
+
+    async def handle_ping(self, data):
+        """Answers an RTT probe and records the client's previous measurements (in ms)."""
+        latency = get_room_latency()
+        for span in ("rtt", "render"):
+            value = data.get(span)
+            if type(value) in (int, float) and 0 <= value <= settings.PING_MAX_RTT * 1000:
+                latency.record(self.room_id, span, value / 1000)
+        await self.send(text_data=json.dumps({
+            "type": "pong",
+            "id": data.get("id"),
+            "sent": data.get("sent"),
+            "server_time": time.time() * 1000
         }))
 
     async def handle_file_update(self, data):
@@ -146,6 +380,10 @@ class EditorConsumer(AsyncWebsocketConsumer):
             action = data.get("action", "")
             filename = data.get("filename", "")
             content = data.get("content", "")
+            trace = data.get("trace")
+            started = time.time()
+            # What the indexes parse; a rename reparses the stored content
+            index_content = content
             
             if not filename:
                 await self.send_error("Filename is required")
@@ -161,11 +399,10 @@ class EditorConsumer(AsyncWebsocketConsumer):
                 if not new_filename:
                     await self.send_error("New filename is required for rename")
                     return
-                await self.rename_file(filename, new_filename)
-            
-            # Broadcast file update to all users
-            await self.channel_layer.group_send(
-                self.room_group_name,
+                index_content = await self.rename_file(filename, new_filename)
+
+            # The write is committed, so peers hear about it even if reindexing fails
+            await self.group_send_traced(
                 {
                     "type": "broadcast_file_update",
                     "action": action,
@@ -174,15 +411,28 @@ class EditorConsumer(AsyncWebsocketConsumer):
                     "newFilename": data.get("newFilename", ""),
                     "user": data.get("user"),
                     "username": self.user.username
-                }
+                },
+                trace, started
             )
         except Exception as e:
             logger.error(f"File update error: {str(e)}", exc_info=True)
             await self.send_error(f"Failed to update file: {str(e)}")
+            return
+
+        try:
+            new_filename = data.get("newFilename", "")
+            await self.run_in_index_thread(self.update_symbol_index, action, filename, index_content, new_filename)
+            await self.update_diagnostics(action, filename, index_content, new_filename)
+        except Exception as e:
+            logger.error(f"Error reindexing {filename} in room {self.room_id}: {str(e)}", exc_info=True)
+
+    async def run_in_index_thread(self, func, *args):
+        """Runs a parsing step on the index thread instead of the event loop."""
+        return await asyncio.get_running_loop().run_in_executor(index_executor, functools.partial(func, *args))
 
     async def broadcast_file_update(self, event):
         """Broadcasts file updates to connected clients."""
-        await self.send(text_data=json.dumps({
+        await self.send_traced({
             "type": "file_update",
             "action": event["action"],
             "filename": event["filename"],
@@ -190,13 +440,160 @@ class EditorConsumer(AsyncWebsocketConsumer):
             "newFilename": event.get("newFilename", ""),
             "user": event["user"],
             "username": event.get("username")
+        }, event.get("trace"))
+
+    def update_symbol_index(self, action, filename, content, new_filename=""):
+        """Reparses only the changed file in the room's symbol index."""
+        index = get_symbol_index(self.room_id)
+        if not index.built:
+            # The first lookup builds the index from the database
+            return
+        if action in ["create", "update"]:
+            index.update_file(filename, content)
+        elif action == "delete":
+            index.remove_file(filename)
+        elif action == "rename" and new_filename:
+            index.rename_file(filename, new_filename, content)
+
+    @db_sync_to_async
+    def build_symbol_index(self):
+        """Builds the room's symbol index from its stored files."""
+        index = get_symbol_index(self.room_id)
+        if not index.built:
+            files = FileEntry.objects.filter(room_id=self.room_pk).values_list('filename', 'blob__content')
+            index.build(dict(files))
+        return index
+
+    async def load_symbol_index(self):
+        """Returns the room's symbol index, building it on first use."""
+        index = get_symbol_index(self.room_id)
+        if not index.built:
+            index = await self.build_symbol_index()
+        return index
+
+    async def handle_goto_definition(self, data):
+        """Resolves the symbol under the cursor (or a given name) to its definitions."""
+        try:
+            index = await self.load_symbol_index()
+            filename = data.get("filename")
+            symbol = data.get("symbol")
+            if not symbol and filename and "line" in data:
+                symbol = index.symbol_at(filename, int(data["line"]), int(data.get("ch", 0)))
+
+            locations = index.goto_definition(symbol, filename) if symbol else []
+            await self.send(text_data=json.dumps({
+                "type": "definition",
+                "requestId": data.get("requestId"),
+                "symbol": symbol,
+                "locations": locations
+            }))
+        except Exception as e:
+            logger.error(f"Go to definition error: {str(e)}", exc_info=True)
+            await self.send_error("Failed to find definition")
+
+    async def handle_workspace_symbols(self, data):
+        """Searches definitions across all files in the room."""
+        try:
+            index = await self.load_symbol_index()
+            query = data.get("query", "")
+            limit = min(int(data.get("limit", 100)), 500)
+            await self.send(text_data=json.dumps({
+                "type": "workspace_symbols",
+                "requestId": data.get("requestId"),
+                "query": query,
+                "symbols": index.workspace_symbols(query, limit)
+            }))
+        except Exception as e:
+            logger.error(f"Workspace symbols error: {str(e)}", exc_info=True)
+            await self.send_error("Failed to search symbols")
+
+    @db_sync_to_async
+    def build_room_diagnostics(self):
+        """Builds the room's import dependency graph from its stored files."""
+        diagnostics = get_room_diagnostics(self.room_id)
+        if not diagnostics.built:
+            files = FileEntry.objects.filter(room_id=self.room_pk).values_list('filename', 'blob__content')
+            diagnostics.build(dict(files))
+        return diagnostics
+
+    async def load_room_diagnostics(self):
+        """Returns the room's diagnostics state, building the graph on first use."""
+        diagnostics = get_room_diagnostics(self.room_id)
+        if not diagnostics.built:
+            diagnostics = await self.build_room_diagnostics()
+        return diagnostics
+
+    @db_sync_to_async
+    def get_python_files(self):
+        """Retrieves the room's Python files for linting."""
+        files = FileEntry.objects.filter(room_id=self.room_pk).values_list('filename', 'blob__content')
+        return {
+            filename: content
+            for filename, content in files
+            if detect_language(filename) == 'python'
+        }
+
+    async def lint_files(self, filenames):
+        """Lints the given files against the current contents of the room."""
+        targets = [filename for filename in filenames if detect_language(filename) == 'python']
+        if not targets:
+            return {}
+        files = await self.get_python_files()
+        return await PyLanguageServer().provide_project_diagnostics(files, targets)
+
+    async def publish_diagnostics(self, changed):
+        """Pushes diagnostics for files whose results changed to the room."""
+        await self.group_send(
+            {
+                "type": "broadcast_diagnostics",
+                "files": changed
+            }
+        )
+
+    async def update_diagnostics(self, action, filename, content, new_filename=""):
+        """Schedules a re-lint of the changed file and its reverse dependents."""
+        diagnostics = await self.load_room_diagnostics()
+        if action in ["create", "update"]:
+            affected = await self.run_in_index_thread(diagnostics.update_file, filename, content)
+        elif action == "delete":
+            affected = await self.run_in_index_thread(diagnostics.remove_file, filename)
+        elif action == "rename" and new_filename:
+            affected = await self.run_in_index_thread(diagnostics.rename_file, filename, new_filename)
+        else:
+            return
+        diagnostics.schedule(affected, self.lint_files, self.publish_diagnostics)
+
+    async def handle_request_diagnostics(self):
+        """Sends cached diagnostics and lints files that have none yet."""
+        try:
+            diagnostics = await self.load_room_diagnostics()
+            cached = diagnostics.cached()
+            await self.send(text_data=json.dumps({
+                "type": "diagnostics",
+                "files": cached
+            }))
+
+            missing = [
+                filename for filename in diagnostics.graph.imports
+                if filename not in cached and detect_language(filename) == 'python'
+            ]
+            if missing:
+                diagnostics.schedule(missing, self.lint_files, self.publish_diagnostics)
+        except Exception as e:
+            logger.error(f"Diagnostics request error: {str(e)}", exc_info=True)
+            await self.send_error("Failed to load diagnostics")
+
+    async def broadcast_diagnostics(self, event):
+        """Sends changed diagnostics to connected clients."""
+        await self.send(text_data=json.dumps({
+            "type": "diagnostics",
+            "files": event["files"]
         }))
 
-    @database_sync_to_async
+    @db_write_to_async
     def save_chat_message(self, message):
         """Saves chat message to database."""
         try:
-            room = CodeRoom.objects.get(room_id=self.room_id)
             chat_message = ChatMessage.objects.create(
                 room_id=self.room_id,
                 user=self.user,
@@ -204,14 +601,11 @@ class EditorConsumer(AsyncWebsocketConsumer):
                 timestamp=timezone.now()
             )
             return chat_message
-        except CodeRoom.DoesNotExist:
-            logger.error(f"Room {self.room_id} not found when saving chat message")
-            raise
         except Exception as e:
             logger.error(f"Failed to save chat message: {str(e)}", exc_info=True)
             raise
 
-    @database_sync_to_async
+    @db_sync_to_async
     def get_chat_history(self):
         """Fetches chat history for the room."""
         try:
@@ -228,62 +622,60 @@ class EditorConsumer(AsyncWebsocketConsumer):
             logger.error(f"Error fetching chat history: {str(e)}", exc_info=True)
             return []
 
-    @database_sync_to_async
+    @db_write_to_async
     def save_file(self, filename, content):
         """Saves file to the database."""
         try:
-            room = CodeRoom.objects.get(room_id=self.room_id)
-            
-            # Update existing file or create new one
-            FileEntry.objects.update_or_create(
-                room=room,
-                filename=filename,
-                defaults={
-                    'content': content,
-                    'created_by': self.user,
-                    'updated_at': timezone.now()
-                }
-            )
+            # Update existing file or create new one; unchanged content writes nothing
+            updated_at = FileEntry.store(self.room_pk, filename, content, self.user)
+            if updated_at is None:
+                return True
+
+            search_index = get_search_index(self.room_id)
+            if search_index.built:
+                search_index.update_file(filename, content, updated_at)
             
             return True
         except Exception as e:
             logger.error(f"Error saving file {filename}: {str(e)}", exc_info=True)
             raise
 
-    @database_sync_to_async
+    @db_write_to_async
     def delete_file(self, filename):
         """Deletes file from the database."""
         try:
-            room = CodeRoom.objects.get(room_id=self.room_id)
-            FileEntry.objects.filter(room=room, filename=filename).delete()
+            FileEntry.objects.filter(room_id=self.room_pk, filename=filename).delete()
+
+            search_index = get_search_index(self.room_id)
+            if search_index.built:
+                search_index.remove_file(filename)
             return True
         except Exception as e:
             logger.error(f"Error deleting file {filename}: {str(e)}", exc_info=True)
             raise
 
-    @database_sync_to_async
+    @db_write_to_async
     def rename_file(self, old_filename, new_filename):
-        """Renames file in the database."""
+        """Renames file in the database and returns its content."""
         try:
-            room = CodeRoom.objects.get(room_id=self.room_id)
-            file_entry = FileEntry.objects.get(room=room, filename=old_filename)
+            file_entry = FileEntry.objects.select_related('blob').get(room_id=self.room_pk, filename=old_filename)
             file_entry.filename = new_filename
             file_entry.save()
-            return True
+
+            search_index = get_search_index(self.room_id)
+            if search_index.built:
+                search_index.rename_file(old_filename, new_filename, file_entry.updated_at)
+            return file_entry.content
         except Exception as e:
             logger.error(f"Error renaming file {old_filename} to {new_filename}: {str(e)}", exc_info=True)
             raise
 
-    @database_sync_to_async
+    @db_sync_to_async
     def get_room_files(self):
         """Retrieves all files for a room."""
         try:
-            room = CodeRoom.objects.get(room_id=self.room_id)
-            files = FileEntry.objects.filter(room=room)
-            return {
-                file.filename: file.content
-                for file in files
-            }
+            files = FileEntry.objects.filter(room_id=self.room_pk).values_list('filename', 'blob__content')
+            return dict(files)
         except Exception as e:
             logger.error(f"Error retrieving files for room {self.room_id}: {str(e)}", exc_info=True)
             return {}
@@ -363,11 +755,12 @@ class EditorConsumer(AsyncWebsocketConsumer):
         except Exception as e:
             logger.error(f"Failed to send error message: {str(e)}", exc_info=True)
 
-    @database_sync_to_async
+    @db_sync_to_async
     def verify_room_access(self):
         """Verifies if the room exists."""
         try:
-            room = CodeRoom.objects.get(room_id=self.room_id)
+            # Cache the primary key so later writes need no room lookup
+            self.room_pk = CodeRoom.objects.values_list('pk', flat=True).get(room_id=self.room_id)
             return True
         except CodeRoom.DoesNotExist:
             return False
@@ -375,44 +768,97 @@ class EditorConsumer(AsyncWebsocketConsumer):
             logger.error(f"Error verifying room access: {str(e)}", exc_info=True)
             return False
 
-    @database_sync_to_async
-    def add_user_to_session(self):
-        """Adds user to active session."""
+    async def room_is_full(self):
+        """True if ROOM_MAX_EDITORS other users are already in the room."""
+        if not settings.ROOM_MAX_EDITORS:
+            return False
+        members = await self.presence("members", self.room_id)
+        if len(members) < settings.ROOM_MAX_EDITORS:
+            return False
+        # Another tab of a user already present does not take a new seat
+        return all(str(member["user_id"]) != str(self.user.id) for member in members)
+
+    async def presence(self, method, *args):
+        """Calls a presence store method, off the event loop if it does I/O."""
+        store = get_presence_store()
+        func = getattr(store, method)
+        if store.blocking:
+            return await sync_to_async(func, thread_sensitive=False)(*args)
+        return func(*args)
+
+    async def join_presence(self):
+        """Registers this connection and announces the user if they just arrived."""
+        self.last_activity = time.monotonic()
+        self.is_idle = False
+        get_activity_writer().record(self.room_id, self.user.id)
+        if await self.presence("join", self.room_id, self.user.id, self.user.username):
+            await self.send_presence_event("user_joined")
+        self.presence_task = asyncio.ensure_future(self.presence_loop())
+
+    async def leave_presence(self):
+        """Drops this connection and announces the user if it was their last one."""
+        task = getattr(self, "presence_task", None)
+        if task is None:
+            return
+        task.cancel()
+        get_activity_writer().record(self.room_id, self.user.id)
+        if await self.presence("leave", self.room_id, self.user.id):
+            await self.send_presence_event("user_left")
+
+    async def mark_active(self):
+        """Records client activity, announcing the user as active again if idle."""
+        self.last_activity = time.monotonic()
+        if getattr(self, "is_idle", False):
+            self.is_idle = False
+            if await self.presence("set_idle", self.room_id, self.user.id, False):
+                await self.send_presence_event("user_active")
+
+    async def presence_loop(self):
+        """Keeps the presence TTL fresh and detects idleness for this connection."""
+        idle_after = settings.PRESENCE_IDLE_AFTER
+        interval = min(idle_after, get_presence_store().ttl) / 2
         try:
-            room = CodeRoom.objects.get(room_id=self.room_id)
-            UserSession.objects.update_or_create(
-                user=self.user,
-                room=room,
-                defaults={
-                    "is_active": True,
-                    "last_activity": timezone.now()
-                }
-            )
-        except CodeRoom.DoesNotExist:
-            logger.error(f"Room {self.room_id} not found when adding user to session")
-            raise
+            while True:
+                await asyncio.sleep(interval)
+                await self.presence("heartbeat", self.room_id, self.user.id, self.user.username)
+                if not self.is_idle:
+                    get_activity_writer().record(self.room_id, self.user.id)
+                if not self.is_idle and time.monotonic() - self.last_activity >= idle_after:
+                    self.is_idle = True
+                    if await self.presence("set_idle", self.room_id, self.user.id, True):
+                        await self.send_presence_event("user_idle")
+        except asyncio.CancelledError:
+            pass
         except Exception as e:
-            logger.error(f"Failed to add user to session: {str(e)}", exc_info=True)
-            raise
+            logger.error(f"Presence heartbeat error: {str(e)}")
+
+    async def send_presence_event(self, event):
+        """Broadcasts a join/leave/idle/active event with the current user count."""
+        await self.group_send(
+            {
+                "type": "broadcast_presence",
+                "event": event,
+                "user": self.user.username,
+                "connected_users": await self.presence("count", self.room_id),
+                "timestamp": timezone.now().isoformat()
+            }
+        )
 
-    @database_sync_to_async
-    def remove_user_from_session(self):
-        """Removes user from active session."""
-        try:
-            UserSession.objects.filter(
-                user=self.user,
-                room__room_id=self.room_id
-            ).update(is_active=False, last_activity=timezone.now())
-        except Exception as e:
-            logger.error(f"Failed to remove user from session: {str(e)}")
+    async def broadcast_presence(self, event):
+        """Sends presence events to connected clients."""
+        await self.send(text_data=json.dumps({
+            "type": event["event"],
+            "user": event["user"],
+            "connected_users": event["connected_users"],
+            "timestamp": event["timestamp"]
+        }))
 
-    @database_sync_to_async
+    @db_write_to_async
     def save_code_session(self, code, language):
         """Saves the latest code to the database."""
         try:
-            room = CodeRoom.objects.get(room_id=self.room_id)
             CodeSession.objects.create(
-                room=room,
+                room_id=self.room_pk,
                 code_content=code,
                 language=language,
                 created_by=self.user
@@ -420,13 +866,13 @@ class EditorConsumer(AsyncWebsocketConsumer):
         except Exception as e:
             logger.error(f"Error saving code session: {str(e)}")
 
-    @database_sync_to_async
+    @db_sync_to_async
     def get_latest_code_session(self):
         """Retrieves the latest saved code session."""
         try:
             return CodeSession.objects.filter(
-                room__room_id=self.room_id
-            ).order_by('-created_at').first()
+                room_id=self.room_pk
+            ).select_related('blob').order_by('-created_at').first()
         except Exception as e:
             logger.error(f"Error fetching latest code session: {str(e)}", exc_info=True)
             return None
\ No newline at end of file
@@ -0,0 +1,175 @@
+import re
+import json
+import logging
+from collections import deque
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+SUBPROTOCOL = "editor.mux.v1"
+CONTROL_STREAM = 0
+
+# Stream kinds: (message types the client may send, message types routed to the stream)
+STREAM_KINDS = {
+    "editor": (
+        {"request_latest", "code_update", "file_update", "ping"},
+        {"initial_state", "room_state", "code_update", "file_update"},
+    ),
+    "chat": (
+        {"chat_message"},
+        {"chat_history", "chat_message"},
+    ),
+    "lsp": (
+        {"goto_definition", "workspace_symbols", "request_diagnostics"},
+        {"definition", "workspace_symbols", "diagnostics"},
+    ),
+    "presence": (
+        set(),
+        {"presence_state", "user_joined", "user_left", "user_idle", "user_active"},
+    ),
+}
+STREAM_OF_TYPE = {
+    message_type: kind
+    for kind, (incoming, outgoing) in STREAM_KINDS.items()
+    for message_type in outgoing
+}
+
+# Every server message is json.dumps({"type": ..., ...}), so the type is at the front
+TYPE_PREFIX = re.compile(r'\{"type": "([^"\\]*)"')
+
+
+def message_type(text):
+    """Returns the "type" of an encoded server message without decoding all of it."""
+    match = TYPE_PREFIX.match(text)
+    if match:
+        return match.group(1)
+    return json.loads(text).get("type")
+
+
+class Stream:
+    """One logical stream and its flow-control state.
+
+    ``credit`` is how many more frames the client has agreed to take;
+    frames beyond it wait in ``pending``. ``unacked`` counts client frames
+    the server has not yet granted fresh credit for.
+    """
+
+    def __init__(self, stream_id, kind, window):
+        self.id = stream_id
+        self.kind = kind
+        self.credit = window
+        self.pending = deque()
+        self.unacked = 0
+
+
+class Multiplexer:
+    """Carries several streams over one WebSocket connection.
+
+    Every frame is ``{"stream": id, "op": ...}``. The client opens streams
+    (``open`` with a ``kind`` and the ``window`` of frames it will accept),
+    sends messages on them (``data`` with a ``payload``) and returns credit
+    as it consumes server frames (``credit`` with ``n``). The server answers
+    ``opened`` with its own window and grants ``credit`` back as it handles
+    client frames; a client that overruns the window, or a stream whose
+    backlog passes MUX_STREAM_BUFFER, gets its stream closed. Stream 0
+    carries connection-level messages and is not flow controlled.
+    """
+
+    def __init__(self, send_text, on_open):
+        self.send_text = send_text
+        self.on_open = on_open
+        self.streams = {}
+        self.current = None
+
+    def frame(self, stream_id, op, payload=None, **fields):
+        fields = json.dumps({"stream": stream_id, "op": op, **fields})
+        if payload is None:
+            return fields
+        # The payload is already encoded; splice it in rather than re-encoding it
+        return f'{fields[:-1]}, "payload": {payload}}}'
+
+    async def receive(self, data, dispatch):
+        """Handles one client frame; ``dispatch(payload)`` runs the payload of a data frame."""
+        stream_id = data.get("stream")
+        op = data.get("op")
+        stream = self.streams.get(stream_id)
+
+        if op == "open":
+            await self.open(stream_id, data.get("kind"), data.get("window"))
+        elif stream is None:
+            await self.control_error(f"Unknown stream {stream_id}")
+        elif op == "data":
+            await self.handle_data(stream, data.get("payload") or {}, dispatch)
+        elif op == "credit":
+            stream.credit += max(0, int(data.get("n", 0)))
+            await self.flush(stream)
+        elif op == "close":
+            del self.streams[stream.id]
+        else:
+            await self.control_error(f"Unknown op {op}")
+
+    async def open(self, stream_id, kind, window):
+        if not isinstance(stream_id, int) or stream_id <= CONTROL_STREAM or stream_id in self.streams:
+            await self.control_error(f"Invalid stream id {stream_id}")
+            return
+        if kind not in STREAM_KINDS:
+            await self.control_error(f"Unknown stream kind {kind}")
+            return
+        limit = settings.MUX_STREAM_WINDOW
+        stream = self.streams[stream_id] = Stream(stream_id, kind, min(int(window or limit), limit))
+        await self.send_text(self.frame(stream_id, "opened", window=limit))
+        await self.on_open(stream)
+
+    async def handle_data(self, stream, payload, dispatch):
+        stream.unacked += 1
+        if stream.unacked > settings.MUX_STREAM_WINDOW:
+            await self.close(stream, "flow control window exceeded")
+            return
+        if payload.get("type") not in STREAM_KINDS[stream.kind][0]:
+            await self.close(stream, f"{payload.get('type')} is not allowed on a {stream.kind} stream")
+            return
+
+        self.current = stream
+        try:
+            await dispatch(payload)
+        finally:
+            self.current = None
+        if stream.unacked >= settings.MUX_STREAM_WINDOW // 2 and stream.id in self.streams:
+            await self.send_text(self.frame(stream.id, "credit", n=stream.unacked))
+            stream.unacked = 0
+
+    async def send(self, text):
+        """Routes an encoded server message to the streams of its kind."""
+        kind = STREAM_OF_TYPE.get(message_type(text))
+        if kind is None:
+            # Errors and other replies go to the stream being handled
+            targets = [self.current] if self.current is not None else []
+        else:
+            targets = [stream for stream in self.streams.values() if stream.kind == kind]
+        if not targets and kind is None:
+            await self.send_text(self.frame(CONTROL_STREAM, "data", text))
+        for stream in targets:
+            await self.deliver(stream, text)
+
+    async def deliver(self, stream, text):
+        if stream.credit > 0 and not stream.pending:
+            stream.credit -= 1
+            await self.send_text(self.frame(stream.id, "data", text))
+            return
+        stream.pending.append(text)
+        if len(stream.pending) > settings.MUX_STREAM_BUFFER:
+            await self.close(stream, "overflow")
+
+    async def flush(self, stream):
+        while stream.credit > 0 and stream.pending:
+            stream.credit -= 1
+            await self.send_text(self.frame(stream.id, "data", stream.pending.popleft()))
+
+    async def close(self, stream, reason):
+        logger.warning(f"Closing {stream.kind} stream {stream.id}: {reason}")
+        self.streams.pop(stream.id, None)
+        stream.pending.clear()
+        await self.send_text(self.frame(stream.id, "close", reason=reason))
+
+    async def control_error(self, message):
+        await self.send_text(self.frame(CONTROL_STREAM, "error", message=message))
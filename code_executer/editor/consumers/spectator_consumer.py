@@ -0,0 +1,71 @@
+import json
+import time
+import logging
+from channels.generic.websocket import AsyncWebsocketConsumer
+from django.conf import settings
+from django.utils import timezone
+from editor.models import CodeRoom
+from editor.services.db_executor import db_sync_to_async
+from editor.services.spectators import join_spectator, leave_spectator
+
+logger = logging.getLogger(__name__)
+
+class SpectatorConsumer(AsyncWebsocketConsumer):
+    """Read-only viewer of a room whose creator allows spectators.
+
+    Spectators never write to the database, join presence or the room
+    group themselves; the room's shared broadcaster sends them a snapshot
+    on connect and then throttled delta frames.
+    """
+
+    async def connect(self):
+        """Handles WebSocket connection."""
+        self.room_id = self.scope["url_route"]["kwargs"]["room_id"]
+        self.broadcaster = None
+        if not await self.room_is_public():
+            await self.close(code=4003)
+            return
+
+        await self.accept()
+        self.last_snapshot = time.monotonic()
+        try:
+            self.broadcaster = await join_spectator(self.room_id, self, self.channel_layer)
+        except Exception as e:
+            logger.error(f"Spectator connection error for room {self.room_id}: {str(e)}")
+            await self.close(code=1011)
+
+    async def disconnect(self, close_code):
+        """Handles WebSocket disconnection."""
+        if self.broadcaster is not None:
+            await leave_spectator(self.room_id, self)
+
+    async def receive(self, text_data):
+        """Spectators may only ask for a fresh snapshot, at most once per SPECTATOR_SNAPSHOT_INTERVAL."""
+        try:
+            data = json.loads(text_data)
+        except json.JSONDecodeError:
+            await self.send_error("Invalid JSON format")
+            return
+
+        if data.get("type") != "request_snapshot":
+            await self.send_error("Spectators are read-only")
+        elif self.broadcaster is not None:
+            now = time.monotonic()
+            if now - self.last_snapshot < settings.SPECTATOR_SNAPSHOT_INTERVAL:
+                await self.send_error("Snapshot requested too soon")
+                return
+            self.last_snapshot = now
+            await self.send(text_data=self.broadcaster.snapshot())
+
+    async def send_error(self, message):
+        """Sends error message to client."""
+        await self.send(text_data=json.dumps({
+            "type": "error",
+            "message": message,
+            "timestamp": timezone.now().isoformat()
+        }))
+
+    @db_sync_to_async
+    def room_is_public(self):
+        """Checks that the room exists and its creator has opted in to spectators."""
+        return CodeRoom.objects.filter(room_id=self.room_id, allow_spectators=True).exists()
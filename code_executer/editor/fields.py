@@ -0,0 +1,87 @@
+import zlib
+
+from django.conf import settings
+from django.db import models
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Stored values start with a NUL byte and a codec id. Anything else is a
+# legacy row written as plain text before the column was compressed.
+MAGIC = b'\x00'
+RAW = b'r'
+ZLIB = b'z'
+ZSTD = b's'
+
+CODECS = {'none': RAW, 'zlib': ZLIB, 'zstd': ZSTD}
+
+
+def default_codec():
+    """Returns the codec id selected by settings.TEXT_COMPRESSION."""
+    name = getattr(settings, 'TEXT_COMPRESSION', 'auto')
+    if name == 'auto':
+        return ZSTD if zstandard is not None else ZLIB
+    if name == 'zstd' and zstandard is None:
+        raise ImportError("TEXT_COMPRESSION = 'zstd' requires the zstandard package")
+    return CODECS[name]
+
+
+def compress_text(text, codec=None):
+    """Encodes text as header + payload, leaving short values uncompressed."""
+    data = text.encode('utf-8')
+    codec = codec or default_codec()
+    if codec == RAW or len(data) < settings.TEXT_COMPRESSION_MIN_SIZE:
+        return MAGIC + RAW + data
+    if codec == ZSTD:
+        payload = zstandard.ZstdCompressor(level=settings.TEXT_COMPRESSION_LEVEL).compress(data)
+    else:
+        payload = zlib.compress(data, settings.TEXT_COMPRESSION_LEVEL)
+    if len(payload) >= len(data):
+        return MAGIC + RAW + data
+    return MAGIC + codec + payload
+
+
+def decompress_text(value):
+    """Decodes a stored value, whether framed or a legacy plain-text row."""
+    if value is None or isinstance(value, str):
+        return value
+    value = bytes(value)
+    if value[:1] != MAGIC:
+        return value.decode('utf-8')
+    codec, payload = value[1:2], value[2:]
+    if codec == RAW:
+        return payload.decode('utf-8')
+    if codec == ZLIB:
+        return zlib.decompress(payload).decode('utf-8')
+    if codec == ZSTD:
+        if zstandard is None:
+            raise ImportError("Reading zstd-compressed text requires the zstandard package")
+        return zstandard.ZstdDecompressor().decompress(payload).decode('utf-8')
+    raise ValueError(f"Unknown text codec {codec!r}")
+
+
+def is_compressed(value):
+    """Whether a raw column value is already in the framed format."""
+    return value is not None and not isinstance(value, str) and bytes(value[:1]) == MAGIC
+
+
+class CompressedTextField(models.TextField):
+    """A TextField stored as a compressed BLOB.
+
+    Python code sees plain strings. Because values are compressed,
+    database-side text lookups such as ``icontains`` do not work on it.
+    """
+
+    def get_internal_type(self):
+        return 'BinaryField'
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        value = super().get_db_prep_value(value, connection, prepared)
+        if value is None:
+            return None
+        return connection.Database.Binary(compress_text(value))
+
+    def from_db_value(self, value, expression, connection):
+        return decompress_text(value)
@@ -0,0 +1,355 @@
+import json
+import mmap
+import os
+import re
+import shutil
+import tempfile
+import threading
+import logging
+from datetime import datetime, timedelta, timezone
+from pathlib import Path, PurePosixPath
+
+from django.conf import settings
+
+from .models import CodeRoom, FileEntry
+from .services.search_index import get_search_index
+from .services.symbol_index import get_symbol_index
+
+logger = logging.getLogger(__name__)
+
+TEMP_PREFIX = '.tmp-'
+# Each file's mtime as of the last sync, in the project root
+MANIFEST = '.sync-manifest.json'
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+FILE_TYPES = {
+    '.py': 'python',
+    '.js': 'javascript',
+    '.html': 'html',
+    '.css': 'css',
+    '.java': 'java',
+    '.cpp': 'cpp',
+}
+
+# Listing cache per project root: (directory mtimes, files, entries)
+_listings = {}
+_listings_lock = threading.Lock()
+
+
+def mtime_micros(value):
+    """A datetime or st_mtime_ns value as integer microseconds since the epoch."""
+    if isinstance(value, datetime):
+        return (value - EPOCH) // timedelta(microseconds=1)
+    return value // 1000
+
+
+class ProjectFileManager:
+    """A room's files as a project directory under PROJECT_FILES_ROOT.
+
+    Writes through the manager go to the database first and are then
+    written to disk with a temp file and rename. Edits made over the
+    WebSocket only touch the database and edits made on disk only touch
+    the directory; sync() reconciles the two before each listing or read.
+    Every file's mtime is set to its FileEntry.updated_at when written,
+    which is how changes on either side are spotted.
+    """
+
+    def __init__(self, room_id, user=None):
+        if not re.fullmatch(r'[\w-]+', str(room_id)):
+            raise ValueError(f'Invalid room id {room_id}')
+        self.room_id = room_id
+        self.user = user
+        self.room_pk = CodeRoom.objects.values_list('pk', flat=True).get(room_id=room_id)
+        self.root = Path(settings.PROJECT_FILES_ROOT, room_id).resolve()
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def resolve(self, filename):
+        """Maps a project-relative filename to a path inside the project root."""
+        if not filename or '\x00' in filename or '\\' in filename:
+            raise ValueError(f'Invalid filename {filename!r}')
+        relative = PurePosixPath(filename)
+        if relative.is_absolute() or any(
+            part in ('', '.', '..', MANIFEST) or part.startswith(TEMP_PREFIX) for part in relative.parts
+        ):
+            raise ValueError(f'Invalid filename {filename!r}')
+
+        path = self.root.joinpath(*relative.parts)
+        # Catches symlinks pointing out of the project
+        if not path.resolve().is_relative_to(self.root):
+            raise ValueError(f'Invalid filename {filename!r}')
+        return path
+
+    def get_file_type(self, path):
+        return FILE_TYPES.get(Path(path).suffix.lower(), 'text')
+
+    def create_file(self, filename, content=''):
+        """Creates a new file and returns its project-relative path."""
+        path = self.resolve(filename)
+        if FileEntry.objects.filter(room_id=self.room_pk, filename=filename).exists():
+            raise FileExistsError(f'File {filename} already exists')
+        self.update_file(filename, content)
+        return path.relative_to(self.root).as_posix()
+
+    def update_file(self, filename, content):
+        """Writes a file's content to the database and then to disk."""
+        path = self.resolve(filename)
+        updated_at = FileEntry.store(self.room_pk, filename, content, self.user)
+        if updated_at is None:
+            # Unchanged; only rewrite the disk copy if it is missing or stale
+            updated_at = FileEntry.objects.filter(
+                room_id=self.room_pk, filename=filename
+            ).values_list('updated_at', flat=True).get()
+            if self._disk_mtime(path) == mtime_micros(updated_at):
+                return
+        else:
+            self._update_indexes(filename, content, updated_at)
+        self._write(path, content, updated_at)
+
+    def delete_file(self, filename):
+        path = self.resolve(filename)
+        deleted, _ = FileEntry.objects.filter(room_id=self.room_pk, filename=filename).delete()
+        existed = path.exists()
+        if existed:
+            path.unlink()
+            self._prune_empty_dirs(path.parent)
+        if not deleted and not existed:
+            raise FileNotFoundError(filename)
+        self._remove_from_indexes(filename)
+
+    def read_file(self, filename, sync=True):
+        """Returns a file's text, mapping large files instead of reading them.
+
+        Pass ``sync=False`` when the file was just synced.
+        """
+        path = self.resolve(filename)
+        if sync:
+            self.sync([filename])
+        if not path.is_file():
+            raise FileNotFoundError(filename)
+
+        with open(path, 'rb') as handle:
+            size = os.fstat(handle.fileno()).st_size
+            if size < settings.PROJECT_FILE_MMAP_THRESHOLD:
+                return handle.read().decode('utf-8')
+            with mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                return str(mapped, 'utf-8')
+
+    def list_files(self, sync=True):
+        """Returns every file and directory in the project as {name, type, size, modified}."""
+        if sync:
+            self.sync()
+        return [dict(entry) for entry in self._scan()[1]]
+
+    def sync(self, filenames=None):
+        """Reconciles the project directory with FileEntry in both directions.
+
+        The manifest holds each file's mtime as of the last sync, which tells
+        which side changed since. A side that changed wins; if both did, the
+        newer one wins and the conflict is logged. A file gone from one side
+        since the last sync is deleted from the other, and a file never
+        synced is copied to the side missing it. Without a manifest (a
+        directory from before two-way sync) the files on disk count as
+        synced as they are, so the database wins.
+        """
+        rows = FileEntry.objects.filter(room_id=self.room_pk)
+        if filenames is not None:
+            rows = rows.filter(filename__in=filenames)
+        stored = {name: mtime_micros(updated_at) for name, updated_at in rows.values_list('filename', 'updated_at')}
+        on_disk = self._scan()[0]
+        manifest = self._read_manifest()
+        bootstrap = manifest is None
+        if bootstrap:
+            manifest = dict(on_disk)
+        if filenames is not None:
+            on_disk = {name: mtime for name, mtime in on_disk.items() if name in filenames}
+
+        # Files identical on both sides once this sync is done
+        in_sync = {}
+        to_write, to_import, delete_stored, delete_disk = [], [], [], []
+        for name in set(stored) | set(on_disk):
+            db_mtime, disk_mtime, last = stored.get(name), on_disk.get(name), manifest.get(name)
+            if db_mtime == disk_mtime:
+                in_sync[name] = db_mtime
+                continue
+            db_changed, disk_changed = db_mtime != last, disk_mtime != last
+            if db_changed and disk_changed and db_mtime is not None and disk_mtime is not None:
+                logger.warning(f"{name!r} in room {self.room_id} changed in the database and on disk; keeping the newer")
+                disk_changed = disk_mtime > db_mtime
+            if disk_changed:
+                (to_import if disk_mtime is not None else delete_stored).append(name)
+            else:
+                (to_write if db_mtime is not None else delete_disk).append(name)
+
+        if to_write:
+            for filename, content, updated_at in FileEntry.objects.filter(
+                room_id=self.room_pk, filename__in=to_write
+            ).values_list('filename', 'blob__content', 'updated_at'):
+                try:
+                    self._write(self.resolve(filename), content, updated_at)
+                except ValueError:
+                    logger.warning(f"Skipping unsafe filename {filename!r} in room {self.room_id}")
+                    continue
+                in_sync[filename] = mtime_micros(updated_at)
+        for filename in to_import:
+            updated_at = self._import(filename)
+            if updated_at is not None:
+                in_sync[filename] = mtime_micros(updated_at)
+        if delete_stored:
+            FileEntry.objects.filter(room_id=self.room_pk, filename__in=delete_stored).delete()
+            for filename in delete_stored:
+                self._remove_from_indexes(filename)
+        for filename in delete_disk:
+            path = self.root.joinpath(*PurePosixPath(filename).parts)
+            path.unlink(missing_ok=True)
+            self._prune_empty_dirs(path.parent)
+
+        current = {
+            name: mtime for name, mtime in manifest.items()
+            if filenames is not None and name not in filenames
+        }
+        current.update(in_sync)
+        if bootstrap or current != manifest:
+            self._write_manifest(current)
+
+    def _import(self, filename):
+        """Stores a file edited on disk in FileEntry; returns its updated_at, or None if skipped."""
+        try:
+            path = self.resolve(filename)
+            content = path.read_bytes().decode('utf-8')
+        except (ValueError, UnicodeDecodeError) as e:
+            logger.warning(f"Not importing {filename!r} in room {self.room_id}: {str(e)}")
+            return None
+        except FileNotFoundError:
+            return None
+
+        updated_at = FileEntry.store(self.room_pk, filename, content, self.user)
+        if updated_at is None:
+            # Same text as stored; only the mtime moved
+            updated_at = FileEntry.objects.filter(
+                room_id=self.room_pk, filename=filename
+            ).values_list('updated_at', flat=True).get()
+        else:
+            self._update_indexes(filename, content, updated_at)
+        # Restamp so both sides agree on the version
+        self._write(path, content, updated_at)
+        return updated_at
+
+    def _read_manifest(self):
+        try:
+            with open(self.root / MANIFEST) as handle:
+                return json.load(handle)
+        except FileNotFoundError:
+            return None
+        except ValueError:
+            logger.warning(f"Ignoring a corrupt sync manifest in room {self.room_id}")
+            return None
+
+    def _write_manifest(self, manifest):
+        fd, temp_path = tempfile.mkstemp(dir=self.root, prefix=TEMP_PREFIX)
+        try:
+            with os.fdopen(fd, 'w') as handle:
+                json.dump(manifest, handle)
+            os.replace(temp_path, self.root / MANIFEST)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+
+    def _write(self, path, content, updated_at):
+        """Atomically replaces ``path`` and stamps it with ``updated_at``."""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=path.parent, prefix=TEMP_PREFIX)
+        try:
+            with os.fdopen(fd, 'wb') as handle:
+                handle.write(content.encode('utf-8'))
+                handle.flush()
+                os.fsync(handle.fileno())
+            stamp = mtime_micros(updated_at) * 1000
+            os.utime(temp_path, ns=(stamp, stamp))
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+
+    def _disk_mtime(self, path):
+        try:
+            return mtime_micros(path.stat().st_mtime_ns)
+        except FileNotFoundError:
+            return None
+
+    def _prune_empty_dirs(self, directory):
+        while directory != self.root and directory.is_relative_to(self.root):
+            try:
+                directory.rmdir()
+            except OSError:
+                break
+            directory = directory.parent
+
+    def _scan(self):
+        """Returns ({filename: mtime}, entries), rescanning only if a directory changed.
+
+        Files are always replaced by rename, so any change to a file also
+        changes its directory's mtime.
+        """
+        root = str(self.root)
+        with _listings_lock:
+            cached = _listings.get(root)
+        if cached is not None:
+            directories, files, entries = cached
+            try:
+                if all(os.stat(directory).st_mtime_ns == mtime for directory, mtime in directories.items()):
+                    return files, entries
+            except FileNotFoundError:
+                pass
+
+        directories, files, entries = {}, {}, []
+        pending = [root]
+        while pending:
+            directory = pending.pop()
+            directories[directory] = os.stat(directory).st_mtime_ns
+            with os.scandir(directory) as scan:
+                for item in scan:
+                    if item.name.startswith(TEMP_PREFIX) or (directory == root and item.name == MANIFEST):
+                        continue
+                    name = Path(item.path).relative_to(self.root).as_posix()
+                    stat = item.stat(follow_symlinks=False)
+                    if item.is_dir(follow_symlinks=False):
+                        pending.append(item.path)
+                        entries.append({'name': name, 'type': 'directory', 'size': 0,
+                                        'modified': datetime.fromtimestamp(stat.st_mtime, timezone.utc).isoformat()})
+                    elif item.is_file(follow_symlinks=False):
+                        files[name] = mtime_micros(stat.st_mtime_ns)
+                        entries.append({'name': name, 'type': self.get_file_type(item.name),
+                                        'size': stat.st_size,
+                                        'modified': datetime.fromtimestamp(stat.st_mtime, timezone.utc).isoformat()})
+        entries.sort(key=lambda entry: entry['name'])
+
+        with _listings_lock:
+            _listings[root] = (directories, files, entries)
+        return files, entries
+
+    def _remove_from_indexes(self, filename):
+        search_index = get_search_index(self.room_id)
+        if search_index.built:
+            search_index.remove_file(filename)
+        symbol_index = get_symbol_index(self.room_id)
+        if symbol_index.built:
+            symbol_index.remove_file(filename)
+
+    def _update_indexes(self, filename, content, updated_at):
+        search_index = get_search_index(self.room_id)
+        if search_index.built:
+            search_index.update_file(filename, content, updated_at)
+        symbol_index = get_symbol_index(self.room_id)
+        if symbol_index.built:
+            symbol_index.update_file(filename, content)
+
+    @staticmethod
+    def remove_project(room_id):
+        """Deletes a room's project directory (after the room itself is deleted)."""
+        root = Path(settings.PROJECT_FILES_ROOT, str(room_id))
+        with _listings_lock:
+            _listings.pop(str(root.resolve()), None)
+        if re.fullmatch(r'[\w-]+', str(room_id)) and root.is_dir():
+            shutil.rmtree(root, ignore_errors=True)
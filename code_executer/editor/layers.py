@@ -0,0 +1,315 @@
+import time
+import uuid
+import random
+import string
+import asyncio
+import logging
+from copy import deepcopy
+
+from channels.exceptions import ChannelFull
+from channels.layers import BaseChannelLayer
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+class InProcessBus:
+    """Pub/sub between channel layers in the same process.
+
+    Stands in for Redis in tests and benchmarks: every layer built with the
+    same bus behaves like a separate node. ``published`` counts publishes.
+    """
+
+    def __init__(self):
+        self._subscribers = {}  # topic -> {subscriber id: callback}
+        self.published = 0
+
+    async def publish(self, topic, envelope):
+        self.published += 1
+        for callback in list(self._subscribers.get(topic, {}).values()):
+            callback(topic, deepcopy(envelope))
+
+    async def subscribe(self, topic, callback):
+        self._subscribers.setdefault(topic, {})[id(callback.__self__)] = callback
+
+    async def unsubscribe(self, topic, callback):
+        subscribers = self._subscribers.get(topic, {})
+        subscribers.pop(id(callback.__self__), None)
+        if not subscribers:
+            self._subscribers.pop(topic, None)
+
+    async def close(self):
+        pass
+
+
+class RedisBus:
+    """Redis pub/sub for one channel layer, with one subscriber connection per node.
+
+    The connection belongs to the event loop that first uses it.
+    """
+
+    def __init__(self, url='redis://127.0.0.1:6379/0'):
+        try:
+            import msgpack
+            import redis.asyncio as aioredis
+        except ImportError:
+            raise ImproperlyConfigured("RedisBus requires the 'redis' and 'msgpack' packages")
+        self._msgpack = msgpack
+        self._client = aioredis.Redis.from_url(url)
+        self._pubsub = self._client.pubsub()
+        self._callbacks = {}
+        self._listener = None
+        self.published = 0
+
+    async def publish(self, topic, envelope):
+        self.published += 1
+        await self._client.publish(topic, self._msgpack.packb(envelope, use_bin_type=True))
+
+    async def subscribe(self, topic, callback):
+        self._callbacks[topic] = callback
+        await self._pubsub.subscribe(topic)
+        if self._listener is None:
+            self._listener = asyncio.ensure_future(self._listen())
+
+    async def unsubscribe(self, topic, callback):
+        self._callbacks.pop(topic, None)
+        await self._pubsub.unsubscribe(topic)
+
+    async def _listen(self):
+        while True:
+            try:
+                message = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Channel layer subscriber failed: {str(e)}")
+                await asyncio.sleep(1)
+                continue
+            if message is None:
+                continue
+            topic = message['channel'].decode('utf-8')
+            callback = self._callbacks.get(topic)
+            if callback is not None:
+                callback(topic, self._msgpack.unpackb(message['data'], raw=False))
+
+    async def close(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            self._listener = None
+        await self._pubsub.aclose()
+        await self._client.aclose()
+
+
+class NodeFanoutChannelLayer(BaseChannelLayer):
+    """Channel layer that crosses the network once per node, not once per member.
+
+    Group membership is kept in memory on the node that owns the member
+    channel, and a node subscribes to a group's pub/sub topic while it has
+    local members. ``group_send`` is a single publish; each subscribed node
+    then fans the event out to its own consumers in memory. Process-specific
+    channels (``new_channel()``) are delivered in memory when local and
+    through the owning node's topic otherwise.
+
+    Like the Redis pub/sub layer, messages are not persisted: a message for
+    a normal (non-specific) channel reaches only nodes receiving on it, and a
+    node that is down misses its messages.
+    """
+
+    extensions = ['groups', 'flush']
+
+    def __init__(self, url='redis://127.0.0.1:6379/0', prefix='fanout', expiry=60, group_expiry=86400,
+                 capacity=100, channel_capacity=None, bus=None, **kwargs):
+        super().__init__(expiry=expiry, capacity=capacity, **kwargs)
+        self.channel_capacity = self.compile_capacities(channel_capacity or {})
+        self.group_expiry = group_expiry
+        self.prefix = prefix
+        self.node = uuid.uuid4().hex[:12]
+        if bus is None:
+            bus = RedisBus(url)
+        elif isinstance(bus, str):
+            # A dotted path, e.g. 'editor.layers.InProcessBus' in a TEST_CONFIG
+            bus = import_string(bus)()
+        self.bus = bus
+        self.channels = {}  # local channel -> queue of (expires_at, message)
+        self.groups = {}  # group -> {channel: joined_at}, local channels only
+        self._topics = set()
+
+    # Topics
+
+    def _group_topic(self, group):
+        return f"{self.prefix}:group:{group}"
+
+    def _node_topic(self, node):
+        return f"{self.prefix}:node:{node}"
+
+    def _channel_topic(self, channel):
+        return f"{self.prefix}:channel:{channel}"
+
+    def _channel_node(self, channel):
+        """The node id of a process-specific channel, or None for a normal channel."""
+        if '!' not in channel:
+            return None
+        return self.non_local_name(channel)[:-1].rsplit('.', 1)[-1]
+
+    def _is_local(self, channel):
+        return self._channel_node(channel) == self.node
+
+    async def _subscribe(self, topic):
+        if topic not in self._topics:
+            self._topics.add(topic)
+            await self.bus.subscribe(topic, self._on_message)
+
+    async def _unsubscribe(self, topic):
+        if topic in self._topics:
+            self._topics.discard(topic)
+            await self.bus.unsubscribe(topic, self._on_message)
+
+    def _on_message(self, topic, envelope):
+        """Handles a message from the bus."""
+        if envelope.get('origin') == self.node:
+            # Already delivered locally when it was sent
+            return
+        kind = envelope['kind']
+        if kind == 'group':
+            self._fan_out(envelope['group'], envelope['message'])
+        elif kind == 'group_add':
+            self._add_member(envelope['group'], envelope['channel'])
+            asyncio.ensure_future(self._subscribe(self._group_topic(envelope['group'])))
+        elif kind == 'group_discard':
+            asyncio.ensure_future(self._discard_member(envelope['group'], envelope['channel']))
+        else:
+            try:
+                self._deliver(envelope['channel'], envelope['message'])
+            except ChannelFull:
+                logger.warning(f"Dropped message for full channel {envelope['channel']}")
+
+    # Local delivery
+
+    def _queue(self, channel):
+        queue = self.channels.get(channel)
+        if queue is None:
+            queue = self.channels[channel] = asyncio.Queue(maxsize=self.get_capacity(channel))
+        return queue
+
+    def _deliver(self, channel, message):
+        try:
+            self._queue(channel).put_nowait((time.time() + self.expiry, message))
+        except asyncio.QueueFull:
+            raise ChannelFull(channel)
+
+    def _fan_out(self, group, message):
+        for channel in list(self.groups.get(group, ())):
+            try:
+                self._deliver(channel, deepcopy(message))
+            except ChannelFull:
+                pass
+
+    def _add_member(self, group, channel):
+        self.groups.setdefault(group, {})[channel] = time.time()
+
+    async def _discard_member(self, group, channel):
+        members = self.groups.get(group)
+        if members:
+            members.pop(channel, None)
+            if not members:
+                self.groups.pop(group, None)
+                await self._unsubscribe(self._group_topic(group))
+
+    async def _clean_expired(self):
+        """Drops expired messages (and their channels' group memberships) and expired memberships."""
+        now = time.time()
+        for channel, queue in list(self.channels.items()):
+            while not queue.empty() and queue._queue[0][0] < now:
+                queue.get_nowait()
+                for members in self.groups.values():
+                    members.pop(channel, None)
+                if queue.empty():
+                    self.channels.pop(channel, None)
+
+        timeout = now - self.group_expiry
+        for group, members in list(self.groups.items()):
+            for channel, joined_at in list(members.items()):
+                if joined_at < timeout:
+                    members.pop(channel, None)
+            if not members:
+                self.groups.pop(group, None)
+                await self._unsubscribe(self._group_topic(group))
+
+    # Channel layer API
+
+    async def send(self, channel, message):
+        """Sends a message to a channel on this node or any other."""
+        assert isinstance(message, dict), 'message is not a dict'
+        assert self.valid_channel_name(channel), 'Channel name not valid'
+        assert '__asgi_channel__' not in message
+
+        if self._is_local(channel):
+            self._deliver(channel, deepcopy(message))
+            return
+        node = self._channel_node(channel)
+        topic = self._channel_topic(channel) if node is None else self._node_topic(node)
+        await self.bus.publish(topic, {'kind': 'send', 'channel': channel, 'message': message})
+
+    async def receive(self, channel):
+        """Returns the next message on a channel, waiting for one to arrive."""
+        assert self.valid_channel_name(channel), 'Channel name not valid'
+        await self._clean_expired()
+        if self._channel_node(channel) is None:
+            await self._subscribe(self._channel_topic(channel))
+
+        queue = self._queue(channel)
+        try:
+            _, message = await queue.get()
+        finally:
+            if queue.empty() and self.channels.get(channel) is queue:
+                self.channels.pop(channel, None)
+        return message
+
+    async def new_channel(self, prefix='specific.'):
+        """Returns a new process-specific channel name owned by this node."""
+        await self._subscribe(self._node_topic(self.node))
+        suffix = ''.join(random.choice(string.ascii_letters) for _ in range(12))
+        return f"{prefix}.{self.node}!{suffix}"
+
+    async def flush(self):
+        for topic in list(self._topics):
+            await self._unsubscribe(topic)
+        self.channels = {}
+        self.groups = {}
+
+    async def close(self):
+        await self.flush()
+        await self.bus.close()
+
+    # Groups extension
+
+    async def group_add(self, group, channel):
+        assert self.valid_group_name(group), 'Group name not valid'
+        assert self.valid_channel_name(channel), 'Channel name not valid'
+        node = self._channel_node(channel)
+        if node is not None and node != self.node:
+            # Membership lives with the node that owns the channel
+            await self.bus.publish(self._node_topic(node), {'kind': 'group_add', 'group': group, 'channel': channel})
+            return
+        self._add_member(group, channel)
+        await self._subscribe(self._group_topic(group))
+
+    async def group_discard(self, group, channel):
+        assert self.valid_channel_name(channel), 'Invalid channel name'
+        assert self.valid_group_name(group), 'Invalid group name'
+        node = self._channel_node(channel)
+        if node is not None and node != self.node:
+            await self.bus.publish(self._node_topic(node), {'kind': 'group_discard', 'group': group, 'channel': channel})
+            return
+        await self._discard_member(group, channel)
+
+    async def group_send(self, group, message):
+        """Delivers to local members directly and publishes once for every other node."""
+        assert isinstance(message, dict), 'Message is not a dict'
+        assert self.valid_group_name(group), 'Invalid group name'
+        await self._clean_expired()
+        self._fan_out(group, message)
+        await self.bus.publish(self._group_topic(group), {
+            'kind': 'group', 'origin': self.node, 'group': group, 'message': message
+        })
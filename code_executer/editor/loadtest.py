@@ -0,0 +1,343 @@
+"""In-process load-testing helpers for the editor's WebSocket consumer.
+
+Simulated clients talk to the ASGI application through
+``channels.testing.WebsocketCommunicator`` and time how long it takes for
+their own messages to come back through the room group.
+"""
+import asyncio
+import itertools
+import json
+import os
+import tempfile
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection
+from django.db.backends.signals import connection_created
+
+from editor.services.tracing import percentile
+
+# One create/update/rename/delete cycle of file churn
+FILE_CHURN = ('create', 'update', 'update', 'rename', 'delete')
+
+
+def summarize(samples):
+    """Returns p50/p90/p99/max in milliseconds for a list of second samples."""
+    return {
+        'count': len(samples),
+        'p50': round(percentile(samples, 0.5) * 1000, 3),
+        'p90': round(percentile(samples, 0.9) * 1000, 3),
+        'p99': round(percentile(samples, 0.99) * 1000, 3),
+        'max': round(max(samples) * 1000, 3) if samples else 0.0,
+    }
+
+
+def use_in_memory_channel_layer():
+    """Switches the default channel layer to the in-process implementation."""
+    from channels.layers import channel_layers
+
+    settings.CHANNEL_LAYERS = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+    channel_layers.backends.clear()
+
+
+@contextmanager
+def scratch_database():
+    """Runs the block against a throwaway copy of the schema.
+
+    SQLite gets a temporary file rather than Django's shared-cache in-memory
+    test database, whose table locks fail immediately under concurrent
+    writers instead of waiting like a real deployment would.
+    """
+    test_settings = settings.DATABASES['default'].setdefault('TEST', {})
+    previous_name = test_settings.get('NAME')
+    path = None
+    if connection.vendor == 'sqlite':
+        path = os.path.join(tempfile.mkdtemp(prefix='editor-loadtest-'), 'db.sqlite3')
+        test_settings['NAME'] = path
+
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        from editor.services.activity import get_activity_writer
+        from editor.services.db_executor import shutdown_db_executor, shutdown_write_queue
+
+        # Write out buffered activity and retire the threads holding
+        # connections before the tables disappear
+        get_activity_writer().flush()
+        shutdown_write_queue()
+        shutdown_db_executor()
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        test_settings['NAME'] = previous_name
+        if path and os.path.exists(path):
+            os.remove(path)
+
+
+@contextmanager
+def unthrottled():
+    """Lifts per-connection rate limits and the room editor cap for the block.
+
+    Simulated clients send far faster than people type, and benchmarks put
+    more of them in one room than ROOM_MAX_EDITORS allows.
+    """
+    previous = settings.WS_RATE_LIMITS, settings.ROOM_MAX_EDITORS
+    settings.WS_RATE_LIMITS, settings.ROOM_MAX_EDITORS = {}, 0
+    try:
+        yield
+    finally:
+        settings.WS_RATE_LIMITS, settings.ROOM_MAX_EDITORS = previous
+
+
+def websocket_application():
+    """Returns the WebSocket URL router without the auth middleware.
+
+    Simulated clients put their user straight into the scope.
+    """
+    from channels.routing import URLRouter
+    from editor.routing import websocket_urlpatterns
+
+    return URLRouter(websocket_urlpatterns)
+
+
+class SimulatedClient:
+    """One WebSocket connection that can time its own round trips.
+
+    Every outgoing message carries a unique marker. A reader task watches
+    the incoming frames and resolves the waiter for each marker when the
+    matching broadcast arrives, and reports each marker to ``tracker``
+    (see FanoutTracker) when one is set.
+    """
+
+    def __init__(self, application, room_id, user, tracker=None):
+        self.application = application
+        self.room_id = room_id
+        self.user = user
+        self.tracker = tracker
+        self.communicator = None
+        self.received = 0
+        self.close_code = None
+        self._waiters = {}
+        self._reader = None
+
+    @property
+    def connected(self):
+        return self.communicator is not None and self.close_code is None
+
+    async def connect(self, timeout=10):
+        from channels.testing import WebsocketCommunicator
+
+        self.close_code = None
+        self.communicator = WebsocketCommunicator(self.application, f'/ws/editor/{self.room_id}/')
+        self.communicator.scope['user'] = self.user
+        connected, _ = await self.communicator.connect(timeout=timeout)
+        if not connected:
+            self.communicator = None
+            raise ConnectionError(f'Could not connect to room {self.room_id}')
+        # Refusals (admission control, a full room) accept first and then
+        # close, so the first frame tells whether the connection was admitted
+        first = await self.communicator.receive_output(timeout=timeout)
+        if first['type'] == 'websocket.close':
+            self.communicator = None
+            raise ConnectionRefusedError(f"Room {self.room_id} refused the connection ({first.get('code')})")
+        self._handle(first)
+        self._reader = asyncio.ensure_future(self._read())
+
+    async def disconnect(self):
+        if self._reader is not None:
+            self._reader.cancel()
+            self._reader = None
+        if self.communicator is not None:
+            await self.communicator.disconnect()
+            self.communicator = None
+
+    async def _read(self):
+        while True:
+            try:
+                message = await self.communicator.receive_output(timeout=3600)
+            except asyncio.TimeoutError:
+                continue
+            if message['type'] == 'websocket.close':
+                self.close_code = message.get('code')
+                return
+            self._handle(message)
+
+    def _handle(self, message):
+        now = time.perf_counter()
+        self.received += 1
+        if message.get('text') is None:
+            return
+        marker = self.marker_of(json.loads(message['text']))
+        if not marker:
+            return
+        waiter = self._waiters.pop(marker, None)
+        if waiter is not None and not waiter.done():
+            waiter.set_result(now)
+        if self.tracker is not None:
+            self.tracker.arrived(marker, now)
+
+    @staticmethod
+    def marker_of(message):
+        """Extracts the marker a message carries, if any."""
+        message_type = message.get('type')
+        if message_type == 'chat_message':
+            return message.get('message')
+        if message_type == 'code_update':
+            return message.get('code', '').rsplit('#', 1)[-1]
+        if message_type == 'file_update':
+            return message.get('content', '').rsplit('#', 1)[-1]
+        if message_type == 'pong':
+            return message.get('id')
+        return None
+
+    def payload(self, kind, marker):
+        """Returns a message of ``kind`` carrying ``marker``."""
+        if kind == 'chat':
+            return {'type': 'chat_message', 'message': marker}
+        if kind == 'code':
+            return {'type': 'code_update', 'code': f'print("hello")\n#{marker}', 'language': 'python'}
+        if kind == 'file':
+            return {'type': 'file_update', 'action': 'update', 'filename': f'{self.user.username}.txt',
+                    'content': f'x = 1\n#{marker}'}
+        if kind == 'ping':
+            return {'type': 'ping', 'id': marker}
+        raise ValueError(f'Unknown message kind {kind}')
+
+    def churn_payload(self, step, marker):
+        """Returns the ``step``th file operation of this client's FILE_CHURN cycles."""
+        action = FILE_CHURN[step % len(FILE_CHURN)]
+        filename = f'{self.user.username}-{step // len(FILE_CHURN)}.txt'
+        renamed = filename.replace('.txt', '-renamed.txt')
+        payload = {'type': 'file_update', 'action': action, 'filename': filename, 'content': f'x = {step}\n#{marker}'}
+        if action == 'rename':
+            payload['newFilename'] = renamed
+        elif action == 'delete':
+            payload['filename'] = renamed
+        return payload
+
+    async def send(self, payload):
+        await self.communicator.send_json_to(payload)
+
+    async def round_trip(self, kind, timeout=30):
+        """Sends one message of ``kind`` and returns seconds until it is echoed back."""
+        marker = uuid.uuid4().hex
+        payload = self.payload(kind, marker)
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters[marker] = waiter
+        started = time.perf_counter()
+        await self.communicator.send_json_to(payload)
+        try:
+            finished = await asyncio.wait_for(waiter, timeout)
+        finally:
+            self._waiters.pop(marker, None)
+        return finished - started
+
+
+class FanoutTracker:
+    """Times each message from its send until every expected recipient has it.
+
+    Messages some recipient never gets (it disconnected, or the message was
+    refused) stay in ``pending``.
+    """
+
+    def __init__(self):
+        self.pending = {}  # marker -> [kind, sent, recipients still to receive it]
+        self.samples = []  # (kind, seconds)
+
+    def expect(self, marker, kind, recipients):
+        self.pending[marker] = [kind, time.perf_counter(), recipients]
+
+    def arrived(self, marker, now):
+        entry = self.pending.get(marker)
+        if entry is None:
+            return
+        entry[2] -= 1
+        if entry[2] <= 0:
+            del self.pending[marker]
+            self.samples.append((entry[0], now - entry[1]))
+
+
+class QueryCounter:
+    """Counts queries on this thread's connection and every one opened while it is installed.
+
+    Consumer queries run on pool and writer threads, each with its own
+    connection, which a per-connection capture cannot see. The PRAGMAs
+    run when a connection opens (editor.sqlite) and transaction control
+    statements are not counted.
+    """
+
+    SKIPPED = ('PRAGMA', 'BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT', 'RELEASE')
+
+    def __init__(self):
+        self.queries = 0
+        self.active = False
+
+    def __call__(self, execute, sql, params, many, context):
+        if self.active and not sql.startswith(self.SKIPPED):
+            self.queries += 1
+        return execute(sql, params, many, context)
+
+    def _install(self, sender, connection, **kwargs):
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+    @contextmanager
+    def installed(self):
+        self.active = True
+        self._install(None, connection)
+        connection_created.connect(self._install)
+        try:
+            yield self
+        finally:
+            self.active = False
+            connection_created.disconnect(self._install)
+
+
+def seed_rooms(clients, rooms, prefix='loadtest'):
+    """Creates ``rooms`` rooms and ``clients`` users spread round-robin over them.
+
+    Returns (users, room_ids) in the order clients should connect.
+    """
+    from django.contrib.auth.models import User
+    from editor.models import CodeRoom, UserSession
+
+    owner = User.objects.create_user(f'{prefix}-owner')
+    rooms = [CodeRoom.objects.create(room_id=f'{prefix}{index}', created_by=owner) for index in range(rooms)]
+    users = [User.objects.create_user(f'{prefix}-{index}') for index in range(clients)]
+    UserSession.objects.bulk_create(
+        UserSession(user=user, room=room) for user, room in zip(users, itertools.cycle(rooms))
+    )
+    return users, [room.room_id for room in itertools.islice(itertools.cycle(rooms), clients)]
+
+
+async def connect_clients(users, room_ids):
+    """Connects one SimulatedClient per (user, room_id) pair."""
+    application = websocket_application()
+    clients = [SimulatedClient(application, room_id, user) for user, room_id in zip(users, room_ids)]
+    await asyncio.gather(*(client.connect() for client in clients))
+    return clients
+
+
+async def run_clients(clients, messages, kinds=('code', 'chat', 'code', 'file'), timeout=30):
+    """Has every client send ``messages`` round trips concurrently.
+
+    Each client cycles through ``kinds`` from a different offset so the mix
+    is spread evenly. Returns ([(kind, seconds)], [(username, kind, error)],
+    elapsed seconds).
+    """
+    samples = []
+    errors = []
+
+    async def drive(client, offset):
+        sequence = itertools.islice(itertools.cycle(kinds), offset, None)
+        for kind in itertools.islice(sequence, messages):
+            try:
+                samples.append((kind, await client.round_trip(kind, timeout=timeout)))
+            except Exception as e:
+                errors.append((client.user.username, kind, e))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(drive(client, index) for index, client in enumerate(clients)))
+    return samples, errors, time.perf_counter() - started
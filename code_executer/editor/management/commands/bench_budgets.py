@@ -0,0 +1,339 @@
+import os
+import json
+import time
+import asyncio
+import itertools
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import Client
+
+from editor.loadtest import (
+    QueryCounter, scratch_database, summarize, unthrottled, use_in_memory_channel_layer, websocket_application
+)
+from editor.models import Blob, ChatMessage, CodeRoom, CodeSession, FileEntry, UserSession
+
+HOT_ROOM = 'bench0'
+
+# Most queries one call may run once warmed up. Views count the session and
+# user lookups of the authentication middleware.
+BUDGETS = {
+    'view:dashboard': 4,
+    'view:editor_view': 7,
+    'view:room_details': 4,
+    'view:save_code': 6,
+    'view:update_user_count': 2,
+    'ws:connect': 4,
+    'ws:request_latest': 2,
+    'ws:chat_message': 1,
+    'ws:code_update': 4,
+    'ws:file_update create': 4,
+    'ws:file_update update': 4,
+    'ws:file_update rename': 2,
+    'ws:file_update delete': 1,
+    'ws:goto_definition': 0,
+    'ws:workspace_symbols': 0,
+    'ws:request_diagnostics': 1,
+}
+
+SAMPLE_MODULE = '''import os
+
+from helpers import helper_{n}
+
+
+class Service{n}:
+    def run(self):
+        return helper_{n}(os.getcwd())
+
+
+def main_{n}():
+    return Service{n}().run()
+'''
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs the key views and every EditorConsumer handler against a seeded dataset, "
+        "fails if any exceeds its query budget and compares timings with a JSON baseline"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rooms', type=int, default=1000, help='Rooms to seed')
+        parser.add_argument('--code-sessions', type=int, default=100000, help='CodeSession rows to seed')
+        parser.add_argument('--chat-messages', type=int, default=1000000, help='ChatMessage rows to seed')
+        parser.add_argument('--scale', type=float, default=1.0,
+                            help='Multiplies every dataset size, e.g. 0.01 for a quick run')
+        parser.add_argument('--iterations', type=int, default=20, help='Timed calls per case')
+        parser.add_argument('--baseline', default=None,
+                            help='JSON file of earlier results to compare with; written if it does not exist')
+        parser.add_argument('--update-baseline', action='store_true', help='Overwrite the baseline with this run')
+        parser.add_argument('--tolerance', type=float, default=0.5,
+                            help='Fraction a case p50 may grow over the baseline before it counts as slower')
+        parser.add_argument('--fail-on-slowdown', action='store_true', help='Exit non-zero on slowdowns too')
+
+    def handle(self, *args, **options):
+        sizes = {
+            'rooms': max(2, int(options['rooms'] * options['scale'])),
+            'code_sessions': int(options['code_sessions'] * options['scale']),
+            'chat_messages': int(options['chat_messages'] * options['scale']),
+        }
+        use_in_memory_channel_layer()
+        # Keep background flushes out of the per-call query counts
+        flush_interval = settings.ACTIVITY_FLUSH_INTERVAL
+        settings.ACTIVITY_FLUSH_INTERVAL = 3600
+        try:
+            with unthrottled(), scratch_database():
+                started = time.perf_counter()
+                user = self.seed(**sizes)
+                self.stdout.write(
+                    f"Seeded {sizes['rooms']} rooms, {sizes['code_sessions']} code sessions and "
+                    f"{sizes['chat_messages']} chat messages in {time.perf_counter() - started:.1f}s"
+                )
+                results = self.run_views(user, options['iterations'])
+                results.update(asyncio.run(self.run_consumer(user, options['iterations'])))
+        finally:
+            settings.ACTIVITY_FLUSH_INTERVAL = flush_interval
+
+        self.report(results, sizes, options)
+
+    def seed(self, rooms, code_sessions, chat_messages, batch_size=5000):
+        """Fills the scratch database; a tenth of the history goes to HOT_ROOM. Returns the user the cases run as."""
+        with transaction.atomic():
+            user = User.objects.create_user('bench')
+            User.objects.bulk_create(User(username=f'bench-{index}') for index in range(100))
+            others = list(User.objects.filter(username__startswith='bench-').values_list('pk', flat=True))
+
+            CodeRoom.objects.bulk_create(
+                CodeRoom(room_id=f'bench{index}', created_by_id=user.pk if index % 50 == 0 else others[0])
+                for index in range(rooms)
+            )
+            room_pks = dict(CodeRoom.objects.values_list('room_id', 'pk'))
+            room_ids = [f'bench{index}' for index in range(rooms)]
+
+            def room_of(index):
+                return HOT_ROOM if index % 10 == 0 else room_ids[index % rooms]
+
+            memberships = {(user.pk, room_pks[room_id]) for room_id in room_ids[::20]}
+            for index, other in enumerate(others):
+                memberships.update((other, room_pks[room_ids[(index * 7 + step) % rooms]]) for step in range(10))
+                memberships.add((other, room_pks[HOT_ROOM]))
+            UserSession.objects.bulk_create(
+                (UserSession(user_id=user_pk, room_id=room_pk) for user_pk, room_pk in memberships),
+                batch_size=batch_size
+            )
+
+            texts = [f'print({index})\n' * 20 for index in range(50)]
+            Blob.objects.bulk_create(
+                Blob(hash=Blob.hash_text(text), content=text, size=len(text)) for text in texts
+            )
+            blob_pks = list(Blob.objects.values_list('pk', flat=True))
+
+            versions = {}
+            rows = (
+                CodeSession(
+                    room_id=room_pks[room_of(index)],
+                    created_by_id=others[index % len(others)],
+                    blob_id=blob_pks[index % len(blob_pks)],
+                    language='python',
+                    version=versions.setdefault(room_of(index), itertools.count(1)).__next__()
+                )
+                for index in range(code_sessions)
+            )
+            while True:
+                chunk = list(itertools.islice(rows, batch_size))
+                if not chunk:
+                    break
+                CodeSession.objects.bulk_create(chunk)
+            for room_id, counter in versions.items():
+                CodeRoom.objects.filter(pk=room_pks[room_id]).update(version_counter=next(counter) - 1)
+
+            rows = (
+                ChatMessage(room_id=room_of(index), user_id=others[index % len(others)], message=f'message {index}')
+                for index in range(chat_messages)
+            )
+            while True:
+                chunk = list(itertools.islice(rows, batch_size))
+                if not chunk:
+                    break
+                ChatMessage.objects.bulk_create(chunk)
+
+            for index in range(20):
+                FileEntry.objects.create(
+                    room_id=room_pks[HOT_ROOM], filename=f'module_{index}.py',
+                    content=SAMPLE_MODULE.format(n=index), created_by=user
+                )
+        return user
+
+    def measure(self, name, call, iterations, count):
+        """Runs ``call`` once to warm up, then ``iterations`` times; ``count`` returns queries so far."""
+        call()
+        samples, queries = [], 0
+        for _ in range(iterations):
+            before = count()
+            started = time.perf_counter()
+            call()
+            samples.append(time.perf_counter() - started)
+            queries = max(queries, count() - before)
+        return name, {'queries': queries, **summarize(samples)}
+
+    def run_views(self, user, iterations):
+        client = Client(HTTP_HOST='localhost')
+        client.force_login(user)
+        body = json.dumps({'room_id': HOT_ROOM, 'code': 'print(1)', 'language': 'python'})
+        cases = [
+            ('view:dashboard', lambda: client.get('/dashboard/')),
+            ('view:editor_view', lambda: client.get(f'/editor/?room={HOT_ROOM}')),
+            ('view:room_details', lambda: client.get(f'/room/{HOT_ROOM}/')),
+            ('view:save_code', lambda: client.post('/save-code/', body, content_type='application/json')),
+            ('view:update_user_count', lambda: client.get(f'/api/update-user-count/?room_id={HOT_ROOM}')),
+        ]
+        counter = QueryCounter()
+        results = {}
+        with counter.installed():
+            for name, call in cases:
+                results.update([self.measure(name, call, iterations, lambda: counter.queries)])
+        return results
+
+    async def run_consumer(self, user, iterations):
+        from channels.testing import WebsocketCommunicator
+
+        application = websocket_application()
+        counter = QueryCounter()
+        results = {}
+
+        async def reply(communicator, reply_type):
+            while True:
+                message = await communicator.receive_json_from(timeout=30)
+                if message['type'] == reply_type:
+                    return message
+
+        async def timed(name, call):
+            await call()
+            samples, queries = [], 0
+            for _ in range(iterations):
+                before = counter.queries
+                started = time.perf_counter()
+                await call()
+                samples.append(time.perf_counter() - started)
+                # Writes commit before the broadcast, so the count is complete here
+                queries = max(queries, counter.queries - before)
+            results[name] = {'queries': queries, **summarize(samples)}
+
+        with counter.installed():
+            async def connect():
+                communicator = WebsocketCommunicator(application, f'/ws/editor/{HOT_ROOM}/')
+                communicator.scope['user'] = user
+                await communicator.connect()
+                await reply(communicator, 'initial_state')
+                await communicator.disconnect()
+
+            await timed('ws:connect', connect)
+
+            communicator = WebsocketCommunicator(application, f'/ws/editor/{HOT_ROOM}/')
+            communicator.scope['user'] = user
+            await communicator.connect()
+            await reply(communicator, 'initial_state')
+            step = itertools.count()
+
+            def send(payload, reply_type):
+                async def call():
+                    await communicator.send_json_to(payload() if callable(payload) else payload)
+                    await reply(communicator, reply_type)
+                return call
+
+            await timed('ws:request_latest', send({'type': 'request_latest'}, 'room_state'))
+            await timed('ws:chat_message', send({'type': 'chat_message', 'message': 'hello'}, 'chat_message'))
+            await timed('ws:code_update', send(
+                lambda: {'type': 'code_update', 'code': f'print({next(step)})', 'language': 'python'}, 'code_update'
+            ))
+            await timed('ws:file_update create', send(
+                lambda: {'type': 'file_update', 'action': 'create', 'filename': f'new-{next(step)}.txt',
+                         'content': 'x = 1\n'}, 'file_update'
+            ))
+            await timed('ws:file_update update', send(
+                lambda: {'type': 'file_update', 'action': 'update', 'filename': 'bench.txt',
+                         'content': f'x = {next(step)}\n'}, 'file_update'
+            ))
+
+            # Renames and deletes need a file to act on; create it untimed
+            async def prepare(filename):
+                await communicator.send_json_to({'type': 'file_update', 'action': 'create',
+                                                 'filename': filename, 'content': 'x = 1\n'})
+                await reply(communicator, 'file_update')
+
+            async def rename():
+                number = next(step)
+                await prepare(f'rename-{number}.txt')
+                before = counter.queries
+                await send({'type': 'file_update', 'action': 'rename', 'filename': f'rename-{number}.txt',
+                            'newFilename': f'renamed-{number}.txt'}, 'file_update')()
+                return counter.queries - before
+
+            async def delete():
+                number = next(step)
+                await prepare(f'delete-{number}.txt')
+                before = counter.queries
+                await send({'type': 'file_update', 'action': 'delete', 'filename': f'delete-{number}.txt'},
+                           'file_update')()
+                return counter.queries - before
+
+            for name, call in (('ws:file_update rename', rename), ('ws:file_update delete', delete)):
+                await call()
+                samples, queries = [], 0
+                for _ in range(iterations):
+                    started = time.perf_counter()
+                    queries = max(queries, await call())
+                    samples.append(time.perf_counter() - started)
+                results[name] = {'queries': queries, **summarize(samples)}
+
+            await timed('ws:goto_definition', send(
+                {'type': 'goto_definition', 'symbol': 'Service3', 'requestId': 1}, 'definition'
+            ))
+            await timed('ws:workspace_symbols', send(
+                {'type': 'workspace_symbols', 'query': 'main', 'requestId': 2}, 'workspace_symbols'
+            ))
+            await timed('ws:request_diagnostics', send({'type': 'request_diagnostics'}, 'diagnostics'))
+            await communicator.disconnect()
+        return results
+
+    def report(self, results, sizes, options):
+        baseline = None
+        path = options['baseline']
+        if path and os.path.exists(path) and not options['update_baseline']:
+            with open(path) as f:
+                baseline = json.load(f)['cases']
+
+        over_budget, slower = [], []
+        self.stdout.write(
+            f"\n{'case':<26}{'queries':>8}{'budget':>8}{'p50 ms':>10}{'p90 ms':>10}{'base p50':>10}  status"
+        )
+        for name, result in results.items():
+            budget = BUDGETS.get(name)
+            status = []
+            if budget is not None and result['queries'] > budget:
+                over_budget.append(name)
+                status.append('OVER BUDGET')
+            base = (baseline or {}).get(name)
+            base_p50 = '-'
+            if base is not None:
+                base_p50 = f"{base['p50']:.2f}"
+                # Ignore sub-millisecond noise
+                if result['p50'] > base['p50'] * (1 + options['tolerance']) and result['p50'] - base['p50'] > 1:
+                    slower.append(name)
+                    status.append('SLOWER')
+            self.stdout.write(
+                f"{name:<26}{result['queries']:>8}{'-' if budget is None else budget:>8}"
+                f"{result['p50']:>10.2f}{result['p90']:>10.2f}{base_p50:>10}  {' '.join(status) or 'ok'}"
+            )
+
+        if path and (baseline is None or options['update_baseline']):
+            with open(path, 'w') as f:
+                json.dump({'dataset': sizes, 'cases': results}, f, indent=2, sort_keys=True)
+            self.stdout.write(f"\nWrote baseline to {path}")
+
+        if over_budget:
+            raise CommandError(f"Over query budget: {', '.join(over_budget)}")
+        if slower and options['fail_on_slowdown']:
+            raise CommandError(f"Slower than the baseline: {', '.join(slower)}")
@@ -0,0 +1,112 @@
+import time
+import asyncio
+
+from channels.layers import InMemoryChannelLayer
+from django.core.management.base import BaseCommand, CommandError
+
+from editor.layers import InProcessBus, NodeFanoutChannelLayer, RedisBus
+from editor.loadtest import summarize
+
+GROUP = 'editor_bench'
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures group_send fan-out to one large room with the stock channel layer "
+        "and with NodeFanoutChannelLayer, against Redis or an in-process stand-in"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--members', type=int, default=300, help='Connections in the room')
+        parser.add_argument('--nodes', type=int, default=4, help='Worker processes the members are spread over')
+        parser.add_argument('--events', type=int, default=200, help='group_send calls to time')
+        parser.add_argument('--redis', default=None,
+                            help='Redis URL, e.g. redis://127.0.0.1:6379/0 (default: in-process stand-in)')
+
+    def handle(self, *args, **options):
+        members, nodes, events = options['members'], options['nodes'], options['events']
+        results = [
+            ('stock', *asyncio.run(self.run_stock(options))),
+            ('node fan-out', *asyncio.run(self.run_fanout(options))),
+        ]
+
+        backend = options['redis'] or 'in-process stand-in'
+        self.stdout.write(f"\n{members} members on {nodes} nodes, {events} events ({backend})")
+        self.stdout.write(
+            f"{'layer':<14}{'events/s':>10}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'bus writes/event':>18}"
+        )
+        for label, stats, rate, writes in results:
+            self.stdout.write(
+                f"{label:<14}{rate:>10.1f}{stats['p50']:>10.2f}{stats['p90']:>10.2f}"
+                f"{stats['p99']:>10.2f}{writes:>18.1f}"
+            )
+
+    async def run_stock(self, options):
+        if options['redis']:
+            try:
+                from channels_redis.core import RedisChannelLayer
+            except ImportError:
+                raise CommandError("Comparing against Redis requires channels_redis")
+            layers = [RedisChannelLayer(hosts=[options['redis']]) for _ in range(options['nodes'])]
+        else:
+            # One shared layer stands in for every node
+            layers = [InMemoryChannelLayer(capacity=1000)]
+        stats, rate = await self.measure(layers, options['members'], options['events'])
+        for layer in layers:
+            await layer.flush()
+        # The stock Redis layer writes once to every member's channel
+        return stats, rate, float(options['members'])
+
+    async def run_fanout(self, options):
+        if options['redis']:
+            buses = [RedisBus(options['redis']) for _ in range(options['nodes'])]
+        else:
+            buses = [InProcessBus()] * options['nodes']
+        layers = [NodeFanoutChannelLayer(bus=bus, capacity=1000) for bus in buses]
+        stats, rate = await self.measure(layers, options['members'], options['events'])
+        writes = sum(bus.published for bus in set(buses)) / options['events']
+        for layer in layers:
+            await layer.close()
+        return stats, rate, writes
+
+    async def measure(self, layers, members, events):
+        """Times each group_send until every member has received it."""
+        channels = []
+        for index in range(members):
+            layer = layers[index % len(layers)]
+            channel = await layer.new_channel()
+            await layer.group_add(GROUP, channel)
+            channels.append((layer, channel))
+        await asyncio.sleep(0.1)
+
+        received = 0
+        expected = 0
+        done = asyncio.Event()
+
+        async def drain(layer, channel):
+            nonlocal received
+            while True:
+                await layer.receive(channel)
+                received += 1
+                if received >= expected:
+                    done.set()
+
+        tasks = [asyncio.ensure_future(drain(layer, channel)) for layer, channel in channels]
+        for bus in {getattr(layer, 'bus', None) for layer in layers} - {None}:
+            bus.published = 0
+
+        samples = []
+        started = time.perf_counter()
+        for number in range(events):
+            expected = members * (number + 1)
+            done.clear()
+            sent = time.perf_counter()
+            await layers[0].group_send(GROUP, {'type': 'bench.event', 'number': number})
+            await asyncio.wait_for(done.wait(), timeout=10)
+            samples.append(time.perf_counter() - sent)
+        elapsed = time.perf_counter() - started
+
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        return summarize(samples), events / elapsed
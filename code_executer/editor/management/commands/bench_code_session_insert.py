@@ -0,0 +1,72 @@
+import time
+import uuid
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from editor.models import Blob, CodeRoom, CodeSession
+from editor.services.tracing import percentile
+
+
+class Command(BaseCommand):
+    help = "Benchmarks CodeSession insert latency on a room with a large version history"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--history', type=int, default=100000,
+                            help='Number of existing CodeSession rows in the room')
+        parser.add_argument('--inserts', type=int, default=500,
+                            help='Number of timed inserts')
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='bulk_create batch size used to seed the history')
+
+    def handle(self, *args, **options):
+        history = options['history']
+        inserts = options['inserts']
+
+        # Everything runs in one transaction that is rolled back at the end,
+        # so the benchmark leaves no rows behind.
+        with transaction.atomic():
+            user = User.objects.create_user(f'bench-{uuid.uuid4().hex[:8]}')
+            room = CodeRoom.objects.create(room_id=f'bench-{uuid.uuid4().hex[:8]}', created_by=user)
+
+            self.stdout.write(f"Seeding {history} history rows...")
+            started = time.perf_counter()
+            blob = Blob.store('print("hello")')
+            CodeSession.objects.bulk_create(
+                (
+                    CodeSession(room=room, created_by=user, blob=blob, language='python', version=version)
+                    for version in range(1, history + 1)
+                ),
+                batch_size=options['batch_size']
+            )
+            CodeRoom.objects.filter(pk=room.pk).update(version_counter=history)
+            self.stdout.write(f"Seeded in {time.perf_counter() - started:.2f}s")
+
+            # The old save() path: a max-version lookup before every insert
+            legacy = []
+            for _ in range(inserts):
+                started = time.perf_counter()
+                CodeSession.objects.filter(room=room).order_by('-version').first()
+                legacy.append(time.perf_counter() - started)
+
+            current = []
+            for _ in range(inserts):
+                started = time.perf_counter()
+                CodeSession.objects.create(room=room, created_by=user,
+                                           code_content='print("hello")', language='python')
+                current.append(time.perf_counter() - started)
+
+            last = CodeSession.objects.filter(room=room).order_by('-version').values_list('version', flat=True).first()
+            transaction.set_rollback(True)
+
+        self.stdout.write(f"\nHistory rows: {history}, timed operations: {inserts}")
+        self.stdout.write(f"{'operation':<32}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+        for label, samples in (('max-version lookup (old)', legacy), ('insert with counter', current)):
+            self.stdout.write(
+                f"{label:<32}"
+                f"{percentile(samples, 0.5) * 1000:>10.3f}"
+                f"{percentile(samples, 0.99) * 1000:>10.3f}"
+                f"{max(samples) * 1000:>10.3f}"
+            )
+        self.stdout.write(f"Last version: {last} (expected {history + inserts})")
@@ -0,0 +1,61 @@
+import asyncio
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from editor.loadtest import (
+    connect_clients, run_clients, scratch_database, seed_rooms, summarize, unthrottled, use_in_memory_channel_layer
+)
+from editor.services import db_executor
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures EditorConsumer message-handling latency (send until the room broadcast "
+        "comes back) with the shared database thread and with the dedicated DB pool"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=40, help='Concurrent simulated clients')
+        parser.add_argument('--rooms', type=int, default=4, help='Rooms the clients are spread over')
+        parser.add_argument('--messages', type=int, default=25, help='Messages sent by each client')
+        parser.add_argument('--workers', type=int, nargs='+', default=None,
+                            help='CONSUMER_DB_WORKERS values to compare (default: 0 and the configured value)')
+
+    def handle(self, *args, **options):
+        configured = settings.CONSUMER_DB_WORKERS
+        workers = options['workers'] or [0, configured or 8]
+
+        results = []
+        with unthrottled(), scratch_database():
+            users, room_ids = seed_rooms(options['clients'], options['rooms'])
+            for count in workers:
+                settings.CONSUMER_DB_WORKERS = count
+                db_executor.shutdown_db_executor()
+                # Layer state is tied to the event loop of the previous run
+                use_in_memory_channel_layer()
+                results.append((count, db_executor.pool_size() if count else 0,
+                                asyncio.run(self.run(users, room_ids, options['messages']))))
+        settings.CONSUMER_DB_WORKERS = configured
+
+        self.stdout.write(
+            f"\n{options['clients']} clients, {options['rooms']} rooms, "
+            f"{options['messages']} messages each (chat/code/file mix)"
+        )
+        self.stdout.write(f"{'db workers':<14}{'msgs/s':>10}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'errors':>8}")
+        for count, threads, (stats, throughput, errors) in results:
+            label = 'shared thread' if count == 0 else f'pool of {threads}'
+            self.stdout.write(
+                f"{label:<14}{throughput:>10.1f}{stats['p50']:>10.2f}"
+                f"{stats['p90']:>10.2f}{stats['p99']:>10.2f}{errors:>8}"
+            )
+
+    async def run(self, users, room_ids, messages):
+        clients = await connect_clients(users, room_ids)
+
+        samples, errors, elapsed = await run_clients(clients, messages)
+        for username, kind, error in errors:
+            self.stderr.write(f"{kind} round trip failed for {username}: {error!r}")
+
+        await asyncio.gather(*(client.disconnect() for client in clients))
+        return summarize([seconds for kind, seconds in samples]), len(samples) / elapsed, len(errors)
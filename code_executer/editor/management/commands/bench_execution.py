@@ -0,0 +1,362 @@
+import os
+import re
+import json
+import time
+import queue
+import shutil
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import docker
+from django.core.management.base import BaseCommand, CommandError
+
+from editor.loadtest import summarize
+from editor.services.code_executer import LANGUAGE_CONFIGS, container_options, source_filename
+
+# ITERATIONS and LINES are filled in from the command line
+PROGRAMS = {
+    'python': {
+        'hello': 'print("hello, world")\n',
+        'cpu': (
+            'total = 0\n'
+            'for i in range(ITERATIONS):\n'
+            '    total = (total + i * i) % 1000003\n'
+            'print(total)\n'
+        ),
+        'output': (
+            'for i in range(LINES):\n'
+            '    print("line", i, "x" * 60)\n'
+        ),
+    },
+    'javascript': {
+        'hello': 'console.log("hello, world");\n',
+        'cpu': (
+            'let total = 0;\n'
+            'for (let i = 0; i < ITERATIONS; i++) {\n'
+            '    total = (total + i * i) % 1000003;\n'
+            '}\n'
+            'console.log(total);\n'
+        ),
+        'output': (
+            'for (let i = 0; i < LINES; i++) {\n'
+            '    console.log("line", i, "x".repeat(60));\n'
+            '}\n'
+        ),
+    },
+    'java': {
+        'hello': (
+            'public class Main {\n'
+            '    public static void main(String[] args) {\n'
+            '        System.out.println("hello, world");\n'
+            '    }\n'
+            '}\n'
+        ),
+        'cpu': (
+            'public class Main {\n'
+            '    public static void main(String[] args) {\n'
+            '        long total = 0;\n'
+            '        for (long i = 0; i < ITERATIONSL; i++) {\n'
+            '            total = (total + i * i) % 1000003;\n'
+            '        }\n'
+            '        System.out.println(total);\n'
+            '    }\n'
+            '}\n'
+        ),
+        'output': (
+            'public class Main {\n'
+            '    public static void main(String[] args) {\n'
+            '        String padding = "x".repeat(60);\n'
+            '        for (int i = 0; i < LINES; i++) {\n'
+            '            System.out.println("line " + i + " " + padding);\n'
+            '        }\n'
+            '    }\n'
+            '}\n'
+        ),
+    },
+    'cpp': {
+        'hello': (
+            '#include <iostream>\n'
+            'int main() {\n'
+            '    std::cout << "hello, world" << std::endl;\n'
+            '}\n'
+        ),
+        'cpu': (
+            '#include <iostream>\n'
+            'int main() {\n'
+            '    long long total = 0;\n'
+            '    for (long long i = 0; i < ITERATIONS; i++) {\n'
+            '        total = (total + i * i) % 1000003;\n'
+            '    }\n'
+            '    std::cout << total << std::endl;\n'
+            '}\n'
+        ),
+        'output': (
+            '#include <iostream>\n'
+            '#include <string>\n'
+            'int main() {\n'
+            '    std::string padding(60, \'x\');\n'
+            '    for (int i = 0; i < LINES; i++) {\n'
+            '        std::cout << "line " << i << " " << padding << "\\n";\n'
+            '    }\n'
+            '}\n'
+        ),
+    },
+}
+
+# Compile once, then run the artifact: (compile command, run command)
+COMPILE_STEPS = {
+    'java': (['javac', '-d', '/tmp/build', 'Main.java'], ['java', '-cp', '/tmp/build', 'Main']),
+    'cpp': (['g++', '-o', '/tmp/program', '/code/main.cpp'], ['/tmp/program']),
+}
+
+MODES = ('cold', 'warm', 'cached')
+
+
+class DockerBackend:
+    """Runs programs the way the engine does, in the language's image.
+
+    Cold runs start a container per submission. Warm and cached runs exec
+    into containers started ahead of time, standing in for a pool.
+    """
+
+    name = 'docker'
+
+    def __init__(self, client):
+        self.client = client
+
+    def available(self, config):
+        try:
+            self.client.images.get(config['image'])
+        except docker.errors.ImageNotFound:
+            self.client.images.pull(config['image'])
+        return True
+
+    def start(self, config, code_dir):
+        # Mounted read-write so the host can rewrite the program between runs
+        return self.client.containers.run(
+            config['image'], ['tail', '-f', '/dev/null'], detach=True,
+            **container_options(code_dir, config['memory_limit'], mode='rw')
+        )
+
+    def stop(self, container):
+        container.remove(force=True)
+
+    def run(self, config, command, code_dir, container=None):
+        """Returns (seconds to first stdout byte or None, seconds to exit, exit code)."""
+        started = time.perf_counter()
+        first = None
+        if container is None:
+            container = self.client.containers.run(
+                config['image'], command, detach=True, **container_options(code_dir, config['memory_limit'])
+            )
+            try:
+                for chunk in container.logs(stdout=True, stderr=False, stream=True, follow=True):
+                    if first is None and chunk:
+                        first = time.perf_counter() - started
+                status = container.wait(timeout=config['timeout'])['StatusCode']
+            finally:
+                container.remove(force=True)
+            return first, time.perf_counter() - started, status
+
+        exec_id = self.client.api.exec_create(container.id, command, stdout=True, stderr=False, workdir='/code')['Id']
+        for chunk in self.client.api.exec_start(exec_id, stream=True):
+            if first is None and chunk:
+                first = time.perf_counter() - started
+        status = self.client.api.exec_inspect(exec_id)['ExitCode']
+        return first, time.perf_counter() - started, status
+
+
+class LocalBackend:
+    """Runs programs as host processes, for CI machines without Docker.
+
+    /code and /tmp in commands map to the submission's directory. There is
+    no container to start, so cold runs sleep ``start_delay`` seconds in
+    its place; warm and cached runs skip it.
+    """
+
+    name = 'local'
+
+    def __init__(self, start_delay=0.0):
+        self.start_delay = start_delay
+
+    def available(self, config):
+        return shutil.which(config['command'][0]) is not None
+
+    def start(self, config, code_dir):
+        # Nothing to keep running; the slot's directory marks the run as warm
+        return code_dir
+
+    def stop(self, container):
+        pass
+
+    def localize(self, command, code_dir):
+        paths = {'code': code_dir, 'tmp': os.path.join(code_dir, 'tmp')}
+        os.makedirs(paths['tmp'], exist_ok=True)
+        return [re.sub(r'/(code|tmp)\b', lambda match: paths[match.group(1)], part) for part in command]
+
+    def run(self, config, command, code_dir, container=None):
+        started = time.perf_counter()
+        if container is None and self.start_delay:
+            time.sleep(self.start_delay)
+        process = subprocess.Popen(
+            self.localize(command, code_dir), cwd=code_dir, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+        )
+        timer = threading.Timer(config['timeout'], process.kill)
+        timer.start()
+        first = None
+        try:
+            while True:
+                chunk = os.read(process.stdout.fileno(), 65536)
+                if not chunk:
+                    break
+                if first is None:
+                    first = time.perf_counter() - started
+            status = process.wait()
+        finally:
+            timer.cancel()
+            process.stdout.close()
+        return first, time.perf_counter() - started, status
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures submission-to-first-byte and submission-to-completion for hello-world, "
+        "CPU-bound and output-heavy programs in each execution language, with cold containers, "
+        "a warm pool and cached compiles, across a sweep of concurrent submissions"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backend', choices=['auto', 'docker', 'local'], default='auto',
+                            help='docker needs a daemon; local runs host processes; auto picks docker when reachable')
+        parser.add_argument('--languages', default=','.join(LANGUAGE_CONFIGS), help='Comma-separated languages')
+        parser.add_argument('--programs', default=','.join(PROGRAMS['python']), help='Comma-separated programs')
+        parser.add_argument('--modes', default=','.join(MODES), help='Comma-separated modes: cold, warm, cached')
+        parser.add_argument('--concurrency', default='1,2,4,8,16,32,64',
+                            help='Comma-separated numbers of submissions in flight at once')
+        parser.add_argument('--runs', type=int, default=16,
+                            help='Submissions per concurrency level (at least one per worker)')
+        parser.add_argument('--iterations', type=int, default=2000000, help='Loop iterations of the CPU-bound program')
+        parser.add_argument('--lines', type=int, default=20000, help='Lines printed by the output-heavy program')
+        parser.add_argument('--local-start-delay', type=float, default=0.0,
+                            help='Seconds a cold local run waits in place of a container start')
+        parser.add_argument('--json', dest='json_path', default=None, help='Also write the results to this file')
+
+    def handle(self, *args, **options):
+        backend = self.backend(options)
+        levels = sorted({int(level) for level in options['concurrency'].split(',')})
+        modes = [mode for mode in options['modes'].split(',') if mode]
+        unknown = set(modes) - set(MODES)
+        if unknown:
+            raise CommandError(f"Unknown modes: {', '.join(sorted(unknown))}")
+
+        self.stdout.write(f"Backend: {backend.name}")
+        self.stdout.write(
+            f"\n{'language':<12}{'program':<8}{'mode':<8}{'conc':>5}{'runs':>6}{'errors':>7}"
+            f"{'first p50':>11}{'first p99':>11}{'done p50':>10}{'done p99':>10}{'runs/s':>8}"
+        )
+        results = []
+        for language in options['languages'].split(','):
+            config = LANGUAGE_CONFIGS.get(language)
+            if config is None or language not in PROGRAMS:
+                raise CommandError(f"Unknown language: {language}")
+            if not backend.available(config):
+                self.stdout.write(f"{language:<12}skipped, {config['command'][0]} is not installed")
+                continue
+            for program in options['programs'].split(','):
+                source = (
+                    PROGRAMS[language][program]
+                    .replace('ITERATIONS', str(options['iterations']))
+                    .replace('LINES', str(options['lines']))
+                )
+                for mode in modes:
+                    if mode == 'cached' and language not in COMPILE_STEPS:
+                        continue
+                    for row in self.sweep(backend, config, language, source, mode, levels, options['runs']):
+                        row.update(language=language, program=program, mode=mode)
+                        results.append(row)
+                        self.print_row(row)
+
+        if options['json_path']:
+            with open(options['json_path'], 'w') as f:
+                json.dump({'backend': backend.name, 'results': results}, f, indent=2)
+            self.stdout.write(f"\nWrote results to {options['json_path']}")
+
+    def backend(self, options):
+        if options['backend'] in ('auto', 'docker'):
+            try:
+                client = docker.from_env()
+                client.ping()
+                return DockerBackend(client)
+            except docker.errors.DockerException as e:
+                if options['backend'] == 'docker':
+                    raise CommandError(f"Docker is not available: {e}")
+        return LocalBackend(options['local_start_delay'])
+
+    def sweep(self, backend, config, language, source, mode, levels, runs):
+        """Runs the program at each concurrency level, yielding a summary per level."""
+        command = config['command']
+        if mode == 'cached':
+            compile_command, command = COMPILE_STEPS[language]
+
+        # One slot per worker: a code directory and, past cold mode, its warm container
+        slots = []
+        try:
+            for _ in range(max(levels)):
+                code_dir = tempfile.mkdtemp(prefix='bench-execution-')
+                os.chmod(code_dir, 0o755)
+                Path(code_dir, source_filename(config)).write_text(source)
+                container = backend.start(config, code_dir) if mode != 'cold' else None
+                slots.append((code_dir, container))
+                if mode == 'cached':
+                    _, _, status = backend.run(config, compile_command, code_dir, container)
+                    if status != 0:
+                        raise CommandError(f"Compiling the {language} program failed with exit code {status}")
+
+            for level in levels:
+                pool = queue.Queue()
+                for slot in slots[:level]:
+                    pool.put(slot)
+
+                def submit(_):
+                    code_dir, container = pool.get()
+                    try:
+                        if mode != 'cached':
+                            # Every submission writes its source, as the engine does
+                            Path(code_dir, source_filename(config)).write_text(source)
+                        return backend.run(config, command, code_dir, container)
+                    except Exception as e:
+                        return None, None, str(e)
+                    finally:
+                        pool.put((code_dir, container))
+
+                count = max(runs, level)
+                started = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=level) as executor:
+                    outcomes = list(executor.map(submit, range(count)))
+                elapsed = time.perf_counter() - started
+
+                succeeded = [outcome for outcome in outcomes if outcome[2] == 0]
+                yield {
+                    'concurrency': level,
+                    'runs': count,
+                    'errors': count - len(succeeded),
+                    'first_byte': summarize([first for first, _, _ in succeeded if first is not None]),
+                    'completion': summarize([done for _, done, _ in succeeded]),
+                    'throughput': len(succeeded) / elapsed if elapsed else 0.0,
+                }
+        finally:
+            for code_dir, container in slots:
+                if container is not None:
+                    backend.stop(container)
+                shutil.rmtree(code_dir, ignore_errors=True)
+
+    def print_row(self, row):
+        first, done = row['first_byte'], row['completion']
+        self.stdout.write(
+            f"{row['language']:<12}{row['program']:<8}{row['mode']:<8}{row['concurrency']:>5}{row['runs']:>6}"
+            f"{row['errors']:>7}{first['p50']:>11.1f}{first['p99']:>11.1f}{done['p50']:>10.1f}{done['p99']:>10.1f}"
+            f"{row['throughput']:>8.1f}"
+        )
@@ -0,0 +1,87 @@
+import asyncio
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from editor.loadtest import (
+    connect_clients, run_clients, scratch_database, seed_rooms, summarize, unthrottled, use_in_memory_channel_layer
+)
+from editor.models import ChatMessage, CodeSession
+from editor.services.db_executor import get_write_queue
+
+PROFILES = [
+    ('default', False, False),
+    ('wal', True, False),
+    ('wal+queue', True, True),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures WebSocket-layer write throughput on SQLite with the stock journal, "
+        "with the WAL pragma profile, and with WAL plus the single-writer queue"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=200, help='Concurrent simulated clients')
+        parser.add_argument('--rooms', type=int, default=20, help='Rooms the clients are spread over')
+        parser.add_argument('--messages', type=int, default=10, help='Messages sent by each client')
+        parser.add_argument('--timeout', type=float, default=10,
+                            help='Seconds before a round trip counts as failed')
+        parser.add_argument('--profile', choices=[name for name, wal, queued in PROFILES], nargs='+',
+                            help='Profiles to run (default: all)')
+
+    def handle(self, *args, **options):
+        original = (settings.SQLITE_PRAGMAS, settings.DB_WRITE_QUEUE_ENABLED)
+        results = []
+        try:
+            for name, wal, queued in PROFILES:
+                if options['profile'] and name not in options['profile']:
+                    continue
+                settings.SQLITE_PRAGMAS = original[0] if wal else {}
+                settings.DB_WRITE_QUEUE_ENABLED = queued
+                self.stdout.write(f"Running {name}...")
+                results.append((name, self.run_profile(options)))
+        finally:
+            settings.SQLITE_PRAGMAS, settings.DB_WRITE_QUEUE_ENABLED = original
+
+        self.stdout.write(
+            f"\n{options['clients']} clients, {options['rooms']} rooms, "
+            f"{options['messages']} writes each (chat/code/file mix)"
+        )
+        self.stdout.write(
+            f"{'profile':<12}{'writes/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'errors':>8}{'avg group':>11}"
+        )
+        for name, (writes_per_second, stats, errors, group) in results:
+            self.stdout.write(
+                f"{name:<12}{writes_per_second:>10.1f}{stats['p50']:>10.2f}"
+                f"{stats['p99']:>10.2f}{errors:>8}{group:>11}"
+            )
+
+    def run_profile(self, options):
+        use_in_memory_channel_layer()
+        with unthrottled(), scratch_database():
+            users, room_ids = seed_rooms(options['clients'], options['rooms'])
+            before = ChatMessage.objects.count() + CodeSession.objects.count()
+            samples, errors, elapsed = asyncio.run(
+                self.drive(users, room_ids, options['messages'], options['timeout'])
+            )
+            # File updates rewrite a row instead of adding one, so count them from the round trips
+            file_writes = sum(1 for kind, seconds in samples if kind == 'file')
+            rows = ChatMessage.objects.count() + CodeSession.objects.count() - before + file_writes
+
+            group = '-'
+            if settings.DB_WRITE_QUEUE_ENABLED:
+                write_queue = get_write_queue()
+                if write_queue.batches:
+                    group = f"{write_queue.writes / write_queue.batches:.1f}"
+
+        for username, kind, error in errors:
+            self.stderr.write(f"{kind} write failed for {username}: {error!r}")
+        return rows / elapsed, summarize([seconds for kind, seconds in samples]), len(errors), group
+
+    async def drive(self, users, room_ids, messages, timeout):
+        clients = await connect_clients(users, room_ids)
+        samples, errors, elapsed = await run_clients(clients, messages, timeout=timeout)
+        await asyncio.gather(*(client.disconnect() for client in clients))
+        return samples, errors, elapsed
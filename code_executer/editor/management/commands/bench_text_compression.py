@@ -0,0 +1,98 @@
+import time
+import uuid
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from editor import fields
+from editor.fields import compress_text, decompress_text
+from editor.models import CodeRoom, FileEntry
+from editor.services.tracing import percentile
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares read/write cost and storage size of FileEntry content with each "
+        "text codec, using the project's own source files as the corpus"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', default=str(settings.BASE_DIR),
+                            help='Directory whose .py/.js/.html/.css files are used as content')
+        parser.add_argument('--limit', type=int, default=300, help='Maximum number of files in the corpus')
+        parser.add_argument('--rounds', type=int, default=5, help='Passes over the corpus per measurement')
+
+    def handle(self, *args, **options):
+        corpus = self.load_corpus(options['source'], options['limit'])
+        raw_size = sum(len(text.encode('utf-8')) for text in corpus)
+        self.stdout.write(f"Corpus: {len(corpus)} files, {raw_size / 1024:.1f} KiB")
+
+        codecs = ['none', 'zlib'] + (['zstd'] if fields.zstandard is not None else [])
+        original = settings.TEXT_COMPRESSION
+        self.stdout.write(
+            f"\n{'codec':<8}{'stored KiB':>12}{'ratio':>8}{'encode MB/s':>13}{'decode MB/s':>13}"
+            f"{'save p50 ms':>13}{'load p50 ms':>13}"
+        )
+        try:
+            for name in codecs:
+                settings.TEXT_COMPRESSION = name
+                self.report(name, corpus, raw_size, options['rounds'])
+        finally:
+            settings.TEXT_COMPRESSION = original
+
+    def load_corpus(self, source, limit):
+        corpus = []
+        for suffix in ('*.py', '*.js', '*.html', '*.css'):
+            for path in sorted(Path(source).rglob(suffix)):
+                if 'migrations' in path.parts or 'staticfiles' in path.parts:
+                    continue
+                try:
+                    corpus.append(path.read_text(encoding='utf-8'))
+                except (OSError, UnicodeDecodeError):
+                    continue
+        return corpus[:limit]
+
+    def report(self, name, corpus, raw_size, rounds):
+        codec = fields.CODECS[name]
+        encoded = [compress_text(text, codec) for text in corpus]
+        stored = sum(len(value) for value in encoded)
+
+        started = time.perf_counter()
+        for _ in range(rounds):
+            for text in corpus:
+                compress_text(text, codec)
+        encode_rate = raw_size * rounds / (time.perf_counter() - started) / 1e6
+
+        started = time.perf_counter()
+        for _ in range(rounds):
+            for value in encoded:
+                decompress_text(value)
+        decode_rate = raw_size * rounds / (time.perf_counter() - started) / 1e6
+
+        save, load = self.orm_timings(corpus)
+        self.stdout.write(
+            f"{name:<8}{stored / 1024:>12.1f}{raw_size / stored:>8.2f}{encode_rate:>13.1f}"
+            f"{decode_rate:>13.1f}{percentile(save, 0.5) * 1000:>13.3f}{percentile(load, 0.5) * 1000:>13.3f}"
+        )
+
+    def orm_timings(self, corpus):
+        """Times FileEntry saves and loads of the corpus; everything is rolled back."""
+        save, load = [], []
+        with transaction.atomic():
+            user = User.objects.create_user(f'bench-{uuid.uuid4().hex[:8]}')
+            room = CodeRoom.objects.create(room_id=f'bench-{uuid.uuid4().hex[:8]}', created_by=user)
+            pks = []
+            for index, text in enumerate(corpus):
+                started = time.perf_counter()
+                entry = FileEntry.objects.create(room=room, filename=f'file{index}', content=text, created_by=user)
+                save.append(time.perf_counter() - started)
+                pks.append(entry.pk)
+            for pk in pks:
+                started = time.perf_counter()
+                FileEntry.objects.values_list('blob__content', flat=True).get(pk=pk)
+                load.append(time.perf_counter() - started)
+            transaction.set_rollback(True)
+        return save, load
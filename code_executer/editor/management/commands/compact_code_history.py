@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from editor.services.history import compact_history
+
+
+class Command(BaseCommand):
+    help = (
+        "Thins CodeSession history: keeps every version from the last hour, one per "
+        "minute for the last day, one per hour before that, and every saved version"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report what would be deleted without deleting anything')
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='Rows per DELETE statement (default: CODE_HISTORY_DELETE_BATCH_SIZE)')
+        parser.add_argument('--pause', type=float, default=None,
+                            help='Seconds to sleep between batches (default: CODE_HISTORY_DELETE_PAUSE)')
+
+    def handle(self, *args, **options):
+        report = compact_history(
+            dry_run=options['dry_run'],
+            batch_size=options['batch_size'],
+            pause=options['pause']
+        )
+        verb = 'Would delete' if report['dry_run'] else 'Deleted'
+        self.stdout.write(
+            f"{verb} {report['deleted']} versions from {report['rooms']} rooms, "
+            f"holding {report['logical_bytes'] / 1024:.1f} KiB of code ({report['seconds']}s)"
+        )
+        self.stdout.write(
+            "Logical size only: shared blobs are freed later by the blob sweeper "
+            "once nothing references them"
+        )
@@ -0,0 +1,75 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from editor.fields import compress_text, decompress_text, is_compressed
+from editor.models import Blob
+
+TARGETS = [(Blob, 'content')]
+
+
+def stored_size(value):
+    if value is None:
+        return 0
+    if isinstance(value, str):
+        return len(value.encode('utf-8'))
+    return len(value)
+
+
+class Command(BaseCommand):
+    help = (
+        "Rewrites legacy plain-text Blob.content rows in the compressed format, "
+        "one primary-key batch at a time"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Rows read and rewritten per batch')
+        parser.add_argument('--pause', type=float, default=0.0, help='Seconds to sleep between batches')
+        parser.add_argument('--dry-run', action='store_true', help='Report what would change without writing')
+        parser.add_argument('--decompress', action='store_true',
+                            help='Rewrite compressed rows back to plain text. Not needed to migrate back: '
+                                 '0009 copies blobs into the inline columns and 0008 decompresses them')
+
+    def handle(self, *args, **options):
+        for model, field_name in TARGETS:
+            converted, before, after = self.backfill(model, model._meta.get_field(field_name), options)
+            verb = 'Would rewrite' if options['dry_run'] else 'Rewrote'
+            self.stdout.write(
+                f"{model._meta.label}.{field_name}: {verb} {converted} rows, "
+                f"{before / 1024:.1f} KiB -> {after / 1024:.1f} KiB"
+            )
+
+    def backfill(self, model, field, options):
+        quote = connection.ops.quote_name
+        table, column, pk = quote(model._meta.db_table), quote(field.column), quote(model._meta.pk.column)
+        select = f"SELECT {pk}, {column} FROM {table} WHERE {pk} > %s ORDER BY {pk} LIMIT %s"
+        update = f"UPDATE {table} SET {column} = %s WHERE {pk} = %s"
+
+        converted = before = after = 0
+        last_pk = 0
+        while True:
+            with connection.cursor() as cursor:
+                cursor.execute(select, [last_pk, options['batch_size']])
+                rows = cursor.fetchall()
+            if not rows:
+                break
+            last_pk = rows[-1][0]
+
+            changes = []
+            for row_pk, value in rows:
+                if value is None or is_compressed(value) != options['decompress']:
+                    continue
+                text = decompress_text(value)
+                new_value = text if options['decompress'] else connection.Database.Binary(compress_text(text))
+                before += stored_size(value)
+                after += stored_size(new_value)
+                changes.append((new_value, row_pk))
+
+            converted += len(changes)
+            if changes and not options['dry_run']:
+                with transaction.atomic(), connection.cursor() as cursor:
+                    cursor.executemany(update, changes)
+                if options['pause']:
+                    time.sleep(options['pause'])
+        return converted, before, after
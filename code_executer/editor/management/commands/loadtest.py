@@ -0,0 +1,164 @@
+import time
+import random
+import asyncio
+import tracemalloc
+import uuid
+from contextlib import nullcontext
+
+from django.core.management.base import BaseCommand
+
+from editor.loadtest import (
+    FanoutTracker, QueryCounter, SimulatedClient, scratch_database, seed_rooms, summarize,
+    unthrottled, use_in_memory_channel_layer, websocket_application
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Simulates N collaborators per room against the ASGI app in-process, typing, chatting "
+        "and churning files at the given rates with an optional reconnect storm, and reports "
+        "throughput, fan-out latency, memory per connection and DB queries per message"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rooms', type=int, default=4, help='Rooms to load')
+        parser.add_argument('--per-room', type=int, default=10, help='Collaborators in each room')
+        parser.add_argument('--duration', type=float, default=10.0, help='Seconds of steady load')
+        parser.add_argument('--typing-rate', type=float, default=2.0, help='code_update messages per second per client')
+        parser.add_argument('--chat-rate', type=float, default=0.2, help='Chat messages per second per client')
+        parser.add_argument('--file-rate', type=float, default=0.5,
+                            help='File create/update/rename/delete operations per second per client')
+        parser.add_argument('--storm-fraction', type=float, default=0.0,
+                            help='Fraction of clients that drop and reconnect at once mid-run (0 disables)')
+        parser.add_argument('--storm-at', type=float, default=None,
+                            help='Seconds into the run for the reconnect storm (default: halfway)')
+        parser.add_argument('--grace', type=float, default=5.0,
+                            help='Seconds to wait for in-flight messages after the run')
+        parser.add_argument('--keep-limits', action='store_true',
+                            help='Keep per-connection rate limits and the room editor cap')
+        parser.add_argument('--seed', type=int, default=None, help='Random seed for send timings')
+
+    def handle(self, *args, **options):
+        random.seed(options['seed'])
+        use_in_memory_channel_layer()
+        clients = options['rooms'] * options['per_room']
+        with nullcontext() if options['keep_limits'] else unthrottled(), scratch_database():
+            users, room_ids = seed_rooms(clients, options['rooms'])
+            report = asyncio.run(self.run(users, room_ids, options))
+        self.print_report(report, options)
+
+    async def run(self, users, room_ids, options):
+        tracker = FanoutTracker()
+        counter = QueryCounter()
+        application = websocket_application()
+        clients = [SimulatedClient(application, room_id, user, tracker) for user, room_id in zip(users, room_ids)]
+        rooms = {}
+        for client in clients:
+            rooms.setdefault(client.room_id, []).append(client)
+        report = {'clients': len(clients), 'sent': {'code': 0, 'chat': 0, 'file': 0}, 'refused': 0}
+
+        with counter.installed():
+            tracemalloc.start()
+            before = tracemalloc.get_traced_memory()[0]
+            results = await asyncio.gather(*(client.connect() for client in clients), return_exceptions=True)
+            report['memory_per_connection'] = (tracemalloc.get_traced_memory()[0] - before) / len(clients)
+            tracemalloc.stop()
+            report['refused'] = sum(1 for result in results if isinstance(result, Exception))
+            report['connect_queries'] = counter.queries
+
+            async def sender(client, kind, rate, deadline):
+                step = 0
+                while True:
+                    await asyncio.sleep(random.expovariate(rate))
+                    if time.perf_counter() >= deadline:
+                        return
+                    if not client.connected:
+                        continue
+                    marker = uuid.uuid4().hex
+                    if kind == 'file':
+                        payload = client.churn_payload(step, marker)
+                        step += 1
+                    else:
+                        payload = client.payload(kind, marker)
+                    tracker.expect(marker, kind, sum(1 for peer in rooms[client.room_id] if peer.connected))
+                    report['sent'][kind] += 1
+                    await client.send(payload)
+
+            queries = counter.queries
+            received = sum(client.received for client in clients)
+            started = time.perf_counter()
+            deadline = started + options['duration']
+            tasks = [
+                sender(client, kind, rate, deadline)
+                for client in clients
+                for kind, rate in (
+                    ('code', options['typing_rate']), ('chat', options['chat_rate']), ('file', options['file_rate'])
+                )
+                if rate > 0
+            ]
+            if options['storm_fraction'] > 0:
+                storm_at = options['storm_at'] if options['storm_at'] is not None else options['duration'] / 2
+                victims = random.sample(clients, max(1, int(len(clients) * options['storm_fraction'])))
+                tasks.append(self.storm(victims, storm_at, report))
+            await asyncio.gather(*tasks)
+
+            # Let in-flight messages land before counting
+            grace_deadline = time.perf_counter() + options['grace']
+            while tracker.pending and time.perf_counter() < grace_deadline:
+                await asyncio.sleep(0.05)
+            elapsed = time.perf_counter() - started
+            report['queries'] = counter.queries - queries
+
+        report['elapsed'] = elapsed
+        report['deliveries'] = sum(client.received for client in clients) - received
+        report['fanout'] = tracker.samples
+        report['incomplete'] = len(tracker.pending)
+        await asyncio.gather(*(client.disconnect() for client in clients))
+        return report
+
+    async def storm(self, victims, storm_at, report):
+        """Drops every victim at once, then reconnects them all at once."""
+        await asyncio.sleep(storm_at)
+        await asyncio.gather(*(client.disconnect() for client in victims))
+
+        async def reconnect(client):
+            started = time.perf_counter()
+            await client.connect()
+            return time.perf_counter() - started
+
+        results = await asyncio.gather(*(reconnect(client) for client in victims), return_exceptions=True)
+        report['storm'] = {
+            'clients': len(victims),
+            'refused': sum(1 for result in results if isinstance(result, Exception)),
+            'reconnect': summarize([result for result in results if not isinstance(result, Exception)]),
+        }
+
+    def print_report(self, report, options):
+        sent = sum(report['sent'].values())
+        self.stdout.write(
+            f"\n{options['rooms']} rooms x {options['per_room']} collaborators, {options['duration']:.0f}s: "
+            f"typing {options['typing_rate']}/s, chat {options['chat_rate']}/s, files {options['file_rate']}/s per client"
+        )
+        self.stdout.write(f"connections refused      {report['refused']} of {report['clients']}")
+        self.stdout.write(f"memory per connection    {report['memory_per_connection'] / 1024:.1f} KiB (server and client side)")
+        self.stdout.write(f"queries per connect      {report['connect_queries'] / max(1, report['clients']):.1f}")
+        self.stdout.write(f"messages sent            {sent} ({sent / report['elapsed']:.1f}/s)")
+        self.stdout.write(f"deliveries               {report['deliveries']} ({report['deliveries'] / report['elapsed']:.1f}/s)")
+        self.stdout.write(f"queries per message      {report['queries'] / max(1, sent):.2f}")
+        self.stdout.write(f"never fully delivered    {report['incomplete']}")
+
+        self.stdout.write(f"\n{'fan-out (send to last peer)':<28}{'count':>8}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+        for kind in ('code', 'chat', 'file'):
+            stats = summarize([seconds for sample_kind, seconds in report['fanout'] if sample_kind == kind])
+            self.stdout.write(
+                f"{kind:<28}{stats['count']:>8}{stats['p50']:>10.2f}{stats['p90']:>10.2f}"
+                f"{stats['p99']:>10.2f}{stats['max']:>10.2f}"
+            )
+
+        storm = report.get('storm')
+        if storm:
+            reconnect = storm['reconnect']
+            self.stdout.write(
+                f"\nreconnect storm: {storm['clients']} clients, {storm['refused']} refused, "
+                f"reconnect p50 {reconnect['p50']:.1f} ms, p99 {reconnect['p99']:.1f} ms"
+            )
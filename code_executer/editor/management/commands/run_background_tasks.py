@@ -0,0 +1,30 @@
+import asyncio
+
+from django.core.management.base import BaseCommand
+
+from editor.background import get_periodic_tasks, run_periodic_tasks
+
+
+class Command(BaseCommand):
+    help = "Runs the periodic maintenance tasks in the foreground (for servers without ASGI lifespan support)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help='Run every task once and exit')
+
+    def handle(self, *args, **options):
+        tasks = get_periodic_tasks()
+        for task in tasks:
+            self.stdout.write(f"{task.name}: every {task.interval}s")
+
+        if options['once']:
+            async def run_all():
+                for task in tasks:
+                    await task.run_once()
+            asyncio.run(run_all())
+            return
+
+        try:
+            asyncio.run(run_periodic_tasks(tasks))
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,28 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from editor.services.sweeper import Sweeper
+
+
+class Command(BaseCommand):
+    help = "Deactivates stale user sessions and deletes idle rooms without files, orphaned chat messages and unused blobs in batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--only', nargs='+', choices=[name for name, *job in Sweeper.jobs],
+                            help='Restrict the sweep to these jobs')
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='Primary-key range per statement (default: SWEEPER_BATCH_SIZE)')
+        parser.add_argument('--budget', type=float, default=None,
+                            help='Run a single cycle with this time budget in seconds instead of a full pass')
+
+    def handle(self, *args, **options):
+        sweeper = Sweeper(batch_size=options['batch_size'])
+        if options['budget']:
+            swept = sweeper.run(time_budget=options['budget'], only=options['only'])
+        else:
+            swept = sweeper.sweep_all(only=options['only'])
+
+        for name, count in swept.items():
+            self.stdout.write(f"{name}: swept {count}")
+        self.stdout.write(json.dumps(sweeper.snapshot(), indent=2))
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.14 on 2026-10-19 17:16
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_version_counter(apps, schema_editor):
+    CodeRoom = apps.get_model('editor', 'CodeRoom')
+    CodeSession = apps.get_model('editor', 'CodeSession')
+    latest = CodeSession.objects.filter(room=OuterRef('pk')).order_by('-version').values('version')[:1]
+    CodeRoom.objects.filter(pk__in=CodeSession.objects.values('room')).update(
+        version_counter=Subquery(latest)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('editor', '0006_alter_fileentry_options_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='coderoom',
+            name='version_counter',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_version_counter, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='codesession',
+            index=models.Index(fields=['room', '-version'], name='editor_code_room_version_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='codesession',
+            index=models.Index(fields=['room', '-created_at'], name='editor_code_room_created_idx'),
+        ),
+    ]
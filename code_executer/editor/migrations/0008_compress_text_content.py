@@ -0,0 +1,86 @@
+# Generated by Django 4.2.14 on 2026-10-19 17:36
+
+from django.db import migrations
+import editor.fields
+
+BATCH_SIZE = 500
+
+COLUMNS = (('CodeSession', 'code_content'), ('FileEntry', 'content'))
+
+
+class AlterCompressedField(migrations.AlterField):
+    """AlterField between text and a compressed BLOB that also works on PostgreSQL.
+
+    Django casts text to bytea with ``column::bytea``, which parses
+    backslashes in the text as escapes. PostgreSQL gets an explicit UTF-8
+    conversion both ways instead; plain UTF-8 bytes read back as legacy
+    uncompressed rows.
+    """
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            self.alter_type(app_label, schema_editor, to_state, 'bytea', "convert_to({column}, 'UTF8')")
+        else:
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            self.alter_type(app_label, schema_editor, to_state, 'text', "convert_from({column}, 'UTF8')")
+        else:
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+    def alter_type(self, app_label, schema_editor, state, db_type, using):
+        model = state.apps.get_model(app_label, self.model_name)
+        table = schema_editor.quote_name(model._meta.db_table)
+        column = schema_editor.quote_name(model._meta.get_field(self.name).column)
+        schema_editor.execute(
+            f'ALTER TABLE {table} ALTER COLUMN {column} TYPE {db_type} USING {using.format(column=column)}'
+        )
+
+
+def decompress_rows(apps, schema_editor):
+    """Rewrites every value as plain text before the columns go back to TextField."""
+    connection = schema_editor.connection
+    quote = connection.ops.quote_name
+    for model_name, field_name in COLUMNS:
+        model = apps.get_model('editor', model_name)
+        table = quote(model._meta.db_table)
+        column = quote(model._meta.get_field(field_name).column)
+        last_pk = 0
+        with connection.cursor() as cursor:
+            while True:
+                cursor.execute(
+                    f'SELECT id, {column} FROM {table} WHERE id > %s ORDER BY id LIMIT {BATCH_SIZE}', [last_pk]
+                )
+                rows = cursor.fetchall()
+                if not rows:
+                    break
+                last_pk = rows[-1][0]
+                for pk, value in rows:
+                    text = editor.fields.decompress_text(value)
+                    # PostgreSQL converts the bytea back with convert_from, SQLite keeps the str
+                    if connection.vendor == 'postgresql':
+                        text = connection.Database.Binary(text.encode('utf-8'))
+                    cursor.execute(f'UPDATE {table} SET {column} = %s WHERE id = %s', [text, pk])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('editor', '0007_coderoom_version_counter_codesession_indexes'),
+    ]
+
+    operations = [
+        AlterCompressedField(
+            model_name='codesession',
+            name='code_content',
+            field=editor.fields.CompressedTextField(),
+        ),
+        AlterCompressedField(
+            model_name='fileentry',
+            name='content',
+            field=editor.fields.CompressedTextField(blank=True),
+        ),
+        # Runs first on the way back, while the columns still hold compressed bytes
+        migrations.RunPython(migrations.RunPython.noop, decompress_rows),
+    ]
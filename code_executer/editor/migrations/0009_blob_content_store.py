@@ -0,0 +1,107 @@
+# Generated by Django 4.2.14 on 2026-10-19 17:45
+
+import hashlib
+
+from django.db import migrations, models
+import django.db.models.deletion
+import editor.fields
+
+BATCH_SIZE = 500
+
+
+def move_text_to_blobs(apps, schema_editor):
+    Blob = apps.get_model('editor', 'Blob')
+    for model_name, field_name in (('FileEntry', 'content'), ('CodeSession', 'code_content')):
+        model = apps.get_model('editor', model_name)
+        last_pk = 0
+        while True:
+            rows = list(
+                model.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', field_name)[:BATCH_SIZE]
+            )
+            if not rows:
+                break
+            last_pk = rows[-1][0]
+            for pk, text in rows:
+                text = text or ''
+                blob, created = Blob.objects.only('pk').get_or_create(
+                    hash=hashlib.sha256(text.encode('utf-8')).hexdigest(),
+                    defaults={'content': text, 'size': len(text.encode('utf-8'))}
+                )
+                model.objects.filter(pk=pk).update(blob=blob)
+
+
+def move_blobs_to_text(apps, schema_editor):
+    """Copies each row's blob back into its re-added inline column.
+
+    The columns are CompressedTextField again at this point; 0008's reverse
+    turns them back into plain text.
+    """
+    for model_name, field_name in (('FileEntry', 'content'), ('CodeSession', 'code_content')):
+        model = apps.get_model('editor', model_name)
+        last_pk = 0
+        while True:
+            rows = list(
+                model.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', 'blob__content')[:BATCH_SIZE]
+            )
+            if not rows:
+                break
+            last_pk = rows[-1][0]
+            for pk, text in rows:
+                model.objects.filter(pk=pk).update(**{field_name: text or ''})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('editor', '0008_compress_text_content'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Blob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hash', models.CharField(max_length=64, unique=True)),
+                ('content', editor.fields.CompressedTextField(blank=True)),
+                ('size', models.PositiveIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='fileentry',
+            name='blob',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='editor.blob'),
+        ),
+        migrations.AddField(
+            model_name='codesession',
+            name='blob',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='editor.blob'),
+        ),
+        migrations.RunPython(move_text_to_blobs, move_blobs_to_text),
+        # State only: lets a rollback re-add the NOT NULL column to existing rows
+        migrations.SeparateDatabaseAndState(state_operations=[
+            migrations.AlterField(
+                model_name='codesession',
+                name='code_content',
+                field=editor.fields.CompressedTextField(default=''),
+            ),
+        ]),
+        migrations.RemoveField(
+            model_name='fileentry',
+            name='content',
+        ),
+        migrations.RemoveField(
+            model_name='codesession',
+            name='code_content',
+        ),
+        migrations.AlterField(
+            model_name='fileentry',
+            name='blob',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to='editor.blob'),
+        ),
+        migrations.AlterField(
+            model_name='codesession',
+            name='blob',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to='editor.blob'),
+        ),
+    ]
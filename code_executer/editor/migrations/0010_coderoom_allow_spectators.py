@@ -0,0 +1,18 @@
+# Generated by Django 4.2.14 on 2026-10-19 18:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('editor', '0009_blob_content_store'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='coderoom',
+            name='allow_spectators',
+            field=models.BooleanField(default=False),
+        ),
+    ]
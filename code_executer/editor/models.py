@@ -1,9 +1,13 @@
 
-from django.db import models
+from django.db import models, connection, transaction
+from django.db.models import F
 from django.contrib.auth.models import User
 from django.utils import timezone
+import hashlib
 import uuid
 
+from .fields import CompressedTextField
+
 class CodeRoom(models.Model):
     room_id = models.CharField(max_length=50, unique=True, default=uuid.uuid4)
     created_by = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -11,6 +15,9 @@ class CodeRoom(models.Model):
     last_active = models.DateTimeField(auto_now=True)
     description = models.TextField(blank=True, null=True)
     is_public = models.BooleanField(default=True)
+    # Read-only spectating (ws/spectate/) needs no login, so the creator opts in
+    allow_spectators = models.BooleanField(default=False)
+    version_counter = models.PositiveIntegerField(default=0)
 
     class Meta:
         ordering = ['-last_active']
@@ -18,6 +25,82 @@ class CodeRoom(models.Model):
     def __str__(self):
         return f"Room {self.room_id} by {self.created_by.username}"
 
+    @classmethod
+    def next_version(cls, pk):
+        """Atomically increments and returns the room's code version counter."""
+        if connection.vendor == 'postgresql' or (
+            connection.vendor == 'sqlite' and connection.Database.sqlite_version_info >= (3, 35)
+        ):
+            # One round trip: UPDATE ... RETURNING
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"UPDATE {cls._meta.db_table} SET version_counter = version_counter + 1 "
+                    f"WHERE id = %s RETURNING version_counter",
+                    [pk]
+                )
+                row = cursor.fetchone()
+            if row is None:
+                raise cls.DoesNotExist(f"Room {pk} does not exist")
+            return row[0]
+
+        # The UPDATE holds the row lock until the transaction ends, so the
+        # read below sees our own increment and no one else's.
+        with transaction.atomic():
+            if not cls.objects.filter(pk=pk).update(version_counter=F('version_counter') + 1):
+                raise cls.DoesNotExist(f"Room {pk} does not exist")
+            return cls.objects.filter(pk=pk).values_list('version_counter', flat=True).get()
+
+class Blob(models.Model):
+    """A file body stored once and shared by every row with the same content."""
+    hash = models.CharField(max_length=64, unique=True)  # sha256 of the UTF-8 text
+    content = CompressedTextField(blank=True)
+    size = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Blob {self.hash[:12]} ({self.size} bytes)"
+
+    @staticmethod
+    def hash_text(text):
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    @classmethod
+    def store(cls, text, digest=None):
+        """Returns the blob holding ``text``, writing it only if no identical blob exists."""
+        digest = digest or cls.hash_text(text)
+        blob, created = cls.objects.only('pk', 'hash').get_or_create(
+            hash=digest,
+            defaults={'content': text, 'size': len(text.encode('utf-8'))}
+        )
+        return blob
+
+
+def blob_text(name):
+    """A text attribute backed by the model's ``blob`` foreign key.
+
+    Assigned text is kept on the instance and turned into a blob by
+    store_blob_text() when the model is saved.
+    """
+    pending = f'_pending_{name}'
+
+    def fget(self):
+        if pending in self.__dict__:
+            return self.__dict__[pending]
+        return self.blob.content if self.blob_id else ''
+
+    def fset(self, value):
+        self.__dict__[pending] = value
+
+    return property(fget, fset)
+
+
+def store_blob_text(instance, name):
+    """Points ``instance.blob`` at the blob for text assigned to ``name``, if any."""
+    text = instance.__dict__.get(f'_pending_{name}')
+    if text is not None:
+        instance.blob = Blob.store(text)
+
+
 class UserSession(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     room = models.ForeignKey(CodeRoom, on_delete=models.CASCADE)
@@ -33,7 +116,7 @@ class UserSession(models.Model):
 class CodeSession(models.Model):
     room = models.ForeignKey(CodeRoom, on_delete=models.CASCADE)
     created_by = models.ForeignKey(User, on_delete=models.CASCADE)
-    code_content = models.TextField()
+    blob = models.ForeignKey(Blob, on_delete=models.PROTECT, related_name='+')
     language = models.CharField(max_length=20)
     created_at = models.DateTimeField(auto_now_add=True)
     execution_result = models.TextField(null=True, blank=True)
@@ -42,16 +125,21 @@ class CodeSession(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['room', '-version'], name='editor_code_room_version_idx'),
+            models.Index(fields=['room', '-created_at'], name='editor_code_room_created_idx'),
+        ]
 
     def __str__(self):
         return f"Code in {self.room.room_id} by {self.created_by.username}"
 
+    code_content = blob_text('code_content')
+
     def save(self, *args, **kwargs):
         if not self.pk:  # If this is a new code session
-            # Get the latest version number for this room
-            latest = CodeSession.objects.filter(room=self.room).order_by('-version').first()
-            if latest:
-                self.version = latest.version + 1
+            # Take the next version from the room's counter
+            self.version = CodeRoom.next_version(self.room_id)
+        store_blob_text(self, 'code_content')
         super().save(*args, **kwargs)
 
 class ChatMessage(models.Model):
@@ -63,7 +151,7 @@ class ChatMessage(models.Model):
 class FileEntry(models.Model):
     room = models.ForeignKey(CodeRoom, on_delete=models.CASCADE, related_name='files')
     filename = models.CharField(max_length=255)
-    content = models.TextField(blank=True)
+    blob = models.ForeignKey(Blob, on_delete=models.PROTECT, related_name='+')
     created_by = models.ForeignKey(User, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -74,3 +162,28 @@ class FileEntry(models.Model):
     
     def __str__(self):
         return f"{self.filename} in {self.room.room_id}"
+
+    content = blob_text('content')
+
+    def save(self, *args, **kwargs):
+        store_blob_text(self, 'content')
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def store(cls, room_pk, filename, content, user):
+        """Creates or updates a file, skipping all writes when the content is unchanged.
+
+        Returns the file's new updated_at, or None if nothing was written.
+        """
+        digest = Blob.hash_text(content)
+        current = cls.objects.filter(room_id=room_pk, filename=filename).values_list('pk', 'blob__hash').first()
+        if current and current[1] == digest:
+            return None
+
+        # Reuse any identical blob
+        blob = Blob.store(content, digest)
+        if current:
+            updated_at = timezone.now()
+            cls.objects.filter(pk=current[0]).update(blob=blob, created_by=user, updated_at=updated_at)
+            return updated_at
+        return cls.objects.create(room_id=room_pk, filename=filename, blob=blob, created_by=user).updated_at
@@ -0,0 +1,115 @@
+import atexit
+import threading
+import logging
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Case, DateTimeField, F, Value, When
+from django.utils import timezone
+
+from editor.models import CodeRoom, UserSession
+from editor.services.db_executor import get_write_queue
+
+logger = logging.getLogger(__name__)
+
+
+class ActivityWriter:
+    """Coalesces ``UserSession.last_activity`` bumps into periodic bulk UPDATEs.
+
+    Heartbeats only touch an in-memory dict. A daemon thread flushes it every
+    ``interval`` seconds with one UPDATE per room, so a stored timestamp is
+    never more than one interval behind the latest recorded activity. The
+    room's ``last_active`` is bumped in the same flush, so socket-only use
+    keeps a room alive for the sweeper.
+    """
+
+    def __init__(self, interval=None):
+        self.interval = interval or settings.ACTIVITY_FLUSH_INTERVAL
+        # room_id -> {user_id: latest activity}
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def record(self, room_id, user_id, when=None):
+        """Records activity for a user in a room; cheap enough for every heartbeat."""
+        when = when or timezone.now()
+        with self._lock:
+            users = self._pending.setdefault(room_id, {})
+            if users.get(user_id) is None or users[user_id] < when:
+                users[user_id] = when
+        self._ensure_started()
+
+    def flush(self):
+        """Writes all pending activity; returns the number of rows updated."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+
+        updated = 0
+        for room_id, users in pending.items():
+            try:
+                updated += UserSession.objects.filter(
+                    room__room_id=room_id,
+                    user_id__in=list(users)
+                ).update(is_active=True, last_activity=Case(
+                    *(When(user_id=user_id, then=Value(when)) for user_id, when in users.items()),
+                    default=F('last_activity'),
+                    output_field=DateTimeField()
+                ))
+                latest = max(users.values())
+                CodeRoom.objects.filter(room_id=room_id, last_active__lt=latest).update(last_active=latest)
+            except Exception as e:
+                logger.error(f"Error flushing activity for room {room_id}: {str(e)}")
+                # Put the batch back unless newer activity has been recorded since
+                with self._lock:
+                    current = self._pending.setdefault(room_id, {})
+                    for user_id, when in users.items():
+                        if current.get(user_id) is None or current[user_id] < when:
+                            current[user_id] = when
+        return updated
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='activity-writer', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while not self._wakeup.wait(self.interval):
+            try:
+                if settings.DB_WRITE_QUEUE_ENABLED:
+                    # Queue behind the consumers' writes instead of racing them
+                    get_write_queue().submit(self.flush).result()
+                else:
+                    self.flush()
+            except Exception as e:
+                logger.error(f"Error flushing activity: {str(e)}")
+            finally:
+                close_old_connections()
+
+    def stop(self):
+        """Stops the flush thread after writing whatever is still pending."""
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(self.interval)
+        try:
+            self.flush()
+        except Exception as e:
+            logger.error(f"Error flushing activity on shutdown: {str(e)}")
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_activity_writer():
+    """Returns the process-wide activity writer."""
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = ActivityWriter()
+                atexit.register(_writer.stop)
+    return _writer
@@ -0,0 +1,128 @@
+import time
+import asyncio
+import logging
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# WebSocket close codes
+CLOSE_TRY_AGAIN_LATER = 1013  # server overloaded; the reason carries "retry-after=<seconds>"
+CLOSE_ROOM_FULL = 4009
+CLOSE_RATE_LIMITED = 4029
+
+
+class TokenBucket:
+    """Allows ``rate`` events per second on average, with bursts of up to ``burst``."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def retry_after(self):
+        """Seconds until the next token is available."""
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+
+class ConnectionRateLimiter:
+    """Token buckets for one connection: one per limited message type plus '*' for all of them."""
+
+    def __init__(self, limits=None):
+        limits = settings.WS_RATE_LIMITS if limits is None else limits
+        self.buckets = {message_type: TokenBucket(rate, burst) for message_type, (rate, burst) in limits.items()}
+        self.dropped = 0  # consecutive messages refused
+        self._notified = {}  # message type -> monotonic time until which no new notice is sent
+
+    def allow(self, message_type):
+        """Returns None if the message may proceed, else the bucket that refused it."""
+        for key in ('*', message_type):
+            bucket = self.buckets.get(key)
+            if bucket is not None and not bucket.take():
+                self.dropped += 1
+                return bucket
+        self.dropped = 0
+        return None
+
+    def should_notify(self, message_type, retry_after):
+        """True once per refill period, so refusals do not flood the client in turn."""
+        now = time.monotonic()
+        if self._notified.get(message_type, 0) > now:
+            return False
+        self._notified[message_type] = now + max(retry_after, 1.0)
+        return True
+
+
+class LoopLagMonitor:
+    """Measures how late the event loop wakes up from a short sleep.
+
+    ``lag`` is the latest overshoot, decaying by half per sample, so a
+    spike keeps it high for a few intervals and sustained lag keeps it up.
+    """
+
+    def __init__(self, interval=None):
+        self.interval = interval or settings.WS_ADMISSION_LAG_INTERVAL
+        self.lag = 0.0
+        self.task = None
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.ensure_future(self._run())
+
+    async def _run(self):
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(self.interval)
+            sample = time.monotonic() - started - self.interval
+            self.lag = max(sample, self.lag / 2)
+
+
+def queue_depth(channel_layer):
+    """Messages waiting in this process's channel-layer queues for local consumers."""
+    # In-memory and node fan-out layers keep `channels`; channels_redis keeps `receive_buffer`
+    queues = getattr(channel_layer, 'channels', None)
+    if not isinstance(queues, dict):
+        queues = getattr(channel_layer, 'receive_buffer', None)
+    if not isinstance(queues, dict):
+        return 0
+    return sum(queue.qsize() for queue in queues.values() if hasattr(queue, 'qsize'))
+
+
+_monitor = None
+
+
+def get_loop_monitor():
+    """Returns the process-wide loop lag monitor, started on the running loop."""
+    global _monitor
+    if _monitor is None:
+        _monitor = LoopLagMonitor()
+    _monitor.start()
+    return _monitor
+
+
+def loop_lag():
+    """Latest event loop lag in seconds; 0 until the monitor has started."""
+    return _monitor.lag if _monitor is not None else 0.0
+
+
+def check_admission(channel_layer):
+    """Returns None to admit a new connection, or the seconds it should wait before retrying."""
+    monitor = get_loop_monitor()
+    if monitor.lag > settings.WS_ADMISSION_MAX_LOOP_LAG:
+        logger.warning(f"Refusing connection: event loop lag {monitor.lag * 1000:.0f} ms")
+        return settings.WS_ADMISSION_RETRY_AFTER
+    depth = queue_depth(channel_layer)
+    if depth > settings.WS_ADMISSION_MAX_QUEUE_DEPTH:
+        logger.warning(f"Refusing connection: {depth} messages queued for delivery")
+        return settings.WS_ADMISSION_RETRY_AFTER
+    return None
@@ -0,0 +1,194 @@
+import json
+import zipfile
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from editor.models import Blob, CodeSession, FileEntry
+
+logger = logging.getLogger(__name__)
+
+HISTORY_DIR = 'history/'
+HISTORY_EXTENSIONS = {'python': 'py', 'javascript': 'js', 'java': 'java', 'cpp': 'cpp', 'html': 'html', 'css': 'css'}
+
+
+class ArchiveError(Exception):
+    """Raised for an archive that cannot be imported."""
+
+
+class _StreamBuffer:
+    """A write-only file object whose contents are drained after each write.
+
+    ZipFile writes sequentially to an unseekable target, emitting data
+    descriptors, so only the bytes produced since the last drain are held.
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def stream_room_archive(room, include_history=False, chunk_size=64 * 1024):
+    """Yields a zip of the room's files (and optionally its code history) piece by piece.
+
+    One file body is in memory at a time; the archive itself never is.
+    """
+    buffer = _StreamBuffer()
+    with zipfile.ZipFile(buffer, mode='w', compression=zipfile.ZIP_DEFLATED) as archive:
+        files = FileEntry.objects.filter(room=room).order_by('filename').values_list(
+            'filename', 'blob__content', 'updated_at'
+        )
+        for filename, content, updated_at in files.iterator(chunk_size=100):
+            yield from _write_member(archive, buffer, filename, content, updated_at, chunk_size)
+
+        if include_history:
+            manifest = []
+            versions = CodeSession.objects.filter(room=room).order_by('version').values_list(
+                'version', 'language', 'created_at', 'created_by__username', 'is_saved', 'blob__content'
+            )
+            for version, language, created_at, username, is_saved, content in versions.iterator(chunk_size=100):
+                name = f"{HISTORY_DIR}{version:06d}.{HISTORY_EXTENSIONS.get(language, 'txt')}"
+                manifest.append({
+                    'version': version,
+                    'file': name,
+                    'language': language,
+                    'created_at': created_at.isoformat(),
+                    'created_by': username,
+                    'is_saved': is_saved,
+                })
+                yield from _write_member(archive, buffer, name, content, created_at, chunk_size)
+            yield from _write_member(
+                archive, buffer, f'{HISTORY_DIR}manifest.json', json.dumps(manifest, indent=2),
+                timezone.now(), chunk_size
+            )
+    yield buffer.drain()
+
+
+def _write_member(archive, buffer, name, content, modified, chunk_size):
+    info = zipfile.ZipInfo(name, date_time=timezone.localtime(modified).timetuple()[:6])
+    info.compress_type = zipfile.ZIP_DEFLATED
+    data = content.encode('utf-8')
+    with archive.open(info, mode='w', force_zip64=len(data) > 0x7fffffff) as member:
+        for start in range(0, len(data), chunk_size):
+            member.write(data[start:start + chunk_size])
+            chunk = buffer.drain()
+            if chunk:
+                yield chunk
+    chunk = buffer.drain()
+    if chunk:
+        yield chunk
+
+
+def import_room_archive(room, fileobj, user, resolve, batch_size=200):
+    """Creates or overwrites the room's files from a zip archive.
+
+    ``resolve`` validates each member name (ProjectFileManager.resolve) so
+    entries such as ``../x`` are rejected before anything is written.
+    History entries are skipped. Files are written in batches: blobs with
+    bulk_create(ignore_conflicts=True), new files with bulk_create and
+    existing ones with bulk_update. Returns (created, updated).
+    """
+    try:
+        archive = zipfile.ZipFile(fileobj)
+    except zipfile.BadZipFile as e:
+        raise ArchiveError(f'Not a zip archive: {str(e)}')
+
+    with archive:
+        members = [
+            info for info in archive.infolist()
+            if not info.is_dir() and not info.filename.startswith(HISTORY_DIR)
+        ]
+        if len(members) > settings.ROOM_IMPORT_MAX_FILES:
+            raise ArchiveError(f'Archive has more than {settings.ROOM_IMPORT_MAX_FILES} files')
+        for info in members:
+            try:
+                resolve(info.filename)
+            except ValueError:
+                raise ArchiveError(f'Invalid file name in archive: {info.filename}')
+
+        created = updated = 0
+        budget = settings.ROOM_IMPORT_MAX_BYTES
+        with transaction.atomic():
+            for start in range(0, len(members), batch_size):
+                batch = {}
+                for info in members[start:start + batch_size]:
+                    data = _read_member(archive, info, budget)
+                    budget -= len(data)
+                    try:
+                        batch[info.filename] = data.decode('utf-8')
+                    except UnicodeDecodeError:
+                        raise ArchiveError(f'{info.filename} is not UTF-8 text')
+                batch_created, batch_updated = _store_batch(room, batch, user)
+                created += batch_created
+                updated += batch_updated
+    return created, updated
+
+
+def _read_member(archive, info, budget):
+    """Reads one member, refusing to inflate past the remaining byte budget."""
+    chunks = []
+    size = 0
+    with archive.open(info) as member:
+        while True:
+            chunk = member.read(64 * 1024)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > budget:
+                raise ArchiveError(
+                    f'Archive expands to more than {settings.ROOM_IMPORT_MAX_BYTES} bytes'
+                )
+            chunks.append(chunk)
+    return b''.join(chunks)
+
+
+def _store_batch(room, files, user):
+    digests = {filename: Blob.hash_text(content) for filename, content in files.items()}
+    Blob.objects.bulk_create(
+        [
+            Blob(hash=digests[filename], content=content, size=len(content.encode('utf-8')))
+            for filename, content in files.items()
+        ],
+        ignore_conflicts=True
+    )
+    blob_ids = dict(Blob.objects.filter(hash__in=set(digests.values())).values_list('hash', 'pk'))
+
+    existing = {
+        entry.filename: entry
+        for entry in FileEntry.objects.filter(room=room, filename__in=list(files)).only('pk', 'filename', 'blob_id')
+    }
+    now = timezone.now()
+    changed = []
+    for filename, entry in existing.items():
+        blob_id = blob_ids[digests[filename]]
+        if entry.blob_id != blob_id:
+            entry.blob_id = blob_id
+            entry.created_by = user
+            entry.updated_at = now
+            changed.append(entry)
+    FileEntry.objects.bulk_update(changed, ['blob', 'created_by', 'updated_at'])
+
+    FileEntry.objects.bulk_create([
+        FileEntry(room=room, filename=filename, blob_id=blob_ids[digest], created_by=user)
+        for filename, digest in digests.items()
+        if filename not in existing
+    ])
+    return len(files) - len(existing), len(changed)
@@ -1,49 +1,111 @@
+import asyncio
 import docker
 import tempfile
 import os
 import subprocess
 import json
+import time
+import functools
 from pathlib import Path
 from django.conf import settings
 import logging
+from editor.services.metrics import (
+    CONTAINER_RUN_SECONDS, CONTAINER_START_SECONDS, EXECUTION_QUEUE_SECONDS, LANGUAGE_SERVER_SECONDS
+)
 
 logger = logging.getLogger(__name__)
 
+
+def run_container(client, language, submitted, timeout=None, remove=True, **options):
+    """Runs a container to completion and returns its stdout, timing each stage.
+
+    Behaves like ``client.containers.run(detach=False)``, raising
+    ContainerError on a non-zero exit, but records the wait since
+    ``submitted`` (a time.perf_counter() value), the container start and the
+    program run separately.
+    """
+    started = time.perf_counter()
+    EXECUTION_QUEUE_SECONDS.observe(started - submitted, language)
+    container = client.containers.run(detach=True, **options)
+    running = time.perf_counter()
+    CONTAINER_START_SECONDS.observe(running - started, language)
+    try:
+        result = container.wait(timeout=timeout)
+        CONTAINER_RUN_SECONDS.observe(time.perf_counter() - running, language)
+        if result['StatusCode'] != 0:
+            raise docker.errors.ContainerError(
+                container, result['StatusCode'], options.get('command'), options.get('image'),
+                container.logs(stdout=False, stderr=True)
+            )
+        return container.logs(stdout=True, stderr=False)
+    finally:
+        if remove:
+            container.remove(force=True)
+
+
+# Per-language sandbox; the code directory is mounted read-only at /code
+LANGUAGE_CONFIGS = {
+    'python': {
+        'image': 'python:3.9-slim',
+        'command': ['python', '/code/main.py'],
+        'file_ext': '.py',
+        'timeout': 30,
+        'memory_limit': '100m'
+    },
+    'javascript': {
+        'image': 'node:14-alpine',
+        'command': ['node', '/code/main.js'],
+        'file_ext': '.js',
+        'timeout': 30,
+        'memory_limit': '100m'
+    },
+    'java': {
+        'image': 'openjdk:11-slim',
+        # The source launcher needs the file named after its public class
+        'filename': 'Main.java',
+        'command': ['java', 'Main.java'],
+        'file_ext': '.java',
+        'timeout': 30,
+        'memory_limit': '200m'
+    },
+    'cpp': {
+        'image': 'gcc:latest',
+        'command': ['bash', '-c', 'g++ -o /tmp/program /code/main.cpp && /tmp/program'],
+        'file_ext': '.cpp',
+        'timeout': 30,
+        'memory_limit': '100m'
+    }
+}
+
+
+def container_options(code_dir, memory_limit, mode='ro'):
+    """Sandbox options every code execution container runs with."""
+    return {
+        'volumes': {
+            code_dir: {
+                'bind': '/code',
+                'mode': mode
+            }
+        },
+        'working_dir': '/code',
+        'mem_limit': memory_limit,
+        'network_disabled': True,
+        'cpu_period': 100000,
+        'cpu_quota': 25000  # 25% CPU limit
+    }
+
+
+def source_filename(config):
+    return config.get('filename', f'main{config["file_ext"]}')
+
+
 class CodeExecuter:
     def __init__(self):
         self.client = docker.from_env()
-        self.language_configs = {
-            'python': {
-                'image': 'python:3.9-slim',
-                'command': ['python', '/code/main.py'],
-                'file_ext': '.py',
-                'timeout': 30,
-                'memory_limit': '100m'
-            },
-            'javascript': {
-                'image': 'node:14-alpine',
-                'command': ['node', '/code/main.js'],
-                'file_ext': '.js',
-                'timeout': 30,
-                'memory_limit': '100m'
-            },
-            'java': {
-                'image': 'openjdk:11-slim',
-                'command': ['java', 'Main.java'],
-                'file_ext': '.java',
-                'timeout': 30,
-                'memory_limit': '200m'
-            },
-            'cpp': {
-                'image': 'gcc:latest',
-                'command': ['bash', '-c', 'g++ -o /code/program /code/main.cpp && /code/program'],
-                'file_ext': '.cpp',
-                'timeout': 30,
-                'memory_limit': '100m'
-            }
-        }
+        self.language_configs = LANGUAGE_CONFIGS
 
     async def execute(self, code, language):
+        submitted = time.perf_counter()
         try:
             config = self.language_configs.get(language)
             if not config:
@@ -56,7 +118,7 @@ class CodeExecuter:
             # Create temporary directory for code execution
             with tempfile.TemporaryDirectory() as temp_dir:
                 # Write code to file
-                file_path = Path(temp_dir) / f'main{config["file_ext"]}'
+                file_path = Path(temp_dir) / source_filename(config)
                 with open(file_path, 'w') as f:
                     f.write(code)
 
@@ -66,7 +128,9 @@ class CodeExecuter:
                     config['image'],
                     config['command'],
                     config['timeout'],
-                    config['memory_limit']
+                    config['memory_limit'],
+                    language,
+                    submitted
                 )
 
                 return {
@@ -85,26 +149,19 @@ class CodeExecuter:
                 'error': str(e)
             }
 
-    async def run_in_container(self, code_dir, image, command, timeout, memory_limit):
+    async def run_in_container(self, code_dir, image, command, timeout, memory_limit, language, submitted):
         try:
-            container = self.client.containers.run(
+            # The Docker client blocks, so the run waits for a pool thread
+            container = await asyncio.get_running_loop().run_in_executor(None, functools.partial(
+                run_container,
+                self.client,
+                language,
+                submitted,
+                timeout=timeout,
                 image=image,
                 command=command,
-                volumes={
-                    code_dir: {
-                        'bind': '/code',
-                        'mode': 'ro'
-                    }
-                },
-                working_dir='/code',
-                remove=True,
-                detach=False,
-                mem_limit=memory_limit,
-                network_disabled=True,
-                cpu_period=100000,
-                cpu_quota=25000,  # 25% CPU limit
-                timeout=timeout
-            )
+                **container_options(code_dir, memory_limit)
+            ))
 
             return {
                 'output': container.decode('utf-8'),
@@ -144,6 +201,9 @@ class BaseLanguageServer:
     async def provide_diagnostics(self, code):
         raise NotImplementedError
 
+    async def provide_project_diagnostics(self, files, targets):
+        raise NotImplementedError
+
     async def format_code(self, code):
         raise NotImplementedError
 
@@ -153,6 +213,7 @@ class PyLanguageServer(BaseLanguageServer):
         self.pylint_path = 'pylint'
         self.black_path = 'black'
 
+    @LANGUAGE_SERVER_SECONDS.time('python', 'completions')
     async def provide_completions(self, code, position):
         try:
             import jedi
@@ -172,6 +233,7 @@ class PyLanguageServer(BaseLanguageServer):
             logger.error(f'Error providing Python completions: {str(e)}')
             return []
 
+    @LANGUAGE_SERVER_SECONDS.time('python', 'diagnostics')
     async def provide_diagnostics(self, code):
         try:
             with tempfile.NamedTemporaryFile(mode='w', suffix='.py') as f:
@@ -200,6 +262,60 @@ class PyLanguageServer(BaseLanguageServer):
             logger.error(f'Error providing Python diagnostics: {str(e)}')
             return []
 
+    @LANGUAGE_SERVER_SECONDS.time('python', 'project_diagnostics')
+    async def provide_project_diagnostics(self, files, targets):
+        """Lints ``targets`` inside a copy of the whole project so imports resolve.
+
+        ``files`` maps every project filename to its content. Returns a dict of
+        target filename to diagnostics; targets missing from ``files`` map to
+        an empty list.
+        """
+        results = {target: [] for target in targets}
+        try:
+            with tempfile.TemporaryDirectory() as project_dir:
+                root = Path(project_dir).resolve()
+                for filename, content in files.items():
+                    path = (root / filename).resolve()
+                    if root not in path.parents:
+                        continue
+                    path.parent.mkdir(parents=True, exist_ok=True)
+                    path.write_text(content)
+
+                existing = [target for target in targets if target in files]
+                if not existing:
+                    return results
+
+                process = await asyncio.create_subprocess_exec(
+                    self.pylint_path,
+                    '--score=n',
+                    '--msg-template={path}:{line}:{column}:{C}:{msg_id} {msg}',
+                    *existing,
+                    cwd=project_dir,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.PIPE
+                )
+                stdout, _ = await process.communicate()
+
+                for line in stdout.decode('utf-8', 'replace').splitlines():
+                    parts = line.split(':', 4)
+                    if len(parts) < 5 or parts[0] not in results:
+                        continue
+                    try:
+                        lineno, column = int(parts[1]), int(parts[2])
+                    except ValueError:
+                        continue
+                    results[parts[0]].append({
+                        'line': lineno,
+                        'ch': column,
+                        'message': parts[4].strip(),
+                        'severity': 'error' if parts[3] in ('E', 'F') else 'warning'
+                    })
+                return results
+        except Exception as e:
+            logger.error(f'Error providing Python project diagnostics: {str(e)}')
+            return results
+
+    @LANGUAGE_SERVER_SECONDS.time('python', 'format')
     async def format_code(self, code):
         try:
             with tempfile.NamedTemporaryFile(mode='w', suffix='.py') as f:
@@ -0,0 +1,222 @@
+import asyncio
+import atexit
+import functools
+import logging
+import queue
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+
+from editor.services.metrics import DB_QUERY_SECONDS
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def pool_size():
+    """Number of threads the consumer DB pool runs.
+
+    SQLite only admits one writer at a time and fails concurrent writers
+    with "database is locked", so the pool stays single-threaded there
+    unless writes go through the write queue and the pool only reads.
+    """
+    if connection.vendor == 'sqlite' and not settings.DB_WRITE_QUEUE_ENABLED:
+        return 1
+    return settings.CONSUMER_DB_WORKERS
+
+
+def get_db_executor():
+    """Returns the bounded thread pool reserved for consumer database work."""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=pool_size(),
+                    thread_name_prefix='consumer-db'
+                )
+    return _executor
+
+
+def shutdown_db_executor():
+    """Waits for queued work and discards the pool; the next call builds a new one."""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True)
+            _executor = None
+
+
+def _call_with_connection_cleanup(func, args, kwargs):
+    close_old_connections()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+def db_sync_to_async(func):
+    """Runs a synchronous ORM function in the dedicated consumer DB pool.
+
+    A drop-in replacement for ``channels.db.database_sync_to_async``. That
+    helper is thread-sensitive, so every consumer's queries share one thread
+    and queue behind each other and behind every other sync_to_async call in
+    the process. This pool keeps consumer queries off that thread and runs up
+    to CONSUMER_DB_WORKERS of them concurrently. With CONSUMER_DB_WORKERS = 0
+    it falls back to ``database_sync_to_async``.
+    """
+    timed = DB_QUERY_SECONDS.time(func.__qualname__)(func)
+    fallback = database_sync_to_async(timed)
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        if not settings.CONSUMER_DB_WORKERS:
+            return await fallback(*args, **kwargs)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            get_db_executor(),
+            _call_with_connection_cleanup, timed, args, kwargs
+        )
+
+    return wrapper
+
+
+class WriteQueue:
+    """Runs ORM writes one at a time on a single thread, committing in groups.
+
+    Whatever has queued up while the previous group was committing is run
+    as the next group inside one transaction, each job in its own savepoint
+    so a failing job does not take the others down with it. Results are
+    handed back only after the group has committed.
+    """
+
+    def __init__(self, batch_size=None):
+        self.batch_size = batch_size or settings.DB_WRITE_BATCH_SIZE
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.writes = 0
+
+    def submit(self, func, *args, **kwargs):
+        """Queues ``func`` and returns a concurrent.futures.Future for its result."""
+        future = Future()
+        if threading.current_thread() is self._thread:
+            # A write issued from inside another write joins its transaction
+            try:
+                future.set_result(func(*args, **kwargs))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+
+        self._ensure_started()
+        self._queue.put((func, args, kwargs, future))
+        return future
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                break
+            batch = [job]
+            stop = False
+            while len(batch) < self.batch_size:
+                try:
+                    job = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if job is None:
+                    stop = True
+                    break
+                batch.append(job)
+            self._commit(batch)
+            if stop:
+                break
+        connection.close()
+
+    def _commit(self, batch):
+        close_old_connections()
+        outcomes = []
+        try:
+            with transaction.atomic():
+                for func, args, kwargs, future in batch:
+                    try:
+                        with transaction.atomic():
+                            outcomes.append((future, True, func(*args, **kwargs)))
+                    except Exception as e:
+                        outcomes.append((future, False, e))
+        except Exception as e:
+            logger.error(f"Error committing {len(batch)} queued writes: {str(e)}", exc_info=True)
+            for func, args, kwargs, future in batch:
+                future.set_exception(e)
+            return
+
+        self.batches += 1
+        self.writes += len(batch)
+        for future, ok, value in outcomes:
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+    def stop(self):
+        """Commits what is queued and stops the writer thread."""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout=10)
+            self._thread = None
+
+
+_write_queue = None
+_write_queue_lock = threading.Lock()
+
+
+def get_write_queue():
+    """Returns the process-wide write queue."""
+    global _write_queue
+    if _write_queue is None:
+        with _write_queue_lock:
+            if _write_queue is None:
+                _write_queue = WriteQueue()
+                atexit.register(_write_queue.stop)
+    return _write_queue
+
+
+def shutdown_write_queue():
+    """Commits what is queued and discards the queue; the next write builds a new one."""
+    global _write_queue
+    with _write_queue_lock:
+        if _write_queue is not None:
+            _write_queue.stop()
+            _write_queue = None
+
+
+def db_write_to_async(func):
+    """Like db_sync_to_async, but for functions that write.
+
+    With DB_WRITE_QUEUE_ENABLED the call is handed to the write queue, so
+    writes from every consumer are serialized and grouped into shared
+    transactions; otherwise it behaves exactly like db_sync_to_async.
+    """
+    direct = db_sync_to_async(func)
+    timed = DB_QUERY_SECONDS.time(func.__qualname__)(func)
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        if not settings.DB_WRITE_QUEUE_ENABLED:
+            return await direct(*args, **kwargs)
+        return await asyncio.wrap_future(get_write_queue().submit(timed, *args, **kwargs))
+
+    return wrapper
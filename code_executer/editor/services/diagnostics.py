@@ -0,0 +1,215 @@
+import asyncio
+import threading
+import logging
+from collections import OrderedDict
+
+from django.conf import settings
+
+from .symbol_index import detect_language, module_key, parse_file, stem_keys
+
+logger = logging.getLogger(__name__)
+
+
+def extract_imports(filename, content):
+    """Returns the module keys a file imports."""
+    symbols = parse_file(filename, content)
+    if symbols is None:
+        return set()
+    python = detect_language(filename) == 'python'
+    keys = {module_key(module, python) for module, line in symbols.imports}
+    keys.discard('')
+    return keys
+
+
+class DependencyGraph:
+    """Import graph between the files of a single room.
+
+    Edges are stored by module key rather than by resolved filename, so an
+    import of a file that does not exist yet starts resolving as soon as that
+    file is created, without revisiting the importer.
+    """
+
+    def __init__(self):
+        # filename -> {module key, ...} it imports
+        self.imports = {}
+        # module key -> {filename, ...} importing it
+        self.importers = {}
+        # module key -> {filename, ...} providing it
+        self.modules = {}
+
+    def set_file(self, filename, keys):
+        """Records (or replaces) the imports of a file."""
+        self.remove_file(filename)
+        self.imports[filename] = set(keys)
+        for key in keys:
+            self.importers.setdefault(key, set()).add(filename)
+        for key in stem_keys(filename):
+            self.modules.setdefault(key, set()).add(filename)
+
+    def remove_file(self, filename):
+        """Drops a file and its outgoing edges."""
+        for key in self.imports.pop(filename, ()):
+            importers = self.importers.get(key)
+            if importers is not None:
+                importers.discard(filename)
+                if not importers:
+                    del self.importers[key]
+        for key in stem_keys(filename):
+            providers = self.modules.get(key)
+            if providers is not None:
+                providers.discard(filename)
+                if not providers:
+                    del self.modules[key]
+
+    def dependencies(self, filename):
+        """Returns the room files ``filename`` imports."""
+        resolved = set()
+        for key in self.imports.get(filename, ()):
+            resolved |= self.modules.get(key, set())
+        resolved.discard(filename)
+        return resolved
+
+    def dependents(self, filename):
+        """Returns the room files that import ``filename`` directly."""
+        result = set()
+        for key in stem_keys(filename):
+            result |= self.importers.get(key, set())
+        result.discard(filename)
+        return result
+
+    def reverse_closure(self, filenames):
+        """Returns every file that transitively imports one of ``filenames``."""
+        seen = set()
+        pending = list(filenames)
+        while pending:
+            for dependent in self.dependents(pending.pop()):
+                if dependent not in seen:
+                    seen.add(dependent)
+                    pending.append(dependent)
+        return seen - set(filenames)
+
+
+class RoomDiagnostics:
+    """Dependency graph plus cached lint results for a single room.
+
+    File changes mark the changed file and its reverse dependents dirty. A
+    single background task per room lints the dirty set in batches, so bursts
+    of edits coalesce into one lint run, and only files whose diagnostics
+    actually changed are published.
+    """
+
+    def __init__(self, room_id):
+        self.room_id = room_id
+        self.graph = DependencyGraph()
+        # filename -> list of diagnostics from the last lint
+        self.results = {}
+        self.dirty = set()
+        self.built = False
+        self._task = None
+        self._lock = threading.Lock()
+
+    def build(self, files):
+        """Builds the dependency graph from a ``{filename: content}`` mapping."""
+        graph = DependencyGraph()
+        for filename, content in files.items():
+            graph.set_file(filename, extract_imports(filename, content))
+        with self._lock:
+            self.graph = graph
+            self.results = {}
+            self.built = True
+
+    def update_file(self, filename, content):
+        """Records a created or updated file and returns the files to re-lint."""
+        with self._lock:
+            self.graph.set_file(filename, extract_imports(filename, content))
+            return {filename} | self.graph.reverse_closure([filename])
+
+    def remove_file(self, filename):
+        """Records a deleted file and returns the files to re-lint."""
+        with self._lock:
+            affected = self.graph.reverse_closure([filename])
+            self.graph.remove_file(filename)
+            return affected | {filename}
+
+    def rename_file(self, old_filename, new_filename):
+        """Records a rename and returns the files to re-lint."""
+        with self._lock:
+            keys = self.graph.imports.get(old_filename, set())
+            affected = self.graph.reverse_closure([old_filename])
+            self.graph.remove_file(old_filename)
+            self.graph.set_file(new_filename, keys)
+            affected |= self.graph.reverse_closure([new_filename])
+            return affected | {old_filename, new_filename}
+
+    def cached(self):
+        """Returns a copy of the cached diagnostics."""
+        with self._lock:
+            return dict(self.results)
+
+    def schedule(self, filenames, lint, publish):
+        """Marks files dirty and makes sure a lint run is pending.
+
+        ``lint`` is an async callable taking a set of filenames and returning
+        ``{filename: diagnostics}``; ``publish`` is awaited with the subset
+        whose diagnostics differ from the cache.
+        """
+        self.dirty |= set(filenames)
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run(lint, publish))
+        return self._task
+
+    async def _run(self, lint, publish):
+        while self.dirty:
+            batch, self.dirty = self.dirty, set()
+            try:
+                results = await lint(batch)
+            except Exception as e:
+                logger.error(f"Error linting room {self.room_id}: {str(e)}", exc_info=True)
+                continue
+
+            changed = {}
+            with self._lock:
+                for filename in batch:
+                    diagnostics = results.get(filename, [])
+                    previous = self.results.get(filename)
+                    if filename not in self.graph.imports:
+                        # The file was deleted; clear it on clients that had results
+                        self.results.pop(filename, None)
+                        if previous:
+                            changed[filename] = []
+                        continue
+                    self.results[filename] = diagnostics
+                    if previous != diagnostics:
+                        changed[filename] = diagnostics
+            if changed:
+                try:
+                    await publish(changed)
+                except Exception as e:
+                    logger.error(f"Error publishing diagnostics for room {self.room_id}: {str(e)}")
+
+
+_rooms = OrderedDict()
+_rooms_lock = threading.Lock()
+
+
+def get_room_diagnostics(room_id):
+    """Returns the process-wide diagnostics state for a room, creating it if needed.
+
+    Up to ROOM_INDEX_MAX_ROOMS rooms are tracked; the least recently used
+    room is forgotten first and its graph rebuilt on next use.
+    """
+    with _rooms_lock:
+        diagnostics = _rooms.get(room_id)
+        if diagnostics is None:
+            diagnostics = _rooms[room_id] = RoomDiagnostics(room_id)
+            while len(_rooms) > settings.ROOM_INDEX_MAX_ROOMS:
+                _rooms.popitem(last=False)
+        else:
+            _rooms.move_to_end(room_id)
+        return diagnostics
+
+
+def drop_room_diagnostics(room_id):
+    """Forgets a room's diagnostics state, e.g. when the room is deleted."""
+    with _rooms_lock:
+        _rooms.pop(room_id, None)
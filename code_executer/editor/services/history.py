@@ -0,0 +1,101 @@
+import time
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F, Sum
+from django.db.models.functions import Coalesce, Length
+from django.utils import timezone
+
+from editor.models import CodeSession
+
+logger = logging.getLogger(__name__)
+
+KEEP_ALL_FOR = timedelta(hours=1)
+ONE_PER_MINUTE_FOR = timedelta(days=1)
+
+
+def retention_bucket(created_at, now):
+    """Returns the retention bucket of a version, or None if it must always be kept.
+
+    Versions from the last hour are all kept, versions from the last day are
+    thinned to one per minute, and older versions to one per hour.
+    """
+    age = now - created_at
+    if age < KEEP_ALL_FOR:
+        return None
+    if age < ONE_PER_MINUTE_FOR:
+        return ('minute', created_at.replace(second=0, microsecond=0))
+    return ('hour', created_at.replace(minute=0, second=0, microsecond=0))
+
+
+def compactable_sessions(room_id, now):
+    """Yields ids of a room's code versions that the retention policy drops.
+
+    The newest version in each bucket is kept, as is every saved version.
+    """
+    seen = set()
+    sessions = CodeSession.objects.filter(
+        room_id=room_id,
+        created_at__lt=now - KEEP_ALL_FOR
+    ).order_by('-created_at').values_list('id', 'created_at', 'is_saved')
+
+    for session_id, created_at, is_saved in sessions.iterator(chunk_size=5000):
+        bucket = retention_bucket(created_at, now)
+        if bucket is None:
+            continue
+        if bucket not in seen:
+            seen.add(bucket)
+            continue
+        if not is_saved:
+            yield session_id
+
+
+def compact_history(dry_run=False, batch_size=None, pause=None, now=None):
+    """Thins CodeSession history according to the retention policy.
+
+    Deletes run in primary-key batches of ``batch_size`` rows, each its own
+    short statement, with ``pause`` seconds between batches so writers are
+    never blocked for long. Returns a report of the rows removed and their
+    ``logical_bytes``: the size of the code they referenced. Blobs are
+    shared, so storage is only freed once the blob sweeper removes the ones
+    nothing references any more.
+    """
+    batch_size = batch_size or settings.CODE_HISTORY_DELETE_BATCH_SIZE
+    pause = settings.CODE_HISTORY_DELETE_PAUSE if pause is None else pause
+    now = now or timezone.now()
+    started = time.monotonic()
+    report = {'rooms': 0, 'deleted': 0, 'logical_bytes': 0, 'dry_run': dry_run}
+
+    room_ids = CodeSession.objects.filter(
+        created_at__lt=now - KEEP_ALL_FOR
+    ).order_by().values_list('room_id', flat=True).distinct()
+
+    for room_id in list(room_ids):
+        report['rooms'] += 1
+        # Collect ids before deleting: SQLite gives no isolation between an
+        # open read cursor and writes to the same table.
+        ids = list(compactable_sessions(room_id, now))
+        for start in range(0, len(ids), batch_size):
+            if start and pause and not dry_run:
+                time.sleep(pause)
+            _delete_batch(ids[start:start + batch_size], report, dry_run)
+
+    report['seconds'] = round(time.monotonic() - started, 3)
+    logger.info(
+        f"History compaction {'(dry run) ' if dry_run else ''}removed {report['deleted']} versions "
+        f"({report['logical_bytes']} logical bytes) from {report['rooms']} rooms in {report['seconds']}s"
+    )
+    return report
+
+
+def _delete_batch(ids, report, dry_run):
+    rows = CodeSession.objects.filter(pk__in=ids)
+    size = rows.aggregate(
+        size=Sum(F('blob__size') + Coalesce(Length('execution_result'), 0))
+    )['size'] or 0
+    report['logical_bytes'] += size
+    if dry_run:
+        report['deleted'] += len(ids)
+    else:
+        report['deleted'] += rows.delete()[0]
@@ -0,0 +1,259 @@
+import time
+import inspect
+import functools
+import threading
+from bisect import bisect_left
+
+# Seconds; covers sub-millisecond socket handling up to slow container runs
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+)
+
+_registry = []
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{value}"' for name, value in extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+class Histogram:
+    """A Prometheus histogram that threads record into without locking.
+
+    Each thread observes into its own shard (a dict of label values to
+    bucket counts plus the sum), so the only shared step is registering a
+    thread's shard once. A scrape merges the shards; it may miss an
+    observation in flight but never corrupts one.
+    """
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._local = threading.local()
+        self._shards = []
+        _registry.append(self)
+
+    def _shard(self):
+        shard = getattr(self._local, 'values', None)
+        if shard is None:
+            shard = self._local.values = {}
+            self._shards.append(shard)
+        return shard
+
+    def observe(self, value, *labels):
+        shard = self._shard()
+        entry = shard.get(labels)
+        if entry is None:
+            # One count per bucket, one for +Inf, then the sum
+            entry = shard[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        entry[bisect_left(self.buckets, value)] += 1
+        entry[-1] += value
+
+    def time(self, *labels):
+        """Decorator recording the wall time of each call, sync or async."""
+        def decorator(func):
+            if inspect.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def async_wrapper(*args, **kwargs):
+                    started = time.perf_counter()
+                    try:
+                        return await func(*args, **kwargs)
+                    finally:
+                        self.observe(time.perf_counter() - started, *labels)
+                return async_wrapper
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.observe(time.perf_counter() - started, *labels)
+            return wrapper
+        return decorator
+
+    def merged(self):
+        """Returns ``{label values: [bucket counts..., +Inf count, sum]}`` across threads."""
+        totals = {}
+        for shard in list(self._shards):
+            for labels, entry in shard.copy().items():
+                total = totals.get(labels)
+                if total is None:
+                    totals[labels] = list(entry)
+                else:
+                    for index, value in enumerate(entry):
+                        total[index] += value
+        return totals
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        bounds = self.buckets + (float('inf'),)
+        for labels, entry in sorted(self.merged().items()):
+            cumulative = 0
+            for bound, count in zip(bounds, entry):
+                cumulative += count
+                label_text = _format_labels(self.labelnames, labels, [('le', _format_value(bound))])
+                lines.append(f'{self.name}_bucket{label_text} {cumulative}')
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f'{self.name}_sum{label_text} {_format_value(entry[-1])}')
+            lines.append(f'{self.name}_count{label_text} {cumulative}')
+        return lines
+
+
+class Gauge:
+    """A Prometheus gauge, either set directly or read from ``function`` at scrape time.
+
+    ``inc``/``dec`` are meant for the event loop thread only. ``function``
+    returns a number, or a dict of label value tuples to numbers.
+    """
+
+    type = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), function=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.function = function
+        self._values = {}
+        _registry.append(self)
+
+    def inc(self, *labels, amount=1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        value = self._values.get(labels, 0) - amount
+        if value or not self.labelnames:
+            self._values[labels] = value
+        else:
+            # Drop label sets that reach zero, e.g. rooms nobody is in any more
+            self._values.pop(labels, None)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type}']
+        values = self._values.copy()
+        if self.function is not None:
+            values = self.function()
+            if not isinstance(values, dict):
+                values = {(): values}
+        for labels, value in sorted(values.items()):
+            lines.append(f'{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}')
+        return lines
+
+
+class Counter(Gauge):
+    """A Prometheus counter read from ``function``, for totals kept elsewhere."""
+
+    type = 'counter'
+
+
+def render():
+    """Returns every registered metric in the Prometheus text format."""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+def _latency_quantiles():
+    from editor.services.tracing import latency_quantiles
+    return latency_quantiles()
+
+
+def _spectator_counts():
+    from editor.services.spectators import spectator_counts
+    return {(room_id,): count for room_id, count in spectator_counts().items()}
+
+
+def _sweeper_jobs(field):
+    from editor.services.sweeper import get_sweeper
+    jobs = get_sweeper().snapshot()['jobs']
+    return {(name,): stats[field] for name, stats in jobs.items()}
+
+
+def _sweeper_cycle(field):
+    from editor.services.sweeper import get_sweeper
+    return get_sweeper().snapshot()[field]
+
+
+def _loop_lag():
+    from editor.services.admission import loop_lag
+    return loop_lag()
+
+
+# Realtime path
+WS_RECEIVE_SECONDS = Histogram(
+    'editor_ws_receive_seconds', 'Time EditorConsumer.receive spends on one client message.', ['type']
+)
+GROUP_SEND_SECONDS = Histogram(
+    'editor_group_send_seconds', 'Time group_send takes to hand an event to the channel layer.', ['type']
+)
+ACTIVE_SOCKETS = Gauge(
+    'editor_active_sockets', 'Editor WebSocket connections open in this process.', ['room']
+)
+SPECTATORS = Gauge(
+    'editor_spectators', 'Spectators connected to each room through this process.', ['room'],
+    function=_spectator_counts
+)
+DB_QUERY_SECONDS = Histogram(
+    'editor_db_query_seconds', 'Time spent in consumer database functions.', ['method']
+)
+EVENT_LOOP_LAG = Gauge(
+    'editor_event_loop_lag_seconds', 'How late the event loop wakes from a short sleep.', function=_loop_lag
+)
+ROOM_LATENCY = Gauge(
+    'editor_room_latency_seconds', 'Recent edit trace span and client RTT percentiles per room.',
+    ['room', 'span', 'quantile'], function=_latency_quantiles
+)
+
+# Stale data sweeper (counts only cycles run by this process)
+SWEEPER_CYCLES = Counter(
+    'editor_sweeper_cycles_total', 'Sweeper cycles run.', function=lambda: _sweeper_cycle('cycles')
+)
+SWEEPER_CYCLE_SECONDS = Gauge(
+    'editor_sweeper_last_cycle_seconds', 'Duration of the last sweeper cycle.',
+    function=lambda: _sweeper_cycle('last_cycle_duration')
+)
+SWEEPER_ROWS = Counter(
+    'editor_sweeper_rows_total', 'Rows deleted or deactivated per sweeper job.', ['job'],
+    function=lambda: _sweeper_jobs('swept')
+)
+SWEEPER_BATCHES = Counter(
+    'editor_sweeper_batches_total', 'Primary-key range batches run per sweeper job.', ['job'],
+    function=lambda: _sweeper_jobs('batches')
+)
+SWEEPER_PASSES = Counter(
+    'editor_sweeper_passes_total', 'Full table passes completed per sweeper job.', ['job'],
+    function=lambda: _sweeper_jobs('passes')
+)
+SWEEPER_JOB_SECONDS = Gauge(
+    'editor_sweeper_last_job_seconds', 'Time the last cycle spent on each sweeper job.', ['job'],
+    function=lambda: _sweeper_jobs('last_duration')
+)
+
+# Execution path
+EXECUTION_QUEUE_SECONDS = Histogram(
+    'code_execution_queue_seconds', 'Time from submission until the container is launched.', ['language']
+)
+CONTAINER_START_SECONDS = Histogram(
+    'code_execution_container_start_seconds', 'Time to create and start a container.', ['language']
+)
+CONTAINER_RUN_SECONDS = Histogram(
+    'code_execution_run_seconds', 'Time from container start until the program exits.', ['language']
+)
+LANGUAGE_SERVER_SECONDS = Histogram(
+    'language_server_request_seconds', 'Language server request latency.', ['language', 'method']
+)
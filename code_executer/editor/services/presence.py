@@ -0,0 +1,228 @@
+import time
+import threading
+import logging
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+class BasePresenceStore:
+    """Per-room presence with TTL heartbeats.
+
+    A user is present in a room while they have at least one open connection
+    or have sent a heartbeat within ``ttl`` seconds. Every method returns
+    quickly and never touches the database.
+    """
+
+    # True when methods do network I/O and should be called off the event loop
+    blocking = False
+
+    def __init__(self, ttl=None, **options):
+        self.ttl = ttl or settings.PRESENCE_TTL
+
+    def join(self, room_id, user_id, username):
+        """Registers a connection; returns True if the user was not present before."""
+        raise NotImplementedError
+
+    def leave(self, room_id, user_id):
+        """Drops a connection; returns True if it was the user's last one."""
+        raise NotImplementedError
+
+    def heartbeat(self, room_id, user_id, username):
+        """Refreshes the user's TTL without opening a connection."""
+        raise NotImplementedError
+
+    def set_idle(self, room_id, user_id, idle):
+        """Marks the user idle or active; returns True if the state changed."""
+        raise NotImplementedError
+
+    def members(self, room_id):
+        """Returns ``[{'user_id', 'username', 'idle'}, ...]`` for present users."""
+        raise NotImplementedError
+
+    def count(self, room_id):
+        """Returns the number of present users."""
+        return len(self.members(room_id))
+
+
+class MemoryPresenceStore(BasePresenceStore):
+    """In-process presence store.
+
+    Only sees connections handled by the current process, so it suits a
+    single worker; use ``RedisPresenceStore`` with several.
+    """
+
+    def __init__(self, ttl=None, **options):
+        super().__init__(ttl, **options)
+        # room_id -> {user_id: [username, connections, expires_at, idle]}
+        self._rooms = {}
+        self._lock = threading.Lock()
+
+    def _entry(self, room_id, user_id, username):
+        room = self._rooms.setdefault(room_id, {})
+        entry = room.get(user_id)
+        now = time.monotonic()
+        fresh = entry is None or (entry[1] == 0 and entry[2] <= now)
+        if fresh:
+            entry = room[user_id] = [username, 0, now + self.ttl, False]
+        return entry, fresh
+
+    def join(self, room_id, user_id, username):
+        with self._lock:
+            entry, fresh = self._entry(room_id, user_id, username)
+            entry[1] += 1
+            entry[2] = time.monotonic() + self.ttl
+            entry[3] = False
+            return fresh
+
+    def leave(self, room_id, user_id):
+        with self._lock:
+            room = self._rooms.get(room_id, {})
+            entry = room.get(user_id)
+            if entry is None:
+                return False
+            entry[1] = max(0, entry[1] - 1)
+            if entry[1] == 0:
+                del room[user_id]
+                if not room:
+                    self._rooms.pop(room_id, None)
+                return True
+            return False
+
+    def heartbeat(self, room_id, user_id, username):
+        with self._lock:
+            entry, fresh = self._entry(room_id, user_id, username)
+            entry[2] = time.monotonic() + self.ttl
+            return fresh
+
+    def set_idle(self, room_id, user_id, idle):
+        with self._lock:
+            entry = self._rooms.get(room_id, {}).get(user_id)
+            if entry is None or entry[3] == idle:
+                return False
+            entry[3] = idle
+            return True
+
+    def members(self, room_id):
+        now = time.monotonic()
+        with self._lock:
+            room = self._rooms.get(room_id)
+            if not room:
+                return []
+            expired = [user_id for user_id, entry in room.items() if entry[1] == 0 and entry[2] <= now]
+            for user_id in expired:
+                del room[user_id]
+            return [
+                {'user_id': user_id, 'username': entry[0], 'idle': entry[3]}
+                for user_id, entry in room.items()
+            ]
+
+
+class RedisPresenceStore(BasePresenceStore):
+    """Redis-backed presence store shared by every worker process.
+
+    Each room is a sorted set of user ids scored by expiry time, plus a hash
+    of connection counts and one of usernames/idle flags. Connections refresh
+    their score on heartbeat; members are whoever has an unexpired score.
+    """
+
+    blocking = True
+
+    def __init__(self, ttl=None, url='redis://127.0.0.1:6379/0', prefix='presence', **options):
+        super().__init__(ttl, **options)
+        try:
+            import redis
+        except ImportError:
+            raise ImproperlyConfigured("RedisPresenceStore requires the 'redis' package")
+        self.redis = redis.Redis.from_url(url, decode_responses=True)
+        self.prefix = prefix
+
+    def _keys(self, room_id):
+        base = f"{self.prefix}:{room_id}"
+        return f"{base}:expiry", f"{base}:connections", f"{base}:info"
+
+    def _touch(self, pipe, room_id, user_id, username):
+        expiry, connections, info = self._keys(room_id)
+        pipe.zadd(expiry, {user_id: time.time() + self.ttl})
+        pipe.hset(info, f"{user_id}:name", username)
+        for key in (expiry, connections, info):
+            pipe.expire(key, int(self.ttl * 2))
+
+    def _was_present(self, room_id, user_id):
+        expiry, connections, info = self._keys(room_id)
+        score = self.redis.zscore(expiry, user_id)
+        return score is not None and score > time.time()
+
+    def join(self, room_id, user_id, username):
+        expiry, connections, info = self._keys(room_id)
+        fresh = not self._was_present(room_id, user_id)
+        with self.redis.pipeline() as pipe:
+            pipe.hincrby(connections, user_id, 1)
+            pipe.hset(info, f"{user_id}:idle", 0)
+            self._touch(pipe, room_id, user_id, username)
+            pipe.execute()
+        return fresh
+
+    def leave(self, room_id, user_id):
+        expiry, connections, info = self._keys(room_id)
+        remaining = self.redis.hincrby(connections, user_id, -1)
+        if remaining > 0:
+            return False
+        with self.redis.pipeline() as pipe:
+            pipe.hdel(connections, user_id)
+            pipe.zrem(expiry, user_id)
+            pipe.hdel(info, f"{user_id}:name", f"{user_id}:idle")
+            pipe.execute()
+        return True
+
+    def heartbeat(self, room_id, user_id, username):
+        fresh = not self._was_present(room_id, user_id)
+        with self.redis.pipeline() as pipe:
+            self._touch(pipe, room_id, user_id, username)
+            pipe.execute()
+        return fresh
+
+    def set_idle(self, room_id, user_id, idle):
+        expiry, connections, info = self._keys(room_id)
+        previous = self.redis.hget(info, f"{user_id}:idle")
+        self.redis.hset(info, f"{user_id}:idle", int(idle))
+        return previous != str(int(idle))
+
+    def members(self, room_id):
+        expiry, connections, info = self._keys(room_id)
+        now = time.time()
+        with self.redis.pipeline() as pipe:
+            pipe.zremrangebyscore(expiry, '-inf', now)
+            pipe.zrange(expiry, 0, -1)
+            pipe.hgetall(info)
+            removed, user_ids, details = pipe.execute()
+        return [
+            {
+                'user_id': user_id,
+                'username': details.get(f"{user_id}:name", ''),
+                'idle': details.get(f"{user_id}:idle") == '1',
+            }
+            for user_id in user_ids
+        ]
+
+    def count(self, room_id):
+        expiry, connections, info = self._keys(room_id)
+        return self.redis.zcount(expiry, time.time(), '+inf')
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_presence_store():
+    """Returns the process-wide presence store configured in settings."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                backend = import_string(settings.PRESENCE_BACKEND)
+                _store = backend(**settings.PRESENCE_OPTIONS)
+    return _store
@@ -0,0 +1,263 @@
+import re
+import time
+import threading
+import logging
+from collections import OrderedDict
+
+try:
+    from re import _constants as sre_constants, _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_constants
+    import sre_parse
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+MAX_PREVIEW_LENGTH = 200
+
+
+def trigrams(text):
+    """Returns the set of lower-cased trigrams in ``text``."""
+    text = text.lower()
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _literal_runs(parsed, runs, current):
+    """Collects literal strings every match of a parsed regex must contain.
+
+    Walks only the mandatory top-level sequence: alternations, optional or
+    repeated groups and character classes end the current run rather than
+    contributing to it, so the result is always a safe under-approximation.
+    """
+    for op, value in parsed:
+        if op == sre_constants.LITERAL:
+            current.append(chr(value))
+        elif op == sre_constants.SUBPATTERN:
+            _literal_runs(value[-1], runs, current)
+        elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT):
+            low, high, item = value
+            if low >= 1:
+                # The first repetition is mandatory and contiguous with what precedes it
+                _literal_runs(item, runs, current)
+            runs.append(''.join(current))
+            current.clear()
+        elif op == sre_constants.AT:
+            continue
+        else:
+            runs.append(''.join(current))
+            current.clear()
+
+
+def required_literals(pattern):
+    """Returns the literal substrings (length >= 3) any match of ``pattern`` contains."""
+    try:
+        parsed = sre_parse.parse(pattern)
+    except (re.error, sre_constants.error):
+        return []
+    runs, current = [], []
+    _literal_runs(parsed, runs, current)
+    runs.append(''.join(current))
+    return [run for run in runs if len(run) >= 3]
+
+
+def _nested_repeat(parsed, repeated=False):
+    """Whether a parsed regex repeats something that itself repeats a variable number of times."""
+    for op, value in parsed:
+        if op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT):
+            low, high, item = value
+            if repeated and low != high:
+                return True
+            if _nested_repeat(item, repeated or high > 1):
+                return True
+        elif op == sre_constants.SUBPATTERN:
+            if _nested_repeat(value[-1], repeated):
+                return True
+        elif op == sre_constants.BRANCH:
+            if any(_nested_repeat(branch, repeated) for branch in value[1]):
+                return True
+        elif op in (sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+            if _nested_repeat(value[1], repeated):
+                return True
+    return False
+
+
+def compile_search_pattern(query, flags=0):
+    """Compiles a user regex, refusing ones that can backtrack catastrophically.
+
+    Patterns longer than SEARCH_MAX_PATTERN_LENGTH and nested variable
+    repeats such as ``(a+)+`` raise ``re.error``.
+    """
+    if len(query) > settings.SEARCH_MAX_PATTERN_LENGTH:
+        raise re.error(f'pattern is longer than {settings.SEARCH_MAX_PATTERN_LENGTH} characters')
+    pattern = re.compile(query, flags)
+    if _nested_repeat(sre_parse.parse(query, flags)):
+        raise re.error('nested repeats such as (a+)+ are not supported')
+    return pattern
+
+
+class TrigramIndex:
+    """Trigram posting lists over the file contents of a single room.
+
+    Each file contributes its set of lower-cased trigrams, so a query only
+    needs to scan the files containing every trigram of its required
+    literals. Case-sensitive queries are pruned the same way and then
+    checked against the original text.
+    """
+
+    def __init__(self, room_id):
+        self.room_id = room_id
+        self.contents = {}
+        # filename -> updated_at of the indexed revision
+        self.versions = {}
+        # trigram -> {filename, ...}
+        self.postings = {}
+        self.built = False
+        self._lock = threading.RLock()
+
+    def build(self, files):
+        """Builds the index from ``(filename, content, updated_at)`` rows."""
+        with self._lock:
+            self.contents = {}
+            self.versions = {}
+            self.postings = {}
+            for filename, content, updated_at in files:
+                self._add(filename, content or '', updated_at)
+            self.built = True
+
+    def update_file(self, filename, content, updated_at=None):
+        """Re-indexes a single created or updated file."""
+        with self._lock:
+            self._remove(filename)
+            self._add(filename, content or '', updated_at)
+
+    def remove_file(self, filename):
+        """Drops a deleted file from the index."""
+        with self._lock:
+            self._remove(filename)
+
+    def rename_file(self, old_filename, new_filename, updated_at=None):
+        """Moves a file's postings to its new name without re-reading its content."""
+        with self._lock:
+            content = self.contents.get(old_filename)
+            if content is None:
+                return
+            self._remove(old_filename)
+            self._add(new_filename, content, updated_at)
+
+    def signature(self):
+        """Returns ``(file count, newest updated_at)`` for staleness checks."""
+        with self._lock:
+            versions = [version for version in self.versions.values() if version is not None]
+            return len(self.versions), max(versions) if versions else None
+
+    def _add(self, filename, content, updated_at):
+        self.contents[filename] = content
+        self.versions[filename] = updated_at
+        for trigram in trigrams(content):
+            self.postings.setdefault(trigram, set()).add(filename)
+
+    def _remove(self, filename):
+        content = self.contents.pop(filename, None)
+        self.versions.pop(filename, None)
+        if content is None:
+            return
+        for trigram in trigrams(content):
+            owners = self.postings.get(trigram)
+            if owners is not None:
+                owners.discard(filename)
+                if not owners:
+                    del self.postings[trigram]
+
+    def candidates(self, literals):
+        """Returns the sorted filenames that contain every trigram of ``literals``."""
+        with self._lock:
+            needed = set()
+            for literal in literals:
+                needed |= trigrams(literal)
+            if not needed:
+                return sorted(self.contents)
+            # Intersect the rarest posting lists first
+            postings = sorted((self.postings.get(trigram, set()) for trigram in needed), key=len)
+            result = set(postings[0])
+            for owners in postings[1:]:
+                if not result:
+                    break
+                result &= owners
+            return sorted(result)
+
+    def search(self, query, regex=False, case_sensitive=False, after=None, limit=50):
+        """Finds matching lines across the room's files.
+
+        Returns ``(matches, cursor)``. Matches are ordered by filename and
+        line; ``cursor`` is ``None`` once the last page has been produced,
+        and otherwise is passed back as ``after`` to fetch the next page.
+        A page also ends early once SEARCH_TIME_BUDGET is spent, and regex
+        queries only see the first SEARCH_MAX_LINE_LENGTH characters of a line.
+        """
+        flags = 0 if case_sensitive else re.IGNORECASE
+        if regex:
+            pattern = compile_search_pattern(query, flags)
+            literals = required_literals(query)
+            max_line = settings.SEARCH_MAX_LINE_LENGTH
+        else:
+            pattern = re.compile(re.escape(query), flags)
+            literals = [query]
+            max_line = None
+
+        deadline = time.monotonic() + settings.SEARCH_TIME_BUDGET
+        after_file, after_line = (after or (None, 0))
+        matches = []
+        for filename in self.candidates(literals):
+            if after_file is not None and filename < after_file:
+                continue
+            with self._lock:
+                content = self.contents.get(filename)
+            if content is None:
+                continue
+            for lineno, line in enumerate(content.splitlines(), start=1):
+                if filename == after_file and lineno <= after_line:
+                    continue
+                match = pattern.search(line[:max_line])
+                if match is not None:
+                    if len(matches) == limit:
+                        return matches, (matches[-1]['filename'], matches[-1]['line'] + 1)
+                    matches.append({
+                        'filename': filename,
+                        # Editor (0-based) line numbers, as used by CodeMirror
+                        'line': lineno - 1,
+                        'ch': match.start(),
+                        'length': match.end() - match.start(),
+                        'preview': line[:MAX_PREVIEW_LENGTH],
+                    })
+                # Checked after the line, so every page makes progress
+                if time.monotonic() > deadline:
+                    return matches, (filename, lineno)
+        return matches, None
+
+
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def get_search_index(room_id):
+    """Returns the process-wide trigram index for a room, creating it if needed.
+
+    Indexes for up to ROOM_INDEX_MAX_ROOMS rooms are kept, dropping the
+    least recently used first; search rebuilds a missing index.
+    """
+    with _indexes_lock:
+        index = _indexes.get(room_id)
+        if index is None:
+            index = _indexes[room_id] = TrigramIndex(room_id)
+            while len(_indexes) > settings.ROOM_INDEX_MAX_ROOMS:
+                _indexes.popitem(last=False)
+        else:
+            _indexes.move_to_end(room_id)
+        return index
+
+
+def drop_search_index(room_id):
+    """Forgets a room's trigram index, e.g. when the room is deleted."""
+    with _indexes_lock:
+        _indexes.pop(room_id, None)
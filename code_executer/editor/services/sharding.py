@@ -0,0 +1,374 @@
+import os
+import time
+import socket
+import asyncio
+import bisect
+import hashlib
+import threading
+import logging
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+def get_worker_id():
+    """This process's name on the hash ring."""
+    return settings.ROOM_SHARDING_WORKER_ID or f"{socket.gethostname()}:{os.getpid()}"
+
+
+class HashRing:
+    """Consistent hashing of room ids onto workers.
+
+    Each worker gets ``replicas`` points on the ring; a room belongs to the
+    first point at or after its own hash. Adding or removing a worker only
+    moves the rooms between it and its neighbours.
+    """
+
+    def __init__(self, nodes=(), replicas=None):
+        self.replicas = replicas or settings.ROOM_SHARDING_REPLICAS
+        self._points = []
+        self._nodes = {}
+        for node in nodes:
+            self.add(node)
+
+    @staticmethod
+    def _hash(key):
+        return int.from_bytes(hashlib.md5(key.encode('utf-8')).digest()[:8], 'big')
+
+    def add(self, node):
+        for replica in range(self.replicas):
+            point = self._hash(f"{node}#{replica}")
+            if point not in self._nodes:
+                bisect.insort(self._points, point)
+                self._nodes[point] = node
+
+    def remove(self, node):
+        for replica in range(self.replicas):
+            point = self._hash(f"{node}#{replica}")
+            if self._nodes.get(point) == node:
+                del self._nodes[point]
+                self._points.remove(point)
+
+    def owner(self, key):
+        if not self._points:
+            return None
+        index = bisect.bisect(self._points, self._hash(key)) % len(self._points)
+        return self._nodes[self._points[index]]
+
+
+class BaseRoomOwnership:
+    """Decides which worker process owns each room.
+
+    The owner runs every op for the room, in order, so it can keep the
+    room's in-memory state (symbol index, diagnostics) authoritative.
+    """
+
+    # True when rooms may be owned by another process
+    distributed = False
+    # True when methods do network I/O and should be called off the event loop
+    blocking = False
+
+    def __init__(self, lease=None, **options):
+        self.lease = lease or settings.ROOM_SHARDING_LEASE
+        self.worker_id = get_worker_id()
+
+    def register(self, address):
+        """Announces (or keeps alive) this worker and the channel it receives ops on."""
+
+    def unregister(self, rooms):
+        """Removes this worker and gives up its rooms, e.g. on shutdown."""
+
+    def lookup(self, room_id):
+        """Returns ``(worker_id, address)`` of the room's owner, claiming it if it should be ours."""
+        return self.worker_id, None
+
+    def renew(self, rooms):
+        """Extends this worker's leases; returns the rooms it should no longer own."""
+        return []
+
+    def release(self, room_id):
+        """Gives up ownership of a room."""
+
+
+class LocalRoomOwnership(BaseRoomOwnership):
+    """Every room is owned by the current process; suits a single worker."""
+
+
+class RedisRoomOwnership(BaseRoomOwnership):
+    """Room ownership shared by every worker process through Redis.
+
+    Live workers heartbeat into a sorted set scored by expiry, alongside the
+    channel name they receive forwarded ops on. A room's preferred owner is
+    its position on a hash ring of the live workers, and ownership itself is
+    a lease key (``SET NX PX``) renewed by the owner. When a worker dies its
+    leases lapse and the ring hands its rooms to the neighbours; when the
+    pool grows, owners release rooms that now hash elsewhere.
+    """
+
+    distributed = True
+    blocking = True
+
+    RENEW = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('pexpire', KEYS[1], ARGV[2]) end return 0"
+    RELEASE = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end return 0"
+
+    def __init__(self, lease=None, url='redis://127.0.0.1:6379/0', prefix='rooms', **options):
+        super().__init__(lease, **options)
+        try:
+            import redis
+        except ImportError:
+            raise ImproperlyConfigured("RedisRoomOwnership requires the 'redis' package")
+        self.redis = redis.Redis.from_url(url, decode_responses=True)
+        self.prefix = prefix
+        self._renew = self.redis.register_script(self.RENEW)
+        self._release = self.redis.register_script(self.RELEASE)
+        self._ring = None
+        self._ring_workers = None
+
+    def _lease_key(self, room_id):
+        return f"{self.prefix}:owner:{room_id}"
+
+    def _live_workers(self):
+        workers_key = f"{self.prefix}:workers"
+        with self.redis.pipeline() as pipe:
+            pipe.zremrangebyscore(workers_key, '-inf', time.time())
+            pipe.zrange(workers_key, 0, -1)
+            pipe.hgetall(f"{self.prefix}:addresses")
+            removed, workers, addresses = pipe.execute()
+        return {worker: addresses.get(worker) for worker in workers}
+
+    def _ring_for(self, workers):
+        names = frozenset(workers)
+        if names != self._ring_workers:
+            self._ring = HashRing(sorted(names))
+            self._ring_workers = names
+        return self._ring
+
+    def register(self, address):
+        with self.redis.pipeline() as pipe:
+            pipe.zadd(f"{self.prefix}:workers", {self.worker_id: time.time() + self.lease})
+            pipe.hset(f"{self.prefix}:addresses", self.worker_id, address)
+            pipe.execute()
+
+    def unregister(self, rooms):
+        for room_id in rooms:
+            self.release(room_id)
+        with self.redis.pipeline() as pipe:
+            pipe.zrem(f"{self.prefix}:workers", self.worker_id)
+            pipe.hdel(f"{self.prefix}:addresses", self.worker_id)
+            pipe.execute()
+
+    def lookup(self, room_id):
+        workers = self._live_workers()
+        key = self._lease_key(room_id)
+        holder = self.redis.get(key)
+        if holder in workers:
+            return holder, workers[holder]
+
+        preferred = self._ring_for(workers).owner(room_id) or self.worker_id
+        if preferred == self.worker_id:
+            if self.redis.set(key, self.worker_id, nx=True, px=int(self.lease * 1000)):
+                return self.worker_id, None
+            holder = self.redis.get(key)
+            if holder in workers:
+                return holder, workers[holder]
+            # The holder stopped heartbeating; take the room over
+            self.redis.set(key, self.worker_id, px=int(self.lease * 1000))
+            return self.worker_id, None
+        return preferred, workers.get(preferred)
+
+    def renew(self, rooms):
+        ring = self._ring_for(self._live_workers())
+        lost = []
+        for room_id in rooms:
+            if ring.owner(room_id) not in (None, self.worker_id):
+                lost.append(room_id)
+            elif not self._renew(keys=[self._lease_key(room_id)], args=[self.worker_id, int(self.lease * 1000)]):
+                lost.append(room_id)
+        return lost
+
+    def release(self, room_id):
+        self._release(keys=[self._lease_key(room_id)], args=[self.worker_id])
+
+
+class RoomRouter:
+    """Routes a room's ops to its owner worker.
+
+    Each process has one router with an inbox channel on the channel layer.
+    Ops for rooms owned elsewhere are sent to the owner's inbox; ops for
+    rooms owned here, local or forwarded, run one at a time per room.
+    ``handler(message)`` runs a forwarded op.
+    """
+
+    MAX_HOPS = 2
+
+    def __init__(self, channel_layer, handler, ownership=None):
+        self.channel_layer = channel_layer
+        self.handler = handler
+        self.ownership = ownership or get_room_ownership()
+        self.address = None
+        self.owned = set()
+        self._owners = {}  # room_id -> (worker_id, address, expires_at)
+        self._locks = {}
+        self._tasks = []
+
+    async def _call(self, method, *args):
+        func = getattr(self.ownership, method)
+        if self.ownership.blocking:
+            return await sync_to_async(func, thread_sensitive=False)(*args)
+        return func(*args)
+
+    @property
+    def distributed(self):
+        return self.ownership.distributed
+
+    async def start(self):
+        if not self.distributed:
+            return
+        self.address = await self.channel_layer.new_channel('rooms')
+        await self._call('register', self.address)
+        loop = asyncio.get_running_loop()
+        self._tasks = [loop.create_task(self._receive_loop()), loop.create_task(self._renew_loop())]
+        logger.info(f"Room router for {self.ownership.worker_id} listening on {self.address}")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        if self.distributed and self.address:
+            for room_id in list(self.owned):
+                async with self.room_lock(room_id):
+                    pass
+            await self._call('unregister', list(self.owned))
+            self.owned.clear()
+
+    def room_lock(self, room_id):
+        lock = self._locks.get(room_id)
+        if lock is None:
+            lock = self._locks[room_id] = asyncio.Lock()
+        return lock
+
+    async def route(self, room_id):
+        """Returns the owner's inbox for a room owned elsewhere, or None if it is ours."""
+        if not self.distributed:
+            return None
+        cached = self._owners.get(room_id)
+        if cached is None or cached[2] <= time.monotonic():
+            worker_id, address = await self._call('lookup', room_id)
+            cached = self._owners[room_id] = (worker_id, address, time.monotonic() + self.ownership.lease / 3)
+            if worker_id == self.ownership.worker_id:
+                self.owned.add(room_id)
+        if cached[0] == self.ownership.worker_id or cached[1] is None:
+            return None
+        return cached[1]
+
+    async def forward(self, address, message):
+        """Sends an op to the owner's inbox."""
+        message = dict(message, type='room.op', hops=message.get('hops', 0) + 1)
+        await self.channel_layer.send(address, message)
+
+    async def run(self, room_id, coroutine_func):
+        """Runs a local op, serialised with every other op for the room."""
+        if not self.distributed:
+            return await coroutine_func()
+        async with self.room_lock(room_id):
+            return await coroutine_func()
+
+    async def _receive_loop(self):
+        while True:
+            try:
+                message = await self.channel_layer.receive(self.address)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Room router receive failed: {str(e)}")
+                await asyncio.sleep(1)
+                continue
+            asyncio.ensure_future(self._apply(message))
+
+    async def _apply(self, message):
+        room_id = message['room_id']
+        try:
+            address = await self.route(room_id)
+            if address is not None and message.get('hops', 0) < self.MAX_HOPS:
+                # Ownership moved while the op was in flight
+                await self.forward(address, message)
+                return
+            await self.run(room_id, lambda: self.handler(message))
+        except Exception as e:
+            logger.error(f"Forwarded op for room {room_id} failed: {str(e)}", exc_info=True)
+
+    async def _renew_loop(self):
+        while True:
+            await asyncio.sleep(self.ownership.lease / 3)
+            try:
+                await self._call('register', self.address)
+                lost = await self._call('renew', list(self.owned))
+                for room_id in lost:
+                    # Let in-flight ops finish before handing the room over
+                    async with self.room_lock(room_id):
+                        self.owned.discard(room_id)
+                        self._owners.pop(room_id, None)
+                        await self._call('release', room_id)
+                    logger.info(f"Handed off room {room_id}")
+                for room_id in [room_id for room_id, lock in self._locks.items()
+                                if room_id not in self.owned and not lock.locked()]:
+                    del self._locks[room_id]
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Room lease renewal failed: {str(e)}")
+
+
+_ownership = None
+_ownership_lock = threading.Lock()
+_router = None
+# Created on first use, inside the running event loop
+_router_lock = None
+
+
+def get_room_ownership():
+    """Returns the process-wide room ownership backend configured in settings."""
+    global _ownership
+    if _ownership is None:
+        with _ownership_lock:
+            if _ownership is None:
+                backend = import_string(settings.ROOM_SHARDING_BACKEND)
+                _ownership = backend(**settings.ROOM_SHARDING_OPTIONS)
+    return _ownership
+
+
+async def get_room_router(channel_layer, handler):
+    """Returns the process-wide router, starting its inbox on first use.
+
+    The router is only published once ``start()`` has finished, so no
+    caller sees one whose inbox and ownership are not set up yet.
+    """
+    global _router
+    if _router is not None:
+        return _router
+    async with _get_router_lock():
+        if _router is None:
+            router = RoomRouter(channel_layer, handler)
+            await router.start()
+            _router = router
+    return _router
+
+
+async def shutdown_room_router():
+    """Stops the router and hands this worker's rooms over."""
+    global _router
+    async with _get_router_lock():
+        router, _router = _router, None
+        if router is not None:
+            await router.stop()
+
+
+def _get_router_lock():
+    global _router_lock
+    if _router_lock is None:
+        _router_lock = asyncio.Lock()
+    return _router_lock
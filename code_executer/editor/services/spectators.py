@@ -0,0 +1,267 @@
+import json
+import asyncio
+import logging
+from collections import deque
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils import timezone
+
+from editor.models import CodeSession, FileEntry
+from editor.services.db_executor import db_sync_to_async
+from editor.services.presence import get_presence_store
+
+logger = logging.getLogger(__name__)
+
+
+def splice(old, new):
+    """Returns ``[start, end, text]`` such that ``new == old[:start] + text + old[end:]``."""
+    if old == new:
+        return None
+    limit = min(len(old), len(new))
+    start = 0
+    while start < limit and old[start] == new[start]:
+        start += 1
+    suffix = 0
+    while suffix < limit - start and old[-1 - suffix] == new[-1 - suffix]:
+        suffix += 1
+    return [start, len(old) - suffix, new[start:len(new) - suffix]]
+
+
+@db_sync_to_async
+def load_room_snapshot(room_id):
+    """Returns (code, language, files) as last stored for the room."""
+    latest = CodeSession.objects.filter(
+        room__room_id=room_id
+    ).select_related('blob').order_by('-created_at').first()
+    files = dict(FileEntry.objects.filter(room__room_id=room_id).values_list('filename', 'blob__content'))
+    if latest is None:
+        return '', 'python', files
+    return latest.code_content, latest.language, files
+
+
+class RoomBroadcaster:
+    """Serves every spectator of one room in this process.
+
+    The broadcaster is the only member of the room group on behalf of its
+    spectators. Room events update its state, and every
+    SPECTATOR_FRAME_INTERVAL at most one delta frame is encoded and sent,
+    unchanged, to each spectator. Deltas are ``[start, end, text]`` splices
+    against the previous frame; ``seq`` increases by one per frame, and a
+    snapshot carries the ``seq`` it reflects so clients can resume from it.
+    """
+
+    def __init__(self, room_id, channel_layer):
+        self.room_id = room_id
+        self.channel_layer = channel_layer
+        self.group_name = f"editor_{room_id}"
+        self.spectators = set()
+        self.seq = 0
+        self.connected_users = 0
+        # Published state, as of ``seq``
+        self.code = ''
+        self.language = 'python'
+        self.files = {}
+        self.chat = deque(maxlen=settings.SPECTATOR_CHAT_HISTORY)
+        # State changed since the last frame
+        self._code = None
+        self._language = None
+        self._files = {}  # filename -> content, or None when deleted
+        self._chat = []
+        self._counts_changed = False
+        self._snapshot = None  # (seq, encoded text)
+        self._channel = None
+        self._tasks = []
+        self.ready = None  # the start() task
+        self.joining = 0  # join_spectator calls waiting for ``ready``
+
+    async def start(self):
+        self._channel = await self.channel_layer.new_channel('spectate.')
+        # Join first so events arriving during the load queue up behind it
+        await self.channel_layer.group_add(self.group_name, self._channel)
+        self.code, self.language, self.files = await load_room_snapshot(self.room_id)
+        store = get_presence_store()
+        if store.blocking:
+            self.connected_users = await sync_to_async(store.count, thread_sensitive=False)(self.room_id)
+        else:
+            self.connected_users = store.count(self.room_id)
+        loop = asyncio.get_running_loop()
+        self._tasks = [loop.create_task(self._receive_loop()), loop.create_task(self._frame_loop())]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        if self._channel is not None:
+            await self.channel_layer.group_discard(self.group_name, self._channel)
+            self._channel = None
+
+    async def add(self, spectator):
+        self.spectators.add(spectator)
+        self._counts_changed = True
+        await spectator.send(text_data=self.snapshot())
+
+    def remove(self, spectator):
+        self.spectators.discard(spectator)
+        self._counts_changed = True
+
+    def snapshot(self):
+        """The published state as one encoded frame, encoded once per ``seq``."""
+        if self._snapshot is None or self._snapshot[0] != self.seq:
+            self._snapshot = (self.seq, json.dumps({
+                'type': 'spectator_snapshot',
+                'seq': self.seq,
+                'code': self.code,
+                'language': self.language,
+                'files': self.files,
+                'chat': list(self.chat),
+                'connected_users': self.connected_users,
+                'spectators': len(self.spectators),
+            }))
+        return self._snapshot[1]
+
+    def apply(self, event):
+        """Records a room group event for the next frame."""
+        kind = event.get('type')
+        if kind == 'broadcast_code':
+            self._code = event['code']
+            self._language = event['language']
+        elif kind == 'broadcast_file_update':
+            action = event['action']
+            if action in ('create', 'update'):
+                self._files[event['filename']] = event['content']
+            elif action == 'delete':
+                self._files[event['filename']] = None
+            elif action == 'rename' and event.get('newFilename'):
+                current = self._files.get(event['filename'], self.files.get(event['filename'], ''))
+                self._files[event['filename']] = None
+                self._files[event['newFilename']] = current
+        elif kind == 'broadcast_chat':
+            self._chat.append({
+                'user': event['user'],
+                'message': event['message'],
+                'timestamp': event['timestamp'],
+            })
+        elif kind == 'broadcast_presence':
+            self.connected_users = event['connected_users']
+            self._counts_changed = True
+
+    def next_frame(self):
+        """Folds pending changes into the published state; returns the encoded delta or None."""
+        frame = {}
+        if self._code is not None:
+            delta = splice(self.code, self._code)
+            if delta:
+                frame['code'] = delta
+                self.code = self._code
+            if self._language != self.language:
+                frame['language'] = self.language = self._language
+            self._code = self._language = None
+
+        files, deleted = {}, []
+        for filename, content in self._files.items():
+            if content is None:
+                if self.files.pop(filename, None) is not None:
+                    deleted.append(filename)
+                continue
+            delta = splice(self.files.get(filename, ''), content)
+            if delta or filename not in self.files:
+                files[filename] = delta or [0, 0, '']
+                self.files[filename] = content
+        self._files = {}
+        if files:
+            frame['files'] = files
+        if deleted:
+            frame['deleted'] = deleted
+
+        if self._chat:
+            frame['chat'] = self._chat
+            self.chat.extend(self._chat)
+            self._chat = []
+
+        if not frame and not self._counts_changed:
+            return None
+        self._counts_changed = False
+        self.seq += 1
+        frame.update({
+            'type': 'spectator_delta',
+            'seq': self.seq,
+            'connected_users': self.connected_users,
+            'spectators': len(self.spectators),
+            'timestamp': timezone.now().isoformat(),
+        })
+        return json.dumps(frame)
+
+    async def _receive_loop(self):
+        while True:
+            try:
+                self.apply(await self.channel_layer.receive(self._channel))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Spectator broadcaster for room {self.room_id} failed: {str(e)}")
+
+    async def _frame_loop(self):
+        while True:
+            await asyncio.sleep(settings.SPECTATOR_FRAME_INTERVAL)
+            text = self.next_frame()
+            if text is None:
+                continue
+            for spectator in list(self.spectators):
+                try:
+                    await spectator.send(text_data=text)
+                except Exception as e:
+                    logger.warning(f"Dropping spectator of room {self.room_id}: {str(e)}")
+                    self.spectators.discard(spectator)
+
+
+_broadcasters = {}
+
+
+async def join_spectator(room_id, spectator, channel_layer):
+    """Adds a spectator to the room's broadcaster, starting it for the first one."""
+    broadcaster = _broadcasters.get(room_id)
+    if broadcaster is None:
+        broadcaster = _broadcasters[room_id] = RoomBroadcaster(room_id, channel_layer)
+        broadcaster.ready = asyncio.ensure_future(broadcaster.start())
+    broadcaster.joining += 1
+    try:
+        await asyncio.shield(broadcaster.ready)
+    except asyncio.CancelledError:
+        # Gave up waiting; nobody may be left to stop a broadcaster still starting
+        broadcaster.joining -= 1
+        await _drop_if_idle(room_id, broadcaster)
+        raise
+    except Exception:
+        broadcaster.joining -= 1
+        if _broadcasters.get(room_id) is broadcaster:
+            del _broadcasters[room_id]
+        raise
+    broadcaster.joining -= 1
+    await broadcaster.add(spectator)
+    return broadcaster
+
+
+async def leave_spectator(room_id, spectator):
+    """Removes a spectator, stopping the room's broadcaster after the last one."""
+    broadcaster = _broadcasters.get(room_id)
+    if broadcaster is None:
+        return
+    broadcaster.remove(spectator)
+    await _drop_if_idle(room_id, broadcaster)
+
+
+async def _drop_if_idle(room_id, broadcaster):
+    """Stops and unregisters a broadcaster nobody watches or is joining, cancelling its start."""
+    if broadcaster.spectators or broadcaster.joining or _broadcasters.get(room_id) is not broadcaster:
+        return
+    del _broadcasters[room_id]
+    if not broadcaster.ready.done():
+        broadcaster.ready.cancel()
+        await asyncio.wait([broadcaster.ready])
+    await broadcaster.stop()
+
+
+def spectator_counts():
+    """Returns ``{room_id: spectators}`` for rooms with spectators in this process."""
+    return {room_id: len(broadcaster.spectators) for room_id, broadcaster in _broadcasters.items()}
@@ -0,0 +1,177 @@
+import time
+import threading
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from editor.models import Blob, ChatMessage, CodeRoom, CodeSession, FileEntry, UserSession
+
+logger = logging.getLogger(__name__)
+
+
+def stale_user_sessions(now):
+    """Active sessions with no activity for SWEEPER_SESSION_STALE_AFTER seconds.
+
+    The rows are room memberships checked by the views, so they are marked
+    inactive rather than deleted.
+    """
+    cutoff = now - timedelta(seconds=settings.SWEEPER_SESSION_STALE_AFTER)
+    return UserSession.objects.filter(is_active=True, last_activity__lt=cutoff)
+
+
+def dead_rooms(now):
+    """Rooms idle for SWEEPER_ROOM_IDLE_AFTER seconds with no files and no code history.
+
+    Deleting a room cascades to its versions, so any room with one is kept.
+    """
+    cutoff = now - timedelta(seconds=settings.SWEEPER_ROOM_IDLE_AFTER)
+    return CodeRoom.objects.filter(last_active__lt=cutoff).exclude(
+        Exists(FileEntry.objects.filter(room=OuterRef('pk')))
+    ).exclude(
+        Exists(CodeSession.objects.filter(room=OuterRef('pk')))
+    )
+
+
+def orphaned_chat_messages(now):
+    """Chat messages whose room no longer exists."""
+    return ChatMessage.objects.exclude(
+        Exists(CodeRoom.objects.filter(room_id=OuterRef('room_id')))
+    )
+
+
+def unreferenced_blobs(now):
+    """Blobs older than SWEEPER_BLOB_GRACE that no file or code version points at.
+
+    The grace period keeps a blob that was just stored from being collected
+    before the row referencing it is written.
+    """
+    cutoff = now - timedelta(seconds=settings.SWEEPER_BLOB_GRACE)
+    return Blob.objects.filter(created_at__lt=cutoff).exclude(
+        Exists(FileEntry.objects.filter(blob=OuterRef('pk')))
+    ).exclude(
+        Exists(CodeSession.objects.filter(blob=OuterRef('pk')))
+    )
+
+
+class Sweeper:
+    """Deletes (or updates) stale rows in bounded primary-key range batches.
+
+    Each job walks its table in ``pk`` order, sweeping matching rows one
+    range of ``batch_size`` ids at a time: rows are deleted, or updated with
+    the job's field values when it has any. A cycle stops once its time
+    budget is spent and the next cycle resumes from the saved cursor, so a
+    large backlog is worked off gradually without long-running deletes.
+    """
+
+    jobs = [
+        ('user_sessions', UserSession, stale_user_sessions, {'is_active': False}),
+        ('rooms', CodeRoom, dead_rooms, None),
+        ('chat_messages', ChatMessage, orphaned_chat_messages, None),
+        # Last, so blobs freed by the room deletions above go in the same cycle
+        ('blobs', Blob, unreferenced_blobs, None),
+    ]
+
+    def __init__(self, batch_size=None, time_budget=None):
+        self.batch_size = batch_size or settings.SWEEPER_BATCH_SIZE
+        self.time_budget = time_budget or settings.SWEEPER_TIME_BUDGET
+        self.cursors = {name: 0 for name, *job in self.jobs}
+        self.stats = {
+            name: {'swept': 0, 'batches': 0, 'passes': 0, 'last_duration': 0.0}
+            for name, *job in self.jobs
+        }
+        self.cycles = 0
+        self.last_cycle_duration = 0.0
+        self._lock = threading.Lock()
+
+    def run(self, time_budget=None, only=None):
+        """Runs one sweep cycle and returns the rows swept per job."""
+        with self._lock:
+            started = time.monotonic()
+            deadline = started + (time_budget or self.time_budget)
+            now = timezone.now()
+            report = {}
+            for name, model, rows, changes in self.jobs:
+                if only and name not in only:
+                    continue
+                if time.monotonic() >= deadline:
+                    break
+                report[name] = self._sweep(name, model, rows(now), changes, deadline)
+
+            self.cycles += 1
+            self.last_cycle_duration = time.monotonic() - started
+            if any(report.values()):
+                logger.info(f"Sweeper swept {report} in {self.last_cycle_duration:.3f}s")
+            return report
+
+    def sweep_all(self, only=None):
+        """Runs cycles until every job has completed a full pass."""
+        totals = {}
+        pending = set(only or self.cursors)
+        while pending:
+            passes = {name: self.stats[name]['passes'] for name in pending}
+            for name, swept in self.run(only=pending).items():
+                totals[name] = totals.get(name, 0) + swept
+            pending = {name for name in pending if self.stats[name]['passes'] == passes[name]}
+        return totals
+
+    def _sweep(self, name, model, rows, changes, deadline):
+        started = time.monotonic()
+        stats = self.stats[name]
+        label = model._meta.label
+        swept = 0
+        low = self.cursors[name]
+        while time.monotonic() < deadline:
+            # Skip gaps in the id space with an index seek
+            low = model.objects.filter(pk__gte=low).order_by('pk').values_list('pk', flat=True).first()
+            if low is None:
+                self.cursors[name] = 0
+                stats['passes'] += 1
+                break
+            high = low + self.batch_size
+            batch = rows.filter(pk__gte=low, pk__lt=high)
+            if changes:
+                swept += batch.update(**changes)
+            else:
+                count, per_model = batch.delete()
+                swept += per_model.get(label, 0)
+            stats['batches'] += 1
+            low = high
+            self.cursors[name] = low
+
+        stats['swept'] += swept
+        stats['last_duration'] = round(time.monotonic() - started, 4)
+        return swept
+
+    def snapshot(self):
+        """Returns counters and timings for monitoring.
+
+        Reads without the run lock, so a /metrics scrape never waits for a
+        cycle in progress.
+        """
+        return {
+            'cycles': self.cycles,
+            'last_cycle_duration': round(self.last_cycle_duration, 4),
+            'jobs': {name: dict(stats, cursor=self.cursors[name]) for name, stats in self.stats.items()},
+        }
+
+
+_sweeper = None
+_sweeper_lock = threading.Lock()
+
+
+def get_sweeper():
+    """Returns the process-wide sweeper."""
+    global _sweeper
+    if _sweeper is None:
+        with _sweeper_lock:
+            if _sweeper is None:
+                _sweeper = Sweeper()
+    return _sweeper
+
+
+def sweep():
+    """Runs one time-budgeted sweep cycle (periodic task entry point)."""
+    return get_sweeper().run()
@@ -0,0 +1,484 @@
+import ast
+import re
+import threading
+import logging
+from collections import OrderedDict
+from pathlib import PurePosixPath
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+IDENTIFIER_RE = re.compile(r'[A-Za-z_$][\w$]*')
+
+# Definition patterns for files we cannot parse with ``ast``. Each pattern
+# captures the symbol name in group ``name``.
+REGEX_DEFINITIONS = {
+    'javascript': [
+        ('function', re.compile(r'\bfunction\s*\*?\s*(?P<name>[A-Za-z_$][\w$]*)')),
+        ('class', re.compile(r'\bclass\s+(?P<name>[A-Za-z_$][\w$]*)')),
+        ('variable', re.compile(r'\b(?:const|let|var)\s+(?P<name>[A-Za-z_$][\w$]*)')),
+        ('method', re.compile(r'^\s*(?:async\s+)?(?P<name>[A-Za-z_$][\w$]*)\s*\([^)]*\)\s*\{')),
+    ],
+    'java': [
+        ('class', re.compile(r'\b(?:class|interface|enum|record)\s+(?P<name>[A-Za-z_]\w*)')),
+        ('method', re.compile(r'^\s*(?:(?:public|private|protected|static|final|abstract|synchronized)\s+)*'
+                              r'[\w<>\[\],\s]+?\s+(?P<name>[A-Za-z_]\w*)\s*\([^;]*$')),
+    ],
+    'cpp': [
+        ('class', re.compile(r'\b(?:class|struct|enum|union|namespace)\s+(?P<name>[A-Za-z_]\w*)')),
+        ('function', re.compile(r'^[\w:<>\*&\s]+?\b(?P<name>[A-Za-z_]\w*)\s*\([^;]*$')),
+        ('macro', re.compile(r'^\s*#\s*define\s+(?P<name>[A-Za-z_]\w*)')),
+    ],
+}
+
+REGEX_IMPORTS = {
+    'javascript': re.compile(r'''(?:\bfrom\s+|\brequire\s*\(\s*|^\s*import\s+)['"](?P<module>[^'"]+)['"]'''),
+    'java': re.compile(r'^\s*import\s+(?:static\s+)?(?P<module>[\w.]+(?:\.\*)?)\s*;'),
+    'cpp': re.compile(r'^\s*#\s*include\s*[<"](?P<module>[^>"]+)[>"]'),
+}
+
+LANGUAGE_EXTENSIONS = {
+    '.py': 'python',
+    '.js': 'javascript',
+    '.jsx': 'javascript',
+    '.ts': 'javascript',
+    '.tsx': 'javascript',
+    '.mjs': 'javascript',
+    '.java': 'java',
+    '.c': 'cpp',
+    '.cc': 'cpp',
+    '.cpp': 'cpp',
+    '.h': 'cpp',
+    '.hpp': 'cpp',
+}
+
+KEYWORDS = frozenset([
+    'if', 'else', 'for', 'while', 'return', 'switch', 'case', 'new', 'do', 'try', 'catch',
+    'throw', 'import', 'from', 'export', 'default', 'function', 'class', 'const', 'let', 'var',
+    'public', 'private', 'protected', 'static', 'void', 'int', 'char', 'float', 'double',
+    'long', 'short', 'bool', 'boolean', 'true', 'false', 'null', 'this', 'super', 'include',
+    'define', 'struct', 'namespace', 'using', 'typeof', 'instanceof', 'await', 'async',
+])
+
+
+def detect_language(filename):
+    """Returns the index language for a filename, or None if it is not indexed."""
+    return LANGUAGE_EXTENSIONS.get(PurePosixPath(filename).suffix.lower())
+
+
+class FileSymbols:
+    """Parse result for a single file."""
+
+    __slots__ = ('filename', 'definitions', 'references', 'imports')
+
+    def __init__(self, filename):
+        self.filename = filename
+        # (name, kind, line, column, container)
+        self.definitions = []
+        # (name, line, column, end_column)
+        self.references = []
+        # (module, line)
+        self.imports = []
+
+
+class _PythonVisitor(ast.NodeVisitor):
+    """Collects definitions, name references and imports from a Python module."""
+
+    def __init__(self, symbols):
+        self.symbols = symbols
+        # (name, is_class) for each enclosing class/function
+        self.scope = []
+
+    def _define(self, name, kind, lineno, column):
+        container = '.'.join(scope_name for scope_name, is_class in self.scope) or None
+        self.symbols.definitions.append((name, kind, lineno, column, container))
+
+    def _visit_scope(self, node, header):
+        # The name sits right after "def "/"class "/"async def " on the header line
+        kind = 'class' if header == 'class ' else 'function'
+        self._define(node.name, kind, node.lineno, node.col_offset + len(header))
+        for decorator in node.decorator_list:
+            self.visit(decorator)
+        self.scope.append((node.name, kind == 'class'))
+        for child in node.body:
+            self.visit(child)
+        self.scope.pop()
+
+    def visit_ClassDef(self, node):
+        for base in node.bases:
+            self.visit(base)
+        self._visit_scope(node, 'class ')
+
+    def visit_FunctionDef(self, node):
+        self.visit(node.args)
+        self._visit_scope(node, 'def ')
+
+    def visit_AsyncFunctionDef(self, node):
+        self.visit(node.args)
+        self._visit_scope(node, 'async def ')
+
+    def visit_Import(self, node):
+        for alias in node.names:
+            self.symbols.imports.append((alias.name, node.lineno))
+            self._define((alias.asname or alias.name).split('.')[0], 'import', node.lineno, node.col_offset)
+
+    def visit_ImportFrom(self, node):
+        module = '.' * node.level + (node.module or '')
+        self.symbols.imports.append((module, node.lineno))
+        for alias in node.names:
+            if alias.name != '*':
+                self._define(alias.asname or alias.name, 'import', node.lineno, node.col_offset)
+
+    def _visit_assignment(self, targets, node):
+        # Only module- and class-level assignments count as definitions
+        if not self.scope or self.scope[-1][1]:
+            for target in targets:
+                if isinstance(target, ast.Name):
+                    self._define(target.id, 'variable', target.lineno, target.col_offset)
+        self.generic_visit(node)
+
+    def visit_Assign(self, node):
+        self._visit_assignment(node.targets, node)
+
+    def visit_AnnAssign(self, node):
+        self._visit_assignment([node.target], node)
+
+    def visit_Name(self, node):
+        self.symbols.references.append((node.id, node.lineno, node.col_offset, node.end_col_offset))
+
+    def visit_Attribute(self, node):
+        # Record the attribute name itself so ``obj.method`` resolves to ``method``
+        end = node.end_col_offset
+        self.symbols.references.append((node.attr, node.end_lineno, end - len(node.attr), end))
+        self.generic_visit(node)
+
+
+def parse_python(filename, content):
+    """Parses Python source with ``ast``, falling back to regexes on syntax errors."""
+    try:
+        tree = ast.parse(content, filename=filename)
+    except (SyntaxError, ValueError):
+        return parse_generic(filename, content, 'python')
+    symbols = FileSymbols(filename)
+    _PythonVisitor(symbols).visit(tree)
+    return symbols
+
+
+PYTHON_FALLBACK_DEFINITIONS = [
+    ('class', re.compile(r'^\s*class\s+(?P<name>[A-Za-z_]\w*)')),
+    ('function', re.compile(r'^\s*(?:async\s+)?def\s+(?P<name>[A-Za-z_]\w*)')),
+    ('variable', re.compile(r'^(?P<name>[A-Za-z_]\w*)\s*=[^=]')),
+]
+PYTHON_FALLBACK_IMPORT = re.compile(r'^\s*(?:from\s+(?P<from>[\w.]+)\s+import|import\s+(?P<module>[\w.]+))')
+
+
+def parse_generic(filename, content, language):
+    """Line-oriented regex parser used for non-Python files and broken Python."""
+    symbols = FileSymbols(filename)
+    if language == 'python':
+        definitions = PYTHON_FALLBACK_DEFINITIONS
+        import_re = PYTHON_FALLBACK_IMPORT
+    else:
+        definitions = REGEX_DEFINITIONS.get(language, [])
+        import_re = REGEX_IMPORTS.get(language)
+
+    for lineno, line in enumerate(content.splitlines(), start=1):
+        defined = set()
+        for kind, pattern in definitions:
+            match = pattern.search(line)
+            if match and match.group('name') not in KEYWORDS:
+                name = match.group('name')
+                if name not in defined:
+                    defined.add(name)
+                    symbols.definitions.append((name, kind, lineno, match.start('name'), None))
+
+        if import_re:
+            match = import_re.search(line)
+            if match:
+                groups = match.groupdict()
+                module = groups.get('module') or groups.get('from')
+                if module:
+                    symbols.imports.append((module, lineno))
+
+        for match in IDENTIFIER_RE.finditer(line):
+            name = match.group(0)
+            if name not in KEYWORDS:
+                symbols.references.append((name, lineno, match.start(), match.end()))
+    return symbols
+
+
+def parse_file(filename, content):
+    """Parses a file into a FileSymbols record, or returns None for unindexed types."""
+    language = detect_language(filename)
+    if language is None:
+        return None
+    if language == 'python':
+        return parse_python(filename, content or '')
+    return parse_generic(filename, content or '', language)
+
+
+class SymbolIndex:
+    """In-memory symbol index for the files of a single room.
+
+    Files are parsed independently and their results merged into name-keyed
+    maps, so updating a file only costs a reparse of that file plus removal
+    of its previous entries.
+    """
+
+    def __init__(self, room_id):
+        self.room_id = room_id
+        self.files = {}
+        # name -> {filename: [definition, ...]}
+        self.definitions = {}
+        # name -> {filename: reference count}
+        self.references = {}
+        # module stem -> {filename, ...} for resolving imports to room files
+        self._modules = {}
+        # Lower-cased names in sorted order for prefix lookups
+        self._sorted_names = None
+        self.built = False
+        self._lock = threading.RLock()
+
+    def build(self, files):
+        """Builds the index from a ``{filename: content}`` mapping."""
+        parsed = {}
+        for filename, content in files.items():
+            try:
+                symbols = parse_file(filename, content)
+            except Exception as e:
+                logger.error(f"Error indexing {filename} in room {self.room_id}: {str(e)}")
+                symbols = None
+            if symbols is not None:
+                parsed[filename] = symbols
+
+        with self._lock:
+            self.files = {}
+            self.definitions = {}
+            self.references = {}
+            self._modules = {}
+            for filename, symbols in parsed.items():
+                self._add(symbols)
+            self._sorted_names = None
+            self.built = True
+
+    def update_file(self, filename, content):
+        """Reparses a single created or updated file."""
+        try:
+            symbols = parse_file(filename, content)
+        except Exception as e:
+            logger.error(f"Error indexing {filename} in room {self.room_id}: {str(e)}")
+            symbols = None
+        with self._lock:
+            self._remove(filename)
+            if symbols is not None:
+                self._add(symbols)
+            self._sorted_names = None
+
+    def remove_file(self, filename):
+        """Drops a deleted file from the index."""
+        with self._lock:
+            self._remove(filename)
+            self._sorted_names = None
+
+    def rename_file(self, old_filename, new_filename, content=None):
+        """Moves a file's entries to its new name.
+
+        The parsed symbols are re-keyed when the file keeps its language;
+        otherwise (or when the old name was never indexed) ``content`` is
+        parsed under the new name. Without ``content`` such a file is only
+        removed.
+        """
+        with self._lock:
+            symbols = self.files.get(old_filename)
+            same_language = detect_language(old_filename) == detect_language(new_filename)
+            if symbols is not None and same_language:
+                self._remove(old_filename)
+                symbols.filename = new_filename
+                self._add(symbols)
+                self._sorted_names = None
+                return
+        self.remove_file(old_filename)
+        if content is not None:
+            self.update_file(new_filename, content)
+
+    def _add(self, symbols):
+        filename = symbols.filename
+        self.files[filename] = symbols
+        for key in stem_keys(filename):
+            self._modules.setdefault(key, set()).add(filename)
+        for definition in symbols.definitions:
+            self.definitions.setdefault(definition[0], {}).setdefault(filename, []).append(definition)
+        for reference in symbols.references:
+            counts = self.references.setdefault(reference[0], {})
+            counts[filename] = counts.get(filename, 0) + 1
+
+    def _remove(self, filename):
+        symbols = self.files.pop(filename, None)
+        if symbols is None:
+            return
+        for key in stem_keys(filename):
+            owners = self._modules.get(key)
+            if owners is not None:
+                owners.discard(filename)
+                if not owners:
+                    del self._modules[key]
+        for name in {definition[0] for definition in symbols.definitions}:
+            by_file = self.definitions.get(name)
+            if by_file is not None:
+                by_file.pop(filename, None)
+                if not by_file:
+                    del self.definitions[name]
+        for name in {reference[0] for reference in symbols.references}:
+            by_file = self.references.get(name)
+            if by_file is not None:
+                by_file.pop(filename, None)
+                if not by_file:
+                    del self.references[name]
+
+    def symbol_at(self, filename, line, column):
+        """Returns the identifier at an editor (0-based) line and column, if known."""
+        symbols = self.files.get(filename)
+        if symbols is None:
+            return None
+        line += 1
+        for name, ref_line, start, end in symbols.references:
+            if ref_line == line and start <= column <= end:
+                return name
+        for name, kind, def_line, start, container in symbols.definitions:
+            if def_line == line and start <= column <= start + len(name):
+                return name
+        return None
+
+    def goto_definition(self, name, filename=None, limit=100):
+        """Returns definition locations for ``name`` as editor (0-based) positions.
+
+        Definitions in ``filename`` come first, then files it imports, then
+        the rest of the room. Import aliases are only returned when nothing
+        else defines the name.
+        """
+        with self._lock:
+            by_file = self.definitions.get(name)
+            if not by_file:
+                return []
+            imported = set()
+            if filename and filename in self.files:
+                imported = self._imported_files(self.files[filename])
+
+            def rank(item):
+                def_filename = item[0]
+                if def_filename == filename:
+                    return (0, def_filename)
+                if def_filename in imported:
+                    return (1, def_filename)
+                return (2, def_filename)
+
+            results = []
+            aliases = []
+            for def_filename, definitions in sorted(by_file.items(), key=rank):
+                for def_name, kind, line, column, container in definitions:
+                    location = {
+                        'name': def_name,
+                        'kind': kind,
+                        'filename': def_filename,
+                        'line': line - 1,
+                        'ch': column,
+                        'container': container,
+                    }
+                    (aliases if kind == 'import' else results).append(location)
+            return (results or aliases)[:limit]
+
+    def find_references(self, name):
+        """Returns ``{filename: count}`` of references to ``name``."""
+        with self._lock:
+            return dict(self.references.get(name, {}))
+
+    def workspace_symbols(self, query, limit=100):
+        """Returns definitions whose name contains ``query`` (case-insensitive).
+
+        Prefix matches are listed before other substring matches.
+        """
+        query = (query or '').lower()
+        with self._lock:
+            if self._sorted_names is None:
+                self._sorted_names = sorted((name.lower(), name) for name in self.definitions)
+            names = self._sorted_names
+            prefix, contains = [], []
+            for lowered, name in names:
+                if not query or lowered.startswith(query):
+                    prefix.append(name)
+                elif query in lowered:
+                    contains.append(name)
+                if len(prefix) >= limit:
+                    break
+
+            results = []
+            for name in prefix + contains:
+                for def_filename, definitions in self.definitions[name].items():
+                    for def_name, kind, line, column, container in definitions:
+                        if kind == 'import':
+                            continue
+                        results.append({
+                            'name': def_name,
+                            'kind': kind,
+                            'filename': def_filename,
+                            'line': line - 1,
+                            'ch': column,
+                            'container': container,
+                        })
+                        if len(results) >= limit:
+                            return results
+            return results
+
+    def _imported_files(self, symbols):
+        """Maps a file's import statements to room filenames on a best-effort basis."""
+        imported = set()
+        python = detect_language(symbols.filename) == 'python'
+        for module, line in symbols.imports:
+            key = module_key(module, python)
+            if key:
+                imported.update(self._modules.get(key, ()))
+        return imported
+
+
+def module_key(module, python):
+    """Normalises an import target into the slash-separated stem used for lookups."""
+    if python:
+        return module.lstrip('.').replace('.', '/')
+    path = PurePosixPath(module)
+    parts = [part for part in path.with_suffix('').parts if part not in ('.', '..')]
+    return '/'.join(parts)
+
+
+def stem_keys(filename):
+    """Yields every trailing sub-path of a filename's stem (``a/b/c.py`` -> ``a/b/c``, ``b/c``, ``c``)."""
+    parts = PurePosixPath(filename).with_suffix('').parts
+    for i in range(len(parts)):
+        yield '/'.join(parts[i:])
+
+
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def get_symbol_index(room_id):
+    """Returns the process-wide symbol index for a room, creating it if needed.
+
+    At most ROOM_INDEX_MAX_ROOMS indexes are kept, dropping the least
+    recently used room first.
+    """
+    with _indexes_lock:
+        index = _indexes.get(room_id)
+        if index is None:
+            index = _indexes[room_id] = SymbolIndex(room_id)
+            while len(_indexes) > settings.ROOM_INDEX_MAX_ROOMS:
+                _indexes.popitem(last=False)
+        else:
+            _indexes.move_to_end(room_id)
+        return index
+
+
+def drop_symbol_index(room_id):
+    """Forgets a room's symbol index, e.g. when the room is deleted."""
+    with _indexes_lock:
+        _indexes.pop(room_id, None)
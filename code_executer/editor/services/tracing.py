@@ -0,0 +1,100 @@
+import math
+import time
+from collections import OrderedDict, deque
+
+from django.conf import settings
+
+# Spans, in the order an edit passes through them
+SPANS = ('persist', 'group_send', 'fanout', 'send', 'server', 'rtt', 'render')
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+def percentile(samples, fraction):
+    """Returns the nearest-rank percentile of a list of samples."""
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, math.ceil(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+
+def stamp_trace(data):
+    """Normalizes the optional ``trace`` of a client message and stamps the server receive time.
+
+    Clients send ``{"id": ..., "sent": <their monotonic ms>}``. Anything
+    else is dropped, so a trace is either well formed or absent.
+    """
+    trace = data.pop("trace", None)
+    if not isinstance(trace, dict) or not trace.get("id"):
+        return None
+    sent = trace.get("sent")
+    data["trace"] = {
+        "id": str(trace["id"])[:64],
+        "sent": sent if isinstance(sent, (int, float)) else None,
+        # Wall clock: the op may be handled and delivered by other workers
+        "received": time.time(),
+        "spans": {},
+    }
+    return data["trace"]
+
+
+class RoomLatency:
+    """Recent span samples per room, for percentiles.
+
+    Keeps the last TRACE_SAMPLES_PER_ROOM samples of each span for up to
+    TRACE_MAX_ROOMS rooms, dropping the least recently traced room first.
+    Only this process's connections are counted.
+    """
+
+    def __init__(self, samples=None, max_rooms=None):
+        self.samples = samples or settings.TRACE_SAMPLES_PER_ROOM
+        self.max_rooms = max_rooms or settings.TRACE_MAX_ROOMS
+        self._rooms = OrderedDict()
+
+    def record(self, room_id, span, seconds):
+        room = self._rooms.get(room_id)
+        if room is None:
+            room = self._rooms[room_id] = {}
+            while len(self._rooms) > self.max_rooms:
+                self._rooms.popitem(last=False)
+        else:
+            self._rooms.move_to_end(room_id)
+        samples = room.get(span)
+        if samples is None:
+            samples = room[span] = deque(maxlen=self.samples)
+        samples.append(seconds)
+
+    def percentiles(self, room_id):
+        """Returns ``{span: {quantile: seconds}}`` for the room's recorded spans."""
+        room = self._rooms.get(room_id) or {}
+        result = {}
+        for span in SPANS:
+            samples = list(room.get(span, ()))
+            if samples:
+                result[span] = {quantile: percentile(samples, quantile) for quantile in QUANTILES}
+        return result
+
+    def rooms(self):
+        return list(self._rooms)
+
+
+_latency = None
+
+
+def get_room_latency():
+    """Returns the process-wide per-room latency aggregate."""
+    global _latency
+    if _latency is None:
+        _latency = RoomLatency()
+    return _latency
+
+
+def latency_quantiles():
+    """``{(room, span, quantile): seconds}`` for every traced room, for /metrics."""
+    latency = get_room_latency()
+    values = {}
+    for room_id in latency.rooms():
+        for span, quantiles in latency.percentiles(room_id).items():
+            for quantile, seconds in quantiles.items():
+                values[(room_id, span, str(quantile))] = seconds
+    return values
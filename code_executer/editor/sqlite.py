@@ -0,0 +1,24 @@
+import logging
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    """Applies settings.SQLITE_PRAGMAS to every new SQLite connection.
+
+    Connected to ``django.db.backends.signals.connection_created`` in
+    EditorConfig.ready(). Each connection runs them in the order given,
+    since journal_mode has to be switched before the others take effect
+    for WAL.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = getattr(settings, 'SQLITE_PRAGMAS', None) or {}
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            try:
+                cursor.execute(f'PRAGMA {name} = {value}')
+            except Exception as e:
+                logger.error(f"Error applying PRAGMA {name}: {str(e)}")
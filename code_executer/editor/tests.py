@@ -1,3 +1,716 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+import zipfile
+from datetime import datetime, timedelta, timezone as dt_timezone
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from channels.exceptions import ChannelFull
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from editor.consumers.editor_consumer import EditorConsumer
+from editor.consumers.multiplex import Multiplexer
+from editor.consumers.spectator_consumer import SpectatorConsumer
+from editor.fields import MAGIC, RAW, ZLIB, compress_text, decompress_text
+from editor.filemanager import ProjectFileManager
+from editor.layers import InProcessBus, NodeFanoutChannelLayer
+from editor.loadtest import QueryCounter
+from editor.models import Blob, CodeRoom, CodeSession, FileEntry, UserSession
+from editor.services import diagnostics, metrics, sharding, spectators
+from editor.services.activity import ActivityWriter, get_activity_writer
+from editor.services.archive import ArchiveError, import_room_archive
+from editor.services.diagnostics import DependencyGraph, get_room_diagnostics
+from editor.services.history import compact_history, compactable_sessions, retention_bucket
+from editor.services.search_index import TrigramIndex, compile_search_pattern, required_literals
+from editor.services.sweeper import Sweeper, get_sweeper
+from editor.services.symbol_index import SymbolIndex
+from editor.services.tracing import get_room_latency, percentile, stamp_trace
+
+
+class QueryCounterTests(TestCase):
+    def test_counts_data_queries_only(self):
+        counter = QueryCounter()
+        with counter.installed():
+            with transaction.atomic():
+                CodeRoom.objects.count()
+                User.objects.exists()
+        CodeRoom.objects.count()
+        self.assertEqual(counter.queries, 2)
+
+
+class SymbolIndexRenameTests(SimpleTestCase):
+    def definitions(self, index, name):
+        return [location['filename'] for location in index.goto_definition(name)]
+
+    def test_rename_rekeys_without_content(self):
+        index = SymbolIndex('room')
+        index.build({'a.py': 'def foo(): pass\n'})
+        index.rename_file('a.py', 'b.py')
+        self.assertEqual(self.definitions(index, 'foo'), ['b.py'])
+
+    def test_language_change_reparses_content(self):
+        index = SymbolIndex('room')
+        index.build({'a.txt': 'def foo(): pass\n'})
+        index.rename_file('a.txt', 'a.py', 'def foo(): pass\n')
+        self.assertEqual(self.definitions(index, 'foo'), ['a.py'])
+
+    def test_unindexed_file_is_added(self):
+        index = SymbolIndex('room')
+        index.build({})
+        index.rename_file('new.py', 'b.py', 'def bar(): pass\n')
+        self.assertEqual(self.definitions(index, 'bar'), ['b.py'])
+
+
+class TrigramSearchTests(SimpleTestCase):
+    def test_required_literals(self):
+        self.assertEqual(required_literals(r'def\s+handle_\w+'), ['def', 'handle_'])
+        self.assertEqual(required_literals(r'(?:foo)+bar'), ['foo', 'bar'])
+        # Neither side of an alternation is mandatory
+        self.assertEqual(required_literals(r'alpha|omega'), [])
+        self.assertEqual(required_literals(r'a(bc)?d'), [])
+        self.assertEqual(required_literals('[unclosed'), [])
+
+    def test_candidates_need_every_trigram(self):
+        index = TrigramIndex('room')
+        index.build([('a.py', 'import os', None), ('b.py', 'import sys', None)])
+        self.assertEqual(index.candidates(['import']), ['a.py', 'b.py'])
+        self.assertEqual(index.candidates(['sys']), ['b.py'])
+        self.assertEqual(index.candidates(['missing']), [])
+
+    def test_search_pages_until_the_last_match(self):
+        index = TrigramIndex('room')
+        index.build([
+            ('a.py', 'x = 1\nneedle\nneedle again', None),
+            ('b.py', 'NEEDLE', None),
+            ('c.py', 'no match', None),
+        ])
+        pages = []
+        cursor = None
+        while True:
+            matches, cursor = index.search('needle', after=cursor, limit=2)
+            pages.append([(m['filename'], m['line']) for m in matches])
+            if cursor is None:
+                break
+        self.assertEqual(pages, [[('a.py', 1), ('a.py', 2)], [('b.py', 0)]])
+
+    def test_case_sensitive_and_regex_search(self):
+        index = TrigramIndex('room')
+        index.build([('a.py', 'Needle\nneedle', None)])
+        matches, _ = index.search('Needle', case_sensitive=True)
+        self.assertEqual([m['line'] for m in matches], [0])
+        matches, _ = index.search(r'need(le)$', regex=True)
+        self.assertEqual([m['line'] for m in matches], [0, 1])
+
+    def test_rename_and_remove_update_postings(self):
+        index = TrigramIndex('room')
+        index.build([('a.py', 'needle', None)])
+        index.rename_file('a.py', 'b.py')
+        self.assertEqual(index.candidates(['needle']), ['b.py'])
+        index.remove_file('b.py')
+        self.assertEqual(index.postings, {})
+
+    def test_catastrophic_patterns_are_refused(self):
+        for pattern in [r'(a+)+$', r'(\w+)*x', r'(?:a|b+)+']:
+            with self.assertRaises(re.error):
+                compile_search_pattern(pattern)
+        with override_settings(SEARCH_MAX_PATTERN_LENGTH=5):
+            with self.assertRaises(re.error):
+                compile_search_pattern('abcdef')
+        compile_search_pattern(r'(foo|bar)+\s+\w+')
+
+    @override_settings(SEARCH_TIME_BUDGET=0)
+    def test_time_budget_ends_the_page_with_a_cursor(self):
+        index = TrigramIndex('room')
+        index.build([('a.py', 'needle\nneedle\nneedle', None)])
+        found = []
+        cursor = None
+        while True:
+            matches, cursor = index.search('needle', after=cursor)
+            found += [m['line'] for m in matches]
+            if cursor is None:
+                break
+        self.assertEqual(found, [0, 1, 2])
+
+    @override_settings(SEARCH_MAX_LINE_LENGTH=10)
+    def test_regex_sees_only_the_start_of_long_lines(self):
+        index = TrigramIndex('room')
+        index.build([('a.py', 'x' * 20 + 'needle', None)])
+        self.assertEqual(index.search('needle', regex=True)[0], [])
+        self.assertEqual(len(index.search('needle')[0]), 1)
+
+
+class SearchViewTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user('alice')
+        self.room = CodeRoom.objects.create(room_id='room', created_by=self.owner)
+        FileEntry.store(self.room.pk, 'a.py', 'needle', self.owner)
+
+    def search(self, user, **params):
+        self.client.force_login(user)
+        return self.client.get(reverse('search_files'), {'room_id': 'room', 'q': 'needle', **params})
+
+    def test_only_members_and_the_creator_can_search(self):
+        self.assertEqual(self.search(User.objects.create_user('mallory')).status_code, 403)
+        response = self.search(self.owner)
+        self.assertEqual([m['filename'] for m in response.json()['matches']], ['a.py'])
+
+    def test_refused_regex_is_a_bad_request(self):
+        response = self.search(self.owner, q='(a+)+$', regex='1')
+        self.assertEqual(response.status_code, 400)
+
+
+class DependencyGraphTests(SimpleTestCase):
+    def setUp(self):
+        self.graph = DependencyGraph()
+        self.graph.set_file('app.py', {'models'})
+        self.graph.set_file('models.py', {'db'})
+        self.graph.set_file('db.py', set())
+
+    def test_resolves_imports_to_room_files(self):
+        self.assertEqual(self.graph.dependencies('app.py'), {'models.py'})
+        self.assertEqual(self.graph.dependents('db.py'), {'models.py'})
+
+    def test_reverse_closure_is_transitive(self):
+        self.assertEqual(self.graph.reverse_closure(['db.py']), {'models.py', 'app.py'})
+
+    def test_import_resolves_once_the_file_exists(self):
+        self.graph.set_file('main.py', {'utils'})
+        self.assertEqual(self.graph.dependencies('main.py'), set())
+        self.graph.set_file('pkg/utils.py', set())
+        self.assertEqual(self.graph.dependencies('main.py'), {'pkg/utils.py'})
+
+    def test_remove_file_drops_its_edges(self):
+        self.graph.remove_file('models.py')
+        self.assertEqual(self.graph.dependencies('app.py'), set())
+        self.assertEqual(self.graph.dependents('db.py'), set())
+        self.assertNotIn('db', self.graph.importers)
+
+
+class RoomDiagnosticsCacheTests(SimpleTestCase):
+    @override_settings(ROOM_INDEX_MAX_ROOMS=2)
+    def test_least_recently_used_room_is_dropped(self):
+        first = get_room_diagnostics('cache-a')
+        get_room_diagnostics('cache-b')
+        get_room_diagnostics('cache-a')
+        get_room_diagnostics('cache-c')
+        self.assertIs(get_room_diagnostics('cache-a'), first)
+        self.assertNotIn('cache-b', diagnostics._rooms)
+
+
+class RetentionTests(TestCase):
+    now = datetime(2026, 1, 2, 12, 0, 0, tzinfo=dt_timezone.utc)
+
+    def test_retention_bucket(self):
+        self.assertIsNone(retention_bucket(self.now - timedelta(minutes=59), self.now))
+        self.assertEqual(
+            retention_bucket(datetime(2026, 1, 2, 9, 30, 45, tzinfo=dt_timezone.utc), self.now),
+            ('minute', datetime(2026, 1, 2, 9, 30, tzinfo=dt_timezone.utc))
+        )
+        self.assertEqual(
+            retention_bucket(datetime(2025, 12, 30, 9, 30, 45, tzinfo=dt_timezone.utc), self.now),
+            ('hour', datetime(2025, 12, 30, 9, tzinfo=dt_timezone.utc))
+        )
+
+    def test_compaction_keeps_newest_and_saved_versions(self):
+        user = User.objects.create_user('alice')
+        room = CodeRoom.objects.create(room_id='room', created_by=user)
+        minute = datetime(2026, 1, 2, 9, 30, tzinfo=dt_timezone.utc)
+        ids = {}
+        for name, seconds, is_saved in [('old', 5, False), ('saved', 10, True), ('newest', 20, False)]:
+            session = CodeSession.objects.create(
+                room=room, created_by=user, code_content=name, language='python', is_saved=is_saved
+            )
+            CodeSession.objects.filter(pk=session.pk).update(created_at=minute + timedelta(seconds=seconds))
+            ids[name] = session.pk
+        recent = CodeSession.objects.create(room=room, created_by=user, code_content='recent', language='python')
+        CodeSession.objects.filter(pk=recent.pk).update(created_at=self.now - timedelta(minutes=5))
+
+        self.assertEqual(list(compactable_sessions(room.pk, self.now)), [ids['old']])
+
+    def test_report_counts_logical_bytes(self):
+        user = User.objects.create_user('alice')
+        room = CodeRoom.objects.create(room_id='room', created_by=user)
+        # Two versions sharing one blob in the same minute bucket
+        for _ in range(2):
+            session = CodeSession.objects.create(room=room, created_by=user, code_content='x' * 10, language='python')
+            CodeSession.objects.filter(pk=session.pk).update(created_at=self.now - timedelta(hours=2))
+        report = compact_history(dry_run=True, now=self.now)
+        self.assertEqual((report['deleted'], report['logical_bytes']), (1, 10))
+
+
+# Flushed explicitly, without the background thread outliving the test database
+@mock.patch.object(ActivityWriter, '_ensure_started')
+class SweeperTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice')
+        self.room = CodeRoom.objects.create(room_id='room', created_by=self.user)
+        self.session = UserSession.objects.create(user=self.user, room=self.room)
+        UserSession.objects.filter(pk=self.session.pk).update(last_activity=timezone.now() - timedelta(hours=1))
+
+    def test_stale_sessions_are_deactivated_not_deleted(self, ensure_started):
+        self.assertEqual(Sweeper().sweep_all(only=['user_sessions']), {'user_sessions': 1})
+        self.session.refresh_from_db()
+        self.assertFalse(self.session.is_active)
+
+        # Still a member: the activity endpoint accepts the user
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('update_user_activity'), {'room_id': 'room'})
+        self.assertEqual(response.status_code, 200)
+        get_activity_writer().flush()
+        self.session.refresh_from_db()
+        self.assertTrue(self.session.is_active)
+
+    def test_activity_reactivates_the_session(self, ensure_started):
+        Sweeper().sweep_all(only=['user_sessions'])
+        writer = ActivityWriter()
+        writer.record('room', self.user.pk)
+        self.assertEqual(writer.flush(), 1)
+        self.session.refresh_from_db()
+        self.assertTrue(self.session.is_active)
+
+    def test_sweeper_stats_are_exported(self, ensure_started):
+        swept = get_sweeper().run(only=['user_sessions'])['user_sessions']
+        text = metrics.render()
+        self.assertIn('# TYPE editor_sweeper_rows_total counter', text)
+        match = re.search(r'^editor_sweeper_rows_total\{job="user_sessions"\} (\S+)$', text, re.M)
+        self.assertGreaterEqual(float(match.group(1)), swept)
+        self.assertRegex(text, r'(?m)^editor_sweeper_last_job_seconds\{job="blobs"\} ')
+
+    def test_rooms_with_code_history_are_kept(self, ensure_started):
+        CodeRoom.objects.filter(pk=self.room.pk).update(last_active=timezone.now() - timedelta(days=60))
+        idle = CodeRoom.objects.create(room_id='idle', created_by=self.user)
+        CodeRoom.objects.filter(pk=idle.pk).update(last_active=timezone.now() - timedelta(days=60))
+        CodeSession.objects.create(room=self.room, created_by=self.user, code_content='x', language='python')
+        Sweeper().sweep_all(only=['rooms'])
+        self.assertEqual(list(CodeRoom.objects.values_list('room_id', flat=True)), ['room'])
+
+
+@override_settings(TEXT_COMPRESSION='zlib', TEXT_COMPRESSION_MIN_SIZE=16)
+class CompressedTextFieldTests(TestCase):
+    def test_codec_framing(self):
+        self.assertEqual(compress_text('short'), MAGIC + RAW + b'short')
+        text = 'print("hello")\n' * 50
+        self.assertEqual(compress_text(text)[:2], MAGIC + ZLIB)
+        self.assertEqual(decompress_text(compress_text(text)), text)
+        # Rows written before the column was compressed
+        self.assertEqual(decompress_text(b'legacy'), 'legacy')
+
+    def test_round_trip_through_the_database(self):
+        text = 'def caf\u00e9():\n    return "\\n"\n' * 40
+        Blob.objects.create(hash='h', content=text, size=len(text))
+        self.assertEqual(Blob.objects.get(hash='h').content, text)
+
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT content FROM editor_blob WHERE hash = %s', ['h'])
+            stored = bytes(cursor.fetchone()[0])
+        self.assertEqual(stored[:2], MAGIC + ZLIB)
+        self.assertLess(len(stored), len(text))
+
+
+class ConditionalFileTests(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.settings_override = override_settings(PROJECT_FILES_ROOT=self.root)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+
+        self.user = User.objects.create_user('alice')
+        CodeRoom.objects.create(room_id='room', created_by=self.user)
+        ProjectFileManager('room', user=self.user).create_file('a.py', 'old')
+        self.client.force_login(self.user)
+
+    def edit_on_disk(self, content):
+        # Saved by replacing the file, which is what the listing cache watches for
+        path = Path(self.root, 'room', 'a.py')
+        later = path.stat().st_mtime + 5
+        temp = path.with_name('a.py.new')
+        temp.write_text(content)
+        os.utime(temp, (later, later))
+        os.replace(temp, path)
+
+    def test_disk_edit_invalidates_the_file_etag(self):
+        url = reverse('read_file')
+        etag = self.client.get(url, {'room_id': 'room', 'filename': 'a.py'})['ETag']
+        self.edit_on_disk('new')
+        response = self.client.get(url, {'room_id': 'room', 'filename': 'a.py'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['content'], 'new')
+
+    def test_disk_edit_invalidates_the_list_etag(self):
+        url = reverse('list_files')
+        etag = self.client.get(url, {'room_id': 'room'})['ETag']
+        self.assertEqual(self.client.get(url, {'room_id': 'room'}, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.edit_on_disk('new')
+        self.assertEqual(self.client.get(url, {'room_id': 'room'}, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+def resolve(filename):
+    if '..' in filename.split('/'):
+        raise ValueError(f'Invalid filename {filename!r}')
+
+
+class ArchiveImportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice')
+        self.room = CodeRoom.objects.create(room_id='room', created_by=self.user)
+
+    def archive(self, files):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+            for name, content in files.items():
+                archive.writestr(name, content)
+        buffer.seek(0)
+        return buffer
+
+    def test_imports_files_and_skips_history(self):
+        FileEntry.store(self.room.pk, 'a.py', 'old', self.user)
+        archive = self.archive({'a.py': 'new', 'b.py': 'b', 'history/1.py': 'skipped'})
+        self.assertEqual(import_room_archive(self.room, archive, self.user, resolve), (1, 1))
+        files = {entry.filename: entry.content for entry in FileEntry.objects.filter(room=self.room)}
+        self.assertEqual(files, {'a.py': 'new', 'b.py': 'b'})
+
+    @override_settings(ROOM_IMPORT_MAX_FILES=2)
+    def test_too_many_files(self):
+        with self.assertRaisesMessage(ArchiveError, 'more than 2 files'):
+            import_room_archive(self.room, self.archive({'a': '', 'b': '', 'c': ''}), self.user, resolve)
+
+    @override_settings(ROOM_IMPORT_MAX_BYTES=1000)
+    def test_expanded_size_is_capped(self):
+        # Compresses to far less than the limit but inflates past it
+        archive = self.archive({'a.txt': 'x' * 600, 'b.txt': 'x' * 600})
+        with self.assertRaisesMessage(ArchiveError, 'more than 1000 bytes'):
+            import_room_archive(self.room, archive, self.user, resolve)
+        self.assertFalse(FileEntry.objects.filter(room=self.room).exists())
+
+    def test_rejects_bad_names_and_non_text(self):
+        with self.assertRaisesMessage(ArchiveError, 'Invalid file name'):
+            import_room_archive(self.room, self.archive({'../evil.py': ''}), self.user, resolve)
+        with self.assertRaisesMessage(ArchiveError, 'not UTF-8'):
+            import_room_archive(self.room, self.archive({'a.bin': b'\xff\xfe'}), self.user, resolve)
+        with self.assertRaisesMessage(ArchiveError, 'Not a zip archive'):
+            import_room_archive(self.room, io.BytesIO(b'nope'), self.user, resolve)
+
+
+class RoomRouterStartupTests(SimpleTestCase):
+    def tearDown(self):
+        sharding._router = None
+
+    async def test_callers_wait_for_the_router_to_start(self):
+        started = []
+
+        async def slow_start(router):
+            await asyncio.sleep(0.01)
+            started.append(router)
+
+        with mock.patch.object(sharding.RoomRouter, 'start', slow_start):
+            routers = await asyncio.gather(*(sharding.get_room_router(None, None) for _ in range(3)))
+        self.assertEqual(len(started), 1)
+        self.assertTrue(all(router is started[0] for router in routers))
+
+    async def test_failed_start_is_retried(self):
+        with mock.patch.object(sharding.RoomRouter, 'start', side_effect=RuntimeError('no inbox')):
+            with self.assertRaises(RuntimeError):
+                await sharding.get_room_router(None, None)
+        self.assertIsNone(sharding._router)
+
+
+class NodeFanoutChannelLayerTests(SimpleTestCase):
+    def nodes(self, **kwargs):
+        bus = InProcessBus()
+        return bus, NodeFanoutChannelLayer(bus=bus, **kwargs), NodeFanoutChannelLayer(bus=bus, **kwargs)
+
+    async def assertNothingReceived(self, layer, channel):
+        with self.assertRaises(asyncio.TimeoutError):
+            await asyncio.wait_for(layer.receive(channel), 0.05)
+
+    async def test_send_reaches_a_receiver_on_another_node(self):
+        _, first, second = self.nodes()
+        receiving = asyncio.ensure_future(second.receive('jobs'))
+        await asyncio.sleep(0)
+        await first.send('jobs', {'type': 'job', 'n': 1})
+        self.assertEqual(await asyncio.wait_for(receiving, 1), {'type': 'job', 'n': 1})
+
+    async def test_new_channel_is_owned_by_its_node(self):
+        bus, first, second = self.nodes()
+        channel = await second.new_channel()
+        self.assertTrue(second.valid_channel_name(channel))
+        self.assertNotEqual(channel, await second.new_channel())
+
+        await first.send(channel, {'type': 'remote'})
+        published = bus.published
+        await second.send(channel, {'type': 'local'})
+        # Local sends never touch the bus
+        self.assertEqual(bus.published, published)
+        self.assertEqual(await second.receive(channel), {'type': 'remote'})
+        self.assertEqual(await second.receive(channel), {'type': 'local'})
+
+    async def test_group_send_publishes_once_for_every_node(self):
+        bus, first, second = self.nodes()
+        channels = [await first.new_channel(), await first.new_channel(), await second.new_channel()]
+        await first.group_add('room', channels[0])
+        await first.group_add('room', channels[1])
+        # Membership is handed to the node that owns the channel
+        await first.group_add('room', channels[2])
+        await asyncio.sleep(0)
+        self.assertEqual(second.groups['room'], {channels[2]: mock.ANY})
+
+        published = bus.published
+        await first.group_send('room', {'type': 'edit'})
+        self.assertEqual(bus.published, published + 1)
+        self.assertEqual(await first.receive(channels[0]), {'type': 'edit'})
+        self.assertEqual(await first.receive(channels[1]), {'type': 'edit'})
+        self.assertEqual(await second.receive(channels[2]), {'type': 'edit'})
+
+    async def test_group_discard_across_nodes(self):
+        _, first, second = self.nodes()
+        local, remote = await first.new_channel(), await second.new_channel()
+        await first.group_add('room', local)
+        await second.group_add('room', remote)
+        await first.group_discard('room', remote)
+        await asyncio.sleep(0)
+        self.assertNotIn('room', second.groups)
+        self.assertNotIn(second._group_topic('room'), second._topics)
+
+        await second.group_send('room', {'type': 'edit'})
+        self.assertEqual(await first.receive(local), {'type': 'edit'})
+        await self.assertNothingReceived(second, remote)
+
+    async def test_expired_messages_and_memberships_are_dropped(self):
+        _, first, _ = self.nodes(expiry=0.01)
+        channel = await first.new_channel()
+        await first.group_add('room', channel)
+        await first.send(channel, {'type': 'stale'})
+        await asyncio.sleep(0.02)
+        await first.group_send('room', {'type': 'missed'})
+        # The expired message took the channel's membership with it
+        self.assertNotIn('room', first.groups)
+        await first.send(channel, {'type': 'fresh'})
+        self.assertEqual(await first.receive(channel), {'type': 'fresh'})
+
+    async def test_group_expiry(self):
+        _, first, _ = self.nodes(group_expiry=0.01)
+        channel = await first.new_channel()
+        await first.group_add('room', channel)
+        await asyncio.sleep(0.02)
+        await first.group_send('room', {'type': 'edit'})
+        self.assertNotIn('room', first.groups)
+        await self.assertNothingReceived(first, channel)
+
+    async def test_capacity(self):
+        _, first, second = self.nodes(capacity=2, channel_capacity={'http.*': 1})
+        channel = await second.new_channel()
+        await second.send(channel, {'n': 1})
+        await second.send(channel, {'n': 2})
+        with self.assertRaises(ChannelFull):
+            await second.send(channel, {'n': 3})
+        # A remote sender cannot be told, so the message is dropped and logged
+        with self.assertLogs('editor.layers', 'WARNING'):
+            await first.send(channel, {'n': 4})
+        self.assertEqual(second.get_capacity('http.request'), 1)
+
+        self.assertEqual(await second.receive(channel), {'n': 1})
+        self.assertEqual(await second.receive(channel), {'n': 2})
+        await self.assertNothingReceived(second, channel)
+
+    async def test_flush(self):
+        bus, first, second = self.nodes()
+        channel = await second.new_channel()
+        await second.group_add('room', channel)
+        await second.send(channel, {'type': 'pending'})
+        await second.flush()
+        self.assertEqual((second.channels, second.groups, second._topics), ({}, {}, set()))
+        self.assertEqual(bus._subscribers, {})
+
+        await first.group_send('room', {'type': 'edit'})
+        await first.send(channel, {'type': 'direct'})
+        self.assertEqual(second.channels, {})
+
+
+class SpectatorAccessTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user('alice')
+        self.room = CodeRoom.objects.create(room_id='room', created_by=self.owner)
+
+    def room_is_open(self):
+        consumer = SpectatorConsumer()
+        consumer.room_id = 'room'
+        return SpectatorConsumer.room_is_public.__wrapped__(consumer)
+
+    def set_spectators(self, user, enabled):
+        self.client.force_login(user)
+        return self.client.post(reverse('room_spectators', args=['room']), {'enabled': enabled})
+
+    def test_spectating_is_opt_in(self):
+        self.assertTrue(self.room.is_public)
+        self.assertFalse(self.room_is_open())
+        self.assertEqual(self.set_spectators(self.owner, '1').json()['allow_spectators'], True)
+        self.assertTrue(self.room_is_open())
+        self.set_spectators(self.owner, '0')
+        self.assertFalse(self.room_is_open())
+
+    def test_only_the_creator_can_allow_spectators(self):
+        member = User.objects.create_user('bob')
+        UserSession.objects.create(user=member, room=self.room)
+        self.assertEqual(self.set_spectators(member, '1').status_code, 403)
+        self.assertFalse(self.room_is_open())
+
+
+class SpectatorBroadcasterTests(SimpleTestCase):
+    def test_spectator_counts_are_exported(self):
+        broadcaster = mock.Mock(spectators={'first', 'second'})
+        with mock.patch.dict(spectators._broadcasters, {'room': broadcaster}):
+            text = metrics.render()
+        self.assertIn('# TYPE editor_spectators gauge', text)
+        self.assertRegex(text, r'(?m)^editor_spectators\{room="room"\} 2\.0$')
+
+    @mock.patch.object(spectators.RoomBroadcaster, 'stop')
+    async def test_leaving_before_start_finishes_cancels_it(self, stop):
+        broadcaster = spectators.RoomBroadcaster('room', None)
+        broadcaster.ready = asyncio.ensure_future(asyncio.sleep(1))
+        with mock.patch.dict(spectators._broadcasters, {'room': broadcaster}):
+            await spectators.leave_spectator('room', mock.Mock())
+            self.assertEqual(spectators._broadcasters, {})
+        self.assertTrue(broadcaster.ready.cancelled())
+        stop.assert_awaited_once()
+
+    @mock.patch.object(spectators.RoomBroadcaster, 'stop')
+    @mock.patch.object(spectators.RoomBroadcaster, 'add')
+    async def test_last_cancelled_join_drops_the_broadcaster(self, add, stop):
+        async def slow_start(broadcaster):
+            await asyncio.sleep(1)
+
+        with mock.patch.object(spectators.RoomBroadcaster, 'start', slow_start), \
+                mock.patch.dict(spectators._broadcasters, {}):
+            first = asyncio.ensure_future(spectators.join_spectator('room', 'first', None))
+            second = asyncio.ensure_future(spectators.join_spectator('room', 'second', None))
+            await asyncio.sleep(0)
+            first.cancel()
+            await asyncio.sleep(0)
+            # Another spectator is still waiting for it
+            self.assertIn('room', spectators._broadcasters)
+            broadcaster = spectators._broadcasters['room']
+            second.cancel()
+            await asyncio.wait([first, second])
+            self.assertEqual(spectators._broadcasters, {})
+        self.assertTrue(broadcaster.ready.cancelled())
+        stop.assert_awaited_once()
+        add.assert_not_called()
+
+
+@override_settings(MUX_STREAM_WINDOW=4, MUX_STREAM_BUFFER=3)
+class MultiplexerTests(SimpleTestCase):
+    def setUp(self):
+        self.sent = []
+        self.opened = []
+
+        async def send_text(text):
+            self.sent.append(json.loads(text))
+
+        async def on_open(stream):
+            self.opened.append(stream)
+
+        self.mux = Multiplexer(send_text, on_open)
+
+    async def dispatch(self, payload):
+        pass
+
+    async def test_open_grants_the_smaller_window(self):
+        await self.mux.receive({'stream': 1, 'op': 'open', 'kind': 'editor', 'window': 2}, self.dispatch)
+        self.assertEqual(self.sent, [{'stream': 1, 'op': 'opened', 'window': 4}])
+        self.assertEqual(self.opened[0].credit, 2)
+
+    async def test_server_frames_wait_for_credit(self):
+        await self.mux.receive({'stream': 1, 'op': 'open', 'kind': 'chat', 'window': 1}, self.dispatch)
+        self.sent.clear()
+        message = json.dumps({'type': 'chat_message', 'message': 'hi'})
+        await self.mux.send(message)
+        await self.mux.send(message)
+        self.assertEqual(len(self.sent), 1)
+        self.assertEqual(len(self.opened[0].pending), 1)
+
+        await self.mux.receive({'stream': 1, 'op': 'credit', 'n': 5}, self.dispatch)
+        self.assertEqual(len(self.sent), 2)
+        self.assertEqual(self.sent[1]['payload'], {'type': 'chat_message', 'message': 'hi'})
+        self.assertEqual(self.opened[0].credit, 4)
+
+    async def test_backlog_past_the_buffer_closes_the_stream(self):
+        await self.mux.receive({'stream': 1, 'op': 'open', 'kind': 'chat', 'window': 1}, self.dispatch)
+        message = json.dumps({'type': 'chat_message'})
+        with self.assertLogs('editor.consumers.multiplex', 'WARNING'):
+            for _ in range(5):
+                await self.mux.send(message)
+        self.assertEqual(self.sent[-1], {'stream': 1, 'op': 'close', 'reason': 'overflow'})
+        self.assertNotIn(1, self.mux.streams)
+
+    async def test_client_frames_return_credit_at_half_the_window(self):
+        await self.mux.receive({'stream': 1, 'op': 'open', 'kind': 'chat', 'window': 4}, self.dispatch)
+        self.sent.clear()
+        frame = {'stream': 1, 'op': 'data', 'payload': {'type': 'chat_message'}}
+        await self.mux.receive(frame, self.dispatch)
+        self.assertEqual(self.sent, [])
+        await self.mux.receive(frame, self.dispatch)
+        self.assertEqual(self.sent, [{'stream': 1, 'op': 'credit', 'n': 2}])
+        self.assertEqual(self.mux.streams[1].unacked, 0)
+
+    async def test_message_type_not_allowed_on_stream_closes_it(self):
+        await self.mux.receive({'stream': 1, 'op': 'open', 'kind': 'chat', 'window': 4}, self.dispatch)
+        with self.assertLogs('editor.consumers.multiplex', 'WARNING'):
+            await self.mux.receive({'stream': 1, 'op': 'data', 'payload': {'type': 'code_update'}}, self.dispatch)
+        self.assertEqual(self.sent[-1]['op'], 'close')
+        self.assertNotIn(1, self.mux.streams)
+
+
+class TracingTests(SimpleTestCase):
+    def test_percentile_is_nearest_rank(self):
+        samples = [5, 1, 4, 2, 3]
+        self.assertEqual([percentile(samples, q) for q in (0.5, 0.9, 0.99)], [3, 5, 5])
+        self.assertEqual(percentile([], 0.5), 0.0)
+
+    def test_well_formed_trace_is_stamped(self):
+        data = {'type': 'code_update', 'trace': {'id': 'x' * 100, 'sent': 12.5, 'extra': True}}
+        trace = stamp_trace(data)
+        self.assertIs(data['trace'], trace)
+        self.assertEqual(trace['id'], 'x' * 64)
+        self.assertEqual(trace['sent'], 12.5)
+        self.assertEqual(trace['spans'], {})
+        self.assertNotIn('extra', trace)
+        self.assertIsInstance(trace['received'], float)
+
+    def test_malformed_trace_is_dropped(self):
+        for trace in [None, 'abc', {'sent': 1}, {'id': ''}]:
+            data = {'type': 'code_update', 'trace': trace}
+            self.assertIsNone(stamp_trace(data))
+            self.assertNotIn('trace', data)
+
+    def test_non_numeric_sent_is_ignored(self):
+        self.assertIsNone(stamp_trace({'trace': {'id': 'a', 'sent': 'soon'}})['sent'])
+
+    async def test_traced_file_update_reaches_peers_with_server_spans(self):
+        consumer = EditorConsumer()
+        consumer.room_id = 'traced-room'
+        consumer.group_send = mock.AsyncMock()
+        consumer.send = mock.AsyncMock()
+        data = {'type': 'file_update', 'trace': {'id': 'edit-1', 'sent': 12.5}}
+        trace = stamp_trace(data)
+
+        await consumer.group_send_traced({'type': 'broadcast_file_update'}, trace, time.time())
+        event = consumer.group_send.await_args.args[0]
+        await consumer.send_traced({'type': 'file_update'}, event['trace'])
+        message = json.loads(consumer.send.await_args.kwargs['text_data'])
+        self.assertEqual((message['trace']['id'], message['trace']['sent']), ('edit-1', 12.5))
+        self.assertEqual(set(message['trace']['spans']), {'persist', 'fanout', 'server'})
+        self.assertEqual(
+            set(get_room_latency().percentiles('traced-room')),
+            {'persist', 'group_send', 'fanout', 'send', 'server'}
+        )
@@ -12,4 +12,15 @@ urlpatterns = [
     path('execute-code/', views.execute_code, name='execute_code'),
     path('api/update-user-count/', views.update_user_count, name='update_user_count'),
     path('api/update-user-activity/', views.update_user_activity, name='update_user_activity'),
+    path('api/files/create/', views.create_file, name='create_file'),
+    path('api/files/list/', views.list_files, name='list_files'),
+    path('api/files/save/', views.save_file, name='save_file'),
+    path('api/files/delete/', views.delete_file, name='delete_file'),
+    path('api/files/read/', views.read_file, name='read_file'),
+    path('api/files/download/', views.download_file, name='download_file'),
+    path('api/files/search/', views.search_files, name='search_files'),
+    path('api/rooms/<str:room_id>/export/', views.export_room, name='export_room'),
+    path('api/rooms/<str:room_id>/import/', views.import_room, name='import_room'),
+    path('api/rooms/<str:room_id>/spectators/', views.room_spectators, name='room_spectators'),
+    path('metrics', views.prometheus_metrics, name='metrics'),
 ]
\ No newline at end of file
@@ -1,22 +1,39 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import login, logout, authenticate
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse
-from django.views.decorators.http import require_http_methods
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views.decorators.cache import cache_control
+from django.views.decorators.gzip import gzip_page
+from django.views.decorators.http import condition, require_http_methods
+from django.utils.dateparse import parse_datetime
 from django.core.exceptions import PermissionDenied
 from django.contrib import messages
 from django.db import transaction
 from django.utils import timezone
+from django.utils.http import content_disposition_header
+from django.conf import settings
 from datetime import timedelta
-from .models import CodeRoom, CodeSession, UserSession
+from django.db.models import Count, Max
+from .models import CodeRoom, CodeSession, UserSession, FileEntry
 from .forms import UserRegistrationForm, LoginForm
-# from .filemanager import ProjectFileManager
-from .services.code_executer import CodeExecuter
+from .filemanager import ProjectFileManager
+from .services.code_executer import CodeExecuter, run_container
+from .services import metrics
+from .services.symbol_index import drop_symbol_index
+from .services.search_index import get_search_index, drop_search_index
+from .services.diagnostics import drop_room_diagnostics
+from .services.presence import get_presence_store
+from .services.activity import get_activity_writer
+from .services.sweeper import get_sweeper
+from .services.archive import ArchiveError, import_room_archive, stream_room_archive
 # from .services.debugger import PythonDebugger
 from pathlib import Path
 import uuid
+import hashlib
+import mimetypes
 import logging
 import json
+import re
 import subprocess
 import docker
 import time
@@ -135,18 +152,17 @@ def editor_view(request):
             )
             if not created:
                 user_session.last_activity = timezone.now()
+                user_session.is_active = True
                 user_session.save()
 
-            active_users = UserSession.objects.filter(
-                room=room,
-                last_activity__gte=timezone.now() - timezone.timedelta(minutes=5)
-            )
+            active_users = get_presence_store().members(room.room_id)
+            latest = CodeSession.objects.filter(room=room).select_related('blob').order_by("-created_at").first()
 
             context = {
                 "room_id": room_id,
-                "connected_users": active_users.count(),
+                "connected_users": len(active_users),
                 "active_users": active_users,
-                "latest_code": CodeSession.objects.filter(room=room).order_by("-created_at").first().code_content if CodeSession.objects.filter(room=room).exists() else "",
+                "latest_code": latest.code_content if latest else "",
             }
 
             return render(request, "editor/editor.html", context)
@@ -184,6 +200,10 @@ def delete_room(request, room_id):
         try:
             room = get_object_or_404(CodeRoom, room_id=room_id, created_by=request.user)
             room.delete()
+            drop_symbol_index(room_id)
+            drop_search_index(room_id)
+            drop_room_diagnostics(room_id)
+            ProjectFileManager.remove_project(room_id)
             messages.success(request, "Room deleted successfully!")
         except Exception as e:
             logger.error(f'Error deleting room: {str(e)}')
@@ -264,16 +284,9 @@ def update_user_count(request):
                 'message': 'Room ID is required'
             }, status=400)
 
-        room = get_object_or_404(CodeRoom, room_id=room_id)
-        
-        active_users = UserSession.objects.filter(
-            room=room,
-            last_activity__gte=timezone.now() - timezone.timedelta(minutes=5)
-        ).count()
-
         return JsonResponse({
             'status': 'success',
-            'user_count': active_users
+            'user_count': get_presence_store().count(room_id)
         })
     except Exception as e:
         logger.error(f'Error updating user count: {str(e)}')
@@ -285,8 +298,7 @@ def update_user_count(request):
 def cleanup_inactive_sessions():
     """Clean up inactive user sessions"""
     try:
-        timeout = timezone.now() - timezone.timedelta(minutes=30)
-        UserSession.objects.filter(last_activity__lt=timeout).delete()
+        get_sweeper().sweep_all(only=['user_sessions'])
     except Exception as e:
         logger.error(f'Error cleaning up sessions: {str(e)}')
 
@@ -294,6 +306,7 @@ def cleanup_inactive_sessions():
 @require_http_methods(["POST"])
 def execute_code(request):
     """Execute code in a safe environment"""
+    submitted = time.perf_counter()
     try:
         # ✅ FIX: Parse JSON request body instead of using request.POST
         data = json.loads(request.body)  
@@ -307,13 +320,12 @@ def execute_code(request):
                 "message": "Missing required fields"
             }, status=400)
 
-        room = get_object_or_404(CodeRoom, room_id=room_id)
-        user_session = get_object_or_404(UserSession, user=request.user, room=room)
+        if not UserSession.objects.filter(user=request.user, room__room_id=room_id).exists():
+            return JsonResponse({"status": "error", "message": "Room not found"}, status=404)
 
-        user_session.last_activity = timezone.now()
-        user_session.save()
+        get_activity_writer().record(room_id, request.user.id)
 
-        output = execute_code_safely(code, language)
+        output = execute_code_safely(code, language, submitted)
 
         return JsonResponse({
             "status": "success",
@@ -327,8 +339,10 @@ def execute_code(request):
         logger.error(f"Error executing code: {str(e)}")
         return JsonResponse({"status": "error", "message": str(e)}, status=500)
 
-def execute_code_safely(code, language):
+def execute_code_safely(code, language, submitted=None):
     """Execute code in a Docker container with enhanced safety and features"""
+    if submitted is None:
+        submitted = time.perf_counter()
     try:
         client = docker.from_env()
         
@@ -372,7 +386,10 @@ def execute_code_safely(code, language):
         start_time = time.time()
         
         # Create container with proper configuration
-        container = client.containers.run(
+        container = run_container(
+            client,
+            language,
+            submitted,
             image=config['image'],
             command=config['command'],
             remove=True,
@@ -419,19 +436,23 @@ def update_user_activity(request):
     """Update user's last activity timestamp"""
     try:
         room_id = request.POST.get('room_id')
-        room = get_object_or_404(CodeRoom, room_id=room_id)
-        user_session = get_object_or_404(UserSession, user=request.user, room=room)
-        user_session.last_activity = timezone.now()
-        user_session.save()
-        
-        active_users = UserSession.objects.filter(
-            room=room,
-            last_activity__gte=timezone.now() - timezone.timedelta(minutes=5)
-        ).count()
-        
+        if not room_id:
+            return JsonResponse({
+                'status': 'error',
+                'message': 'Room ID is required'
+            }, status=400)
+
+        # Only members of an existing room may keep presence there
+        if not UserSession.objects.filter(user=request.user, room__room_id=room_id).exists():
+            return JsonResponse({'status': 'error', 'message': 'Room not found'}, status=404)
+
+        presence = get_presence_store()
+        presence.heartbeat(room_id, request.user.id, request.user.username)
+        get_activity_writer().record(room_id, request.user.id)
+
         return JsonResponse({
             'status': 'success',
-            'active_users': active_users
+            'active_users': presence.count(room_id)
         })
     except Exception as e:
         logger.error(f'Error updating user activity: {str(e)}')
@@ -456,7 +477,7 @@ def create_file(request):
             }, status=400)
 
         # Create file manager instance
-        file_manager = ProjectFileManager(room_id)
+        file_manager = ProjectFileManager(room_id, user=request.user)
         
         # Create the file
         file_path = file_manager.create_file(filename, content)
@@ -479,10 +500,68 @@ def create_file(request):
             'message': str(e)
         }, status=400)
 
+def synced_file_manager(request, filenames=None):
+    """Returns the request's ProjectFileManager, synced with disk once per request.
+
+    The conditional GET validators are read from FileEntry, so edits made
+    on disk have to be imported before they are computed.
+    """
+    if not hasattr(request, '_file_manager'):
+        file_manager = ProjectFileManager(request.GET.get('room_id'), user=request.user)
+        file_manager.sync(filenames)
+        request._file_manager = file_manager
+    return request._file_manager
+
+
+def sync_for_validators(request, filenames=None):
+    """Syncs the requested files before their validators are read; the view reports bad rooms."""
+    try:
+        synced_file_manager(request, filenames)
+    except (ValueError, CodeRoom.DoesNotExist):
+        pass
+    except Exception as e:
+        # The view syncs again and reports the failure
+        logger.error(f'Error syncing files before conditional GET: {str(e)}')
+
+
+def file_list_state(request):
+    """Returns (etag, last_modified) for a room's file list, computed once per request."""
+    if not hasattr(request, '_file_list_state'):
+        sync_for_validators(request)
+        rows = sorted(FileEntry.objects.filter(
+            room__room_id=request.GET.get('room_id')
+        ).values_list('filename', 'blob__hash', 'updated_at'))
+        if rows:
+            digest = hashlib.sha256(request.GET.get('since', '').encode())
+            for filename, blob_hash, updated_at in rows:
+                digest.update(f'{filename}\0{blob_hash}\0{updated_at.isoformat()}\n'.encode())
+            request._file_list_state = (f'"{digest.hexdigest()}"', max(row[2] for row in rows))
+        else:
+            request._file_list_state = (None, None)
+    return request._file_list_state
+
+
+def file_read_state(request):
+    """Returns (etag, last_modified) for a single file: its content hash and updated_at."""
+    if not hasattr(request, '_file_read_state'):
+        if request.GET.get('filename'):
+            sync_for_validators(request, [request.GET['filename']])
+        state = FileEntry.objects.filter(
+            room__room_id=request.GET.get('room_id'),
+            filename=request.GET.get('filename')
+        ).values_list('blob__hash', 'updated_at').first()
+        request._file_read_state = (f'"{state[0]}"', state[1]) if state else (None, None)
+    return request._file_read_state
+
+
 @login_required
 @require_http_methods(["GET"])
+@gzip_page
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=lambda request: file_list_state(request)[0],
+           last_modified_func=lambda request: file_list_state(request)[1])
 def list_files(request):
-    """List all files in the project"""
+    """List all files in the project, or only those changed after ?since="""
     try:
         room_id = request.GET.get('room_id')
         
@@ -492,8 +571,26 @@ def list_files(request):
                 'message': 'Room ID is required'
             }, status=400)
 
-        file_manager = ProjectFileManager(room_id)
-        files = file_manager.list_files()
+        since = request.GET.get('since')
+        if since:
+            since = parse_datetime(since.replace(' ', '+'))
+            if since is None or timezone.is_naive(since):
+                return JsonResponse({
+                    'status': 'error',
+                    'message': 'since must be an ISO 8601 timestamp with a timezone'
+                }, status=400)
+
+        file_manager = synced_file_manager(request)
+        files = file_manager.list_files(sync=False)
+
+        if since:
+            # Every current name, so the client can drop files deleted since then
+            return JsonResponse({
+                'status': 'success',
+                'since': since.isoformat(),
+                'files': [entry for entry in files if parse_datetime(entry['modified']) > since],
+                'names': [entry['name'] for entry in files]
+            })
         
         return JsonResponse({
             'status': 'success',
@@ -515,13 +612,13 @@ def save_file(request):
         filename = data.get('filename')
         content = data.get('content')
         
-        if not all([room_id, filename, content]):
+        if not all([room_id, filename]) or content is None:
             return JsonResponse({
                 'status': 'error',
                 'message': 'Missing required fields'
             }, status=400)
 
-        file_manager = ProjectFileManager(room_id)
+        file_manager = ProjectFileManager(room_id, user=request.user)
         file_manager.update_file(filename, content)
         
         return JsonResponse({
@@ -535,7 +632,7 @@ def save_file(request):
         }, status=400)
 
 @login_required
-@require_http_methods(["POST"])
+@require_http_methods(["POST", "DELETE"])
 def delete_file(request):
     """Delete a file from the project"""
     try:
@@ -549,7 +646,7 @@ def delete_file(request):
                 'message': 'Missing required fields'
             }, status=400)
 
-        file_manager = ProjectFileManager(room_id)
+        file_manager = ProjectFileManager(room_id, user=request.user)
         file_manager.delete_file(filename)
         
         return JsonResponse({
@@ -564,6 +661,10 @@ def delete_file(request):
 
 @login_required
 @require_http_methods(["GET"])
+@gzip_page
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=lambda request: file_read_state(request)[0],
+           last_modified_func=lambda request: file_read_state(request)[1])
 def read_file(request):
     """Read file content"""
     try:
@@ -576,8 +677,8 @@ def read_file(request):
                 'message': 'Missing required fields'
             }, status=400)
 
-        file_manager = ProjectFileManager(room_id)
-        content = file_manager.read_file(filename)
+        file_manager = synced_file_manager(request, [filename])
+        content = file_manager.read_file(filename, sync=False)
         
         return JsonResponse({
             'status': 'success',
@@ -595,3 +696,245 @@ def read_file(request):
             'message': str(e)
         }, status=400)
 
+def parse_byte_range(header, size):
+    """Parses a single-range "bytes=" header into (start, end) inclusive.
+
+    Returns None when there is no usable Range header (serve the whole
+    file) and raises ValueError for a range that cannot be satisfied.
+    """
+    if not header or not header.startswith('bytes=') or ',' in header:
+        return None
+    first, _, last = header[len('bytes='):].strip().partition('-')
+    try:
+        if first:
+            start = int(first)
+            end = int(last) if last else size - 1
+        else:
+            # Suffix range: the last N bytes
+            start, end = max(size - int(last), 0), size - 1
+    except ValueError:
+        return None
+    if start < 0 or start > end or start >= size:
+        raise ValueError(f'Range {header} not satisfiable for {size} bytes')
+    return start, min(end, size - 1)
+
+
+def stream_file_range(path, start, length, chunk_size):
+    with open(path, 'rb') as handle:
+        handle.seek(start)
+        while length > 0:
+            chunk = handle.read(min(chunk_size, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+@login_required
+@require_http_methods(["GET"])
+@condition(etag_func=lambda request: file_read_state(request)[0],
+           last_modified_func=lambda request: file_read_state(request)[1])
+def download_file(request):
+    """Stream a file's raw bytes, honouring a single Range request"""
+    try:
+        room_id = request.GET.get('room_id')
+        filename = request.GET.get('filename')
+
+        if not all([room_id, filename]):
+            return JsonResponse({
+                'status': 'error',
+                'message': 'Missing required fields'
+            }, status=400)
+
+        file_manager = synced_file_manager(request, [filename])
+        path = file_manager.resolve(filename)
+        if not path.is_file():
+            raise FileNotFoundError(filename)
+        size = path.stat().st_size
+
+        # A Range that no longer matches the client's copy gets the whole file
+        if_range = request.headers.get('If-Range')
+        byte_range = None
+        if not if_range or if_range == file_read_state(request)[0]:
+            try:
+                byte_range = parse_byte_range(request.headers.get('Range'), size)
+            except ValueError:
+                response = HttpResponse(status=416)
+                response['Content-Range'] = f'bytes */{size}'
+                return response
+
+        start, end = byte_range or (0, size - 1)
+        length = end - start + 1 if size else 0
+        response = StreamingHttpResponse(
+            stream_file_range(path, start, length, settings.FILE_DOWNLOAD_CHUNK_SIZE),
+            status=206 if byte_range else 200,
+            content_type=mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        )
+        response['Content-Length'] = str(length)
+        response['Accept-Ranges'] = 'bytes'
+        response['Content-Disposition'] = content_disposition_header(True, Path(filename).name)
+        if byte_range:
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        return response
+    except FileNotFoundError:
+        return JsonResponse({
+            'status': 'error',
+            'message': f'File {filename} not found'
+        }, status=404)
+    except Exception as e:
+        return JsonResponse({
+            'status': 'error',
+            'message': str(e)
+        }, status=400)
+
+def get_fresh_search_index(room):
+    """Returns the room's trigram index, (re)building it if it is missing or stale."""
+    index = get_search_index(room.room_id)
+    if index.built:
+        stored = FileEntry.objects.filter(room=room).aggregate(count=Count('id'), latest=Max('updated_at'))
+        if (stored['count'], stored['latest']) == index.signature():
+            return index
+    index.build(FileEntry.objects.filter(room=room).values_list('filename', 'blob__content', 'updated_at'))
+    return index
+
+@login_required
+@require_http_methods(["GET"])
+def search_files(request):
+    """Search file contents across a room, one page of matches at a time"""
+    try:
+        room_id = request.GET.get('room_id')
+        query = request.GET.get('q', '')
+
+        if not all([room_id, query]):
+            return JsonResponse({
+                'status': 'error',
+                'message': 'Missing required fields'
+            }, status=400)
+
+        room = get_object_or_404(CodeRoom, room_id=room_id)
+        if not UserSession.objects.filter(user=request.user, room=room).exists() and room.created_by != request.user:
+            return JsonResponse({'status': 'error', 'message': 'Access denied'}, status=403)
+        index = get_fresh_search_index(room)
+
+        # The cursor is "<line>:<filename>" of the last line already returned
+        after = None
+        cursor = request.GET.get('cursor')
+        if cursor:
+            line, _, filename = cursor.partition(':')
+            after = (filename, int(line))
+
+        matches, next_after = index.search(
+            query,
+            regex=request.GET.get('regex') in ('1', 'true'),
+            case_sensitive=request.GET.get('case') in ('1', 'true'),
+            after=after,
+            limit=min(int(request.GET.get('limit', 50)), 500)
+        )
+
+        return JsonResponse({
+            'status': 'success',
+            'matches': matches,
+            'cursor': f'{next_after[1]}:{next_after[0]}' if next_after else None
+        })
+    except re.error as e:
+        return JsonResponse({
+            'status': 'error',
+            'message': f'Invalid regular expression: {str(e)}'
+        }, status=400)
+    except Exception as e:
+        logger.error(f'Error searching files: {str(e)}')
+        return JsonResponse({
+            'status': 'error',
+            'message': str(e)
+        }, status=400)
+
+@login_required
+@require_http_methods(["GET"])
+def export_room(request, room_id):
+    """Stream a zip of the room's files; ?history=1 adds every saved code version"""
+    room = get_object_or_404(CodeRoom, room_id=room_id)
+    if not UserSession.objects.filter(user=request.user, room=room).exists() and room.created_by != request.user:
+        raise PermissionDenied
+
+    include_history = request.GET.get('history') in ('1', 'true')
+    response = StreamingHttpResponse(
+        stream_room_archive(room, include_history=include_history),
+        content_type='application/zip'
+    )
+    response['Content-Disposition'] = content_disposition_header(True, f'{room_id}.zip')
+    return response
+
+@login_required
+@require_http_methods(["POST"])
+def import_room(request, room_id):
+    """Create or overwrite the room's files from an uploaded zip ("archive" field)"""
+    try:
+        room = get_object_or_404(CodeRoom, room_id=room_id)
+        if not UserSession.objects.filter(user=request.user, room=room).exists() and room.created_by != request.user:
+            return JsonResponse({
+                'status': 'error',
+                'message': "You don't have access to this room."
+            }, status=403)
+
+        upload = request.FILES.get('archive')
+        if upload is None:
+            return JsonResponse({
+                'status': 'error',
+                'message': 'Missing archive upload'
+            }, status=400)
+
+        file_manager = ProjectFileManager(room_id, user=request.user)
+        created, updated = import_room_archive(room, upload, request.user, file_manager.resolve)
+
+        drop_symbol_index(room_id)
+        drop_search_index(room_id)
+        drop_room_diagnostics(room_id)
+        file_manager.sync()
+
+        return JsonResponse({
+            'status': 'success',
+            'created': created,
+            'updated': updated
+        })
+    except ArchiveError as e:
+        return JsonResponse({
+            'status': 'error',
+            'message': str(e)
+        }, status=400)
+    except Exception as e:
+        logger.error(f'Error importing room {room_id}: {str(e)}')
+        return JsonResponse({
+            'status': 'error',
+            'message': str(e)
+        }, status=400)
+
+
+@login_required
+@require_http_methods(["POST"])
+def room_spectators(request, room_id):
+    """Let anyone watch the room read-only ("enabled" = 1) or stop new spectators ("enabled" = 0); creator only"""
+    room = get_object_or_404(CodeRoom, room_id=room_id)
+    if room.created_by != request.user:
+        return JsonResponse({
+            'status': 'error',
+            'message': 'Only the room creator can change who may spectate.'
+        }, status=403)
+
+    room.allow_spectators = request.POST.get('enabled') in ('1', 'true')
+    room.save(update_fields=['allow_spectators'])
+    return JsonResponse({
+        'status': 'success',
+        'allow_spectators': room.allow_spectators
+    })
+
+
+def prometheus_metrics(request):
+    """Serves this process's metrics in the Prometheus text format."""
+    token = settings.METRICS_TOKEN
+    if token:
+        allowed = request.headers.get('Authorization') == f'Bearer {token}'
+    else:
+        allowed = request.user.is_authenticated and request.user.is_staff
+    if not allowed:
+        return HttpResponse(status=403)
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
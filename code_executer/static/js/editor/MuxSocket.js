@@ -0,0 +1,219 @@
+// One WebSocket per tab carrying the editor, chat, LSP and presence streams
+// (server side: editor/consumers/multiplex.py). If the server does not pick
+// the editor.mux.v1 subprotocol the same streams run over plain JSON
+// messages, routed by type.
+const MUX_SUBPROTOCOL = 'editor.mux.v1';
+
+// Message types the server sends on each stream kind, for plain connections
+const MUX_STREAM_OF_TYPE = {
+    initial_state: 'editor', room_state: 'editor', code_update: 'editor', file_update: 'editor',
+    chat_history: 'chat', chat_message: 'chat',
+    definition: 'lsp', workspace_symbols: 'lsp', diagnostics: 'lsp',
+    presence_state: 'presence', user_joined: 'presence', user_left: 'presence',
+    user_idle: 'presence', user_active: 'presence'
+};
+
+class MuxSocket {
+    constructor(roomId, window = 256) {
+        this.roomId = roomId;
+        this.window = window;
+        this.socket = null;
+        this.streams = new Map();
+        this.nextStreamId = 1;
+        this.multiplexed = false;
+        this.reconnectAttempts = 0;
+        this.stopped = false;
+        // Called with (connected, event); messages for no open stream go to onControl
+        this.onStatus = null;
+        this.onControl = null;
+    }
+
+    connect() {
+        const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
+        const url = `${protocol}//${window.location.host}/ws/editor/${this.roomId}/`;
+
+        this.stopped = false;
+        this.socket = new WebSocket(url, MUX_SUBPROTOCOL);
+        this.socket.onopen = this.handleOpen.bind(this);
+        this.socket.onmessage = this.handleMessage.bind(this);
+        this.socket.onclose = this.handleClose.bind(this);
+        this.socket.onerror = (error) => console.error('WebSocket error:', error);
+    }
+
+    disconnect() {
+        this.stopped = true;
+        if (this.socket) {
+            this.socket.close();
+        }
+    }
+
+    isOpen() {
+        return this.socket !== null && this.socket.readyState === WebSocket.OPEN;
+    }
+
+    // kind is 'editor', 'chat', 'lsp' or 'presence'; onMessage gets each payload
+    open(kind, onMessage) {
+        const stream = {
+            id: this.nextStreamId++,
+            kind: kind,
+            onMessage: onMessage,
+            credit: 0,      // frames we may still send
+            consumed: 0,    // frames received since we last returned credit
+            queue: []
+        };
+        this.streams.set(stream.id, stream);
+        if (this.isOpen() && this.multiplexed) {
+            this.sendOpen(stream);
+        }
+        return {
+            send: (payload) => this.send(stream, payload),
+            close: () => this.close(stream)
+        };
+    }
+
+    sendOpen(stream) {
+        this.socket.send(JSON.stringify({
+            stream: stream.id,
+            op: 'open',
+            kind: stream.kind,
+            window: this.window
+        }));
+    }
+
+    canSend(stream) {
+        return this.isOpen() && (!this.multiplexed || stream.credit > 0);
+    }
+
+    send(stream, payload) {
+        if (stream.queue.length || !this.canSend(stream)) {
+            // Held until the socket is open and, when multiplexed, there is credit
+            stream.queue.push(payload);
+            this.flush(stream);
+            return;
+        }
+        this.write(stream, payload);
+    }
+
+    write(stream, payload) {
+        if (this.multiplexed) {
+            stream.credit--;
+            this.socket.send(JSON.stringify({stream: stream.id, op: 'data', payload: payload}));
+        } else {
+            this.socket.send(JSON.stringify(payload));
+        }
+    }
+
+    close(stream) {
+        this.streams.delete(stream.id);
+        if (this.isOpen() && this.multiplexed) {
+            this.socket.send(JSON.stringify({stream: stream.id, op: 'close'}));
+        }
+    }
+
+    flush(stream) {
+        while (stream.queue.length && this.canSend(stream)) {
+            this.write(stream, stream.queue.shift());
+        }
+    }
+
+    handleOpen() {
+        this.multiplexed = this.socket.protocol === MUX_SUBPROTOCOL;
+        this.reconnectAttempts = 0;
+        if (!this.multiplexed) {
+            console.warn('Server refused the multiplexed protocol; using plain messages');
+        }
+        if (this.onStatus) {
+            this.onStatus(true);
+        }
+        this.streams.forEach((stream) => {
+            if (this.multiplexed) {
+                this.sendOpen(stream);
+            } else {
+                this.flush(stream);
+            }
+        });
+    }
+
+    handleMessage(event) {
+        let frame;
+        try {
+            frame = JSON.parse(event.data);
+        } catch (error) {
+            console.error('JSON Parse Error:', error);
+            return;
+        }
+        if (!this.multiplexed) {
+            this.handlePlainMessage(frame);
+            return;
+        }
+
+        const stream = this.streams.get(frame.stream);
+        if (frame.stream === 0) {
+            if (frame.op === 'data' && this.onControl) {
+                this.onControl(frame.payload);
+            } else {
+                console.error('Editor connection error:', frame.message || frame.payload);
+            }
+            return;
+        }
+        if (!stream) {
+            return;
+        }
+
+        switch (frame.op) {
+            case 'opened':
+                stream.credit = frame.window;
+                this.flush(stream);
+                break;
+            case 'credit':
+                stream.credit += frame.n;
+                this.flush(stream);
+                break;
+            case 'data':
+                stream.onMessage(frame.payload);
+                // Return credit in batches of half the window
+                if (++stream.consumed >= this.window / 2) {
+                    this.socket.send(JSON.stringify({stream: stream.id, op: 'credit', n: stream.consumed}));
+                    stream.consumed = 0;
+                }
+                break;
+            case 'close':
+                console.warn(`Stream ${stream.kind} closed: ${frame.reason}`);
+                // Reopen; the server resends the stream's starting state
+                stream.credit = 0;
+                stream.consumed = 0;
+                this.sendOpen(stream);
+                break;
+        }
+    }
+
+    handlePlainMessage(data) {
+        const kind = MUX_STREAM_OF_TYPE[data.type];
+        for (const stream of this.streams.values()) {
+            if (stream.kind === kind) {
+                stream.onMessage(data);
+                return;
+            }
+        }
+        if (this.onControl) {
+            this.onControl(data);
+        }
+    }
+
+    handleClose(event) {
+        this.streams.forEach((stream) => {
+            stream.credit = 0;
+            stream.consumed = 0;
+        });
+        if (this.onStatus) {
+            this.onStatus(false, event);
+        }
+        if (this.stopped) {
+            return;
+        }
+        // Back off up to 5 seconds between attempts
+        const delay = Math.min(5000, 2 ** this.reconnectAttempts * 1000);
+        this.reconnectAttempts++;
+        setTimeout(() => this.connect(), delay);
+    }
+}